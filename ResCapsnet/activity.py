@@ -0,0 +1,72 @@
+import numpy as np
+
+
+class ActivityDetector(object):
+    """Cheap detector of acoustic activity in logmel feature vectors.
+
+    A frame is considered active if its energy exceeds an adaptive noise
+    floor by `energy_margin` decibels, or if its spectral flux exceeds
+    `flux_threshold` decibels. The noise floor drops immediately to the
+    energy of a quieter frame, but rises only slowly (at a rate set by
+    `floor_rise`), so that it tracks steady background noise rather than
+    sound events.
+
+    The detector is causal and keeps its state between calls to
+    :meth:`process`, so a recording can be processed in one call or as a
+    stream of chunks with the same result.
+
+    Args:
+        energy_margin (float): Margin above the noise floor in decibels.
+        flux_threshold (float): Threshold for the spectral flux, which
+            is the mean positive difference between consecutive frames
+            in decibels.
+        floor_rise (float): Fraction of the difference between the
+            energy and the noise floor that the floor rises per frame.
+
+    Attributes:
+        energy_margin (float): Margin above the noise floor.
+        flux_threshold (float): Threshold for the spectral flux.
+        floor_rise (float): Rate at which the noise floor rises.
+    """
+
+    def __init__(self, energy_margin=6., flux_threshold=3.,
+                 floor_rise=0.001):
+        self.energy_margin = energy_margin
+        self.flux_threshold = flux_threshold
+        self.floor_rise = floor_rise
+
+        self._floor = None
+        self._previous = None
+
+    def process(self, x):
+        """Determine which frames of a sequence are active.
+
+        Args:
+            x (np.ndarray): 2D array of logmel feature vectors in
+                decibels, i.e. before standardization.
+
+        Returns:
+            np.ndarray: Boolean array indicating which frames are active.
+        """
+        if len(x) == 0:
+            return np.zeros(0, dtype=bool)
+
+        # Compute the energy of each frame from its Mel band energies
+        energy = 10 * np.log10(np.mean(10 ** (x / 10), axis=1))
+
+        # Compute the spectral flux relative to the preceding frame
+        previous = x[:1] if self._previous is None else self._previous[None]
+        flux = np.diff(np.concatenate([previous, x]), axis=0)
+        flux = np.mean(np.maximum(flux, 0), axis=1)
+        self._previous = x[-1]
+
+        # Track the noise floor frame by frame
+        floor = energy[0] if self._floor is None else self._floor
+        floors = np.empty(len(energy))
+        for i, value in enumerate(energy):
+            floor = min(value, floor + self.floor_rise * (value - floor))
+            floors[i] = floor
+        self._floor = floor
+
+        return (energy > floors + self.energy_margin) \
+            | (flux > self.flux_threshold)
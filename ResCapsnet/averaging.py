@@ -0,0 +1,66 @@
+import numpy as np
+
+from keras import backend as K
+from keras.layers import BatchNormalization
+
+
+def average_weights(models):
+    """Compute the arithmetic mean of the weights of several models.
+
+    This is the weight-averaging step of stochastic weight averaging
+    (SWA) [1]_. The models must share the same architecture.
+
+    Args:
+        models (list): Keras models to average.
+
+    Returns:
+        list: The averaged weights, in the format expected by
+        ``model.set_weights``.
+
+    References:
+        .. [1] P. Izmailov, D. Podoprikhin, T. Garipov, D. Vetrov, and
+               A. G. Wilson, "Averaging weights leads to wider optima
+               and better generalization," in Conf. Uncertainty in
+               Artificial Intelligence (UAI), Monterey, CA, 2018.
+    """
+    weights = [model.get_weights() for model in models]
+    return [np.mean(values, axis=0) for values in zip(*weights)]
+
+
+def recompute_batch_norm(model, x, batch_size=32):
+    """Recompute the moving statistics of each batch norm layer.
+
+    The moving statistics of a model with averaged weights do not match
+    the distributions of its activations, so they are recomputed using
+    the given input data. The layers are processed in topological order
+    so that each layer's input is computed using the updated statistics
+    of the preceding layers. Dropout is disabled throughout.
+
+    Args:
+        model: Keras model to update in place.
+        x (np.ndarray): Array of input examples.
+        batch_size (int): Number of examples in a mini-batch.
+    """
+    n_steps = int(np.ceil(len(x) / batch_size))
+
+    for layer in model.layers:
+        if not isinstance(layer, BatchNormalization):
+            continue
+
+        func = K.function([model.input, K.learning_phase()], [layer.input])
+
+        # Accumulate first and second moments for each channel
+        count = 0
+        total = total_sq = 0
+        for i in range(n_steps):
+            output = func([x[batch_size*i:batch_size*(i+1)], 0])[0]
+            output = output.reshape((-1, output.shape[-1])).astype(np.float64)
+            count += len(output)
+            total += output.sum(axis=0)
+            total_sq += np.square(output).sum(axis=0)
+
+        mean = total / count
+        variance = np.maximum(total_sq / count - np.square(mean), 0)
+
+        gamma, beta, _, _ = layer.get_weights()
+        layer.set_weights([gamma, beta, mean, variance])
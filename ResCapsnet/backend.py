@@ -0,0 +1,46 @@
+import os
+
+import config as cfg
+
+
+_session = None
+"""tf.Session: The session used by Keras, or ``None`` if not created."""
+
+
+def initialize():
+    """Configure the TensorFlow backend of Keras if not already done.
+
+    TensorFlow is imported and a session is created only when this
+    function is first called, so that tasks that do not use a neural
+    network do not incur the associated overhead. The visible devices
+    and the number of threads are set according to the configuration.
+
+    Returns:
+        tf.Session: The session used by Keras.
+
+    See Also:
+        :mod:`config.backend`
+    """
+    global _session
+
+    if _session is not None:
+        return _session
+
+    # Devices must be selected before TensorFlow initializes them
+    if cfg.visible_devices is not None:
+        os.environ['CUDA_DEVICE_ORDER'] = 'PCI_BUS_ID'
+        os.environ['CUDA_VISIBLE_DEVICES'] = cfg.visible_devices
+
+    import tensorflow as tf
+    import keras.backend as K
+
+    config = tf.ConfigProto(
+        intra_op_parallelism_threads=cfg.intra_op_threads,
+        inter_op_parallelism_threads=cfg.inter_op_threads,
+    )
+    config.gpu_options.allow_growth = True
+
+    _session = tf.Session(config=config)
+    K.set_session(_session)
+
+    return _session
@@ -0,0 +1,164 @@
+import json
+import os.path
+import socket
+import time
+
+import numpy as np
+
+
+def tune_batch_size(predict_fn, x, candidates, memory_limit=None,
+                    n_runs=3):
+    """Find the batch size that gives the highest prediction throughput.
+
+    Each candidate batch size is timed by predicting a batch of that
+    size several times, and the peak resident memory of the process is
+    recorded. Candidates are tried in ascending order. Before a
+    candidate is tried, its peak memory is extrapolated linearly from
+    the memory used before tuning and the peak of the largest candidate
+    tried so far. The search stops at the first candidate whose
+    extrapolated or measured peak exceeds `memory_limit`, since larger
+    batches are expected to use even more memory.
+
+    Args:
+        predict_fn: Function that computes predictions for an array of
+            examples using the given batch size, i.e. with the signature
+            ``predict_fn(x, batch_size)``.
+        x (np.ndarray): Array of input examples. Examples are repeated
+            if there are fewer than the largest candidate.
+        candidates (list): Batch sizes to try.
+        memory_limit (int): Maximum peak resident memory in bytes. If
+            ``None``, memory usage is not limited.
+        n_runs (int): Number of timed predictions per candidate.
+
+    Returns:
+        tuple: The best batch size and a dict mapping each candidate
+        that was tried to its throughput (examples per second) and peak
+        memory usage (bytes).
+    """
+    results = {}
+    baseline = None
+    for batch_size in sorted(candidates):
+        # Avoid running a batch that is expected to exceed the limit
+        if memory_limit is not None and results:
+            largest = max(results)
+            per_example = (results[largest][1] - baseline) / largest
+            if baseline + per_example * batch_size > memory_limit:
+                break
+
+        # The peak is reset to the current memory usage, which gives
+        # the baseline for extrapolation when the first batch is tried
+        _reset_peak_rss()
+        if baseline is None:
+            baseline = peak_rss()
+
+        # Warm up (e.g. for memory allocation)
+        batch = np.resize(x, (batch_size,) + x.shape[1:])
+        predict_fn(batch, batch_size)
+
+        durations = []
+        for _ in range(n_runs):
+            onset = time.time()
+            predict_fn(batch, batch_size)
+            durations.append(time.time() - onset)
+
+        peak = peak_rss()
+        if memory_limit is not None and peak > memory_limit:
+            break
+
+        results[batch_size] = (batch_size / np.median(durations), peak)
+
+    if not results:
+        raise ValueError('No batch size satisfies the memory limit')
+
+    best = max(results, key=lambda batch_size: results[batch_size][0])
+    return best, results
+
+
+def peak_rss():
+    """Return the peak resident memory of this process in bytes.
+
+    On Linux, the peak is reset by :func:`tune_batch_size` before each
+    candidate is tried, where the kernel supports it.
+
+    Returns:
+        int: The peak resident set size in bytes.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cache_key(model, input_shape):
+    """Return a key identifying a model, its input shape and the host.
+
+    The input shape is that of the data being predicted rather than that
+    of the model, as a model that accepts inputs of any length (e.g. one
+    trained on random crops) may be used to predict full clips.
+
+    Args:
+        model: Keras model to identify.
+        input_shape (tuple): Shape of an input example.
+
+    Returns:
+        str: The cache key.
+    """
+    input_shape = 'x'.join(str(n) for n in input_shape)
+    return '%s/%s/%d' % (socket.gethostname(), input_shape,
+                         model.count_params())
+
+
+def lookup(path, model, input_shape, default=32):
+    """Return the cached batch size for a model on this host.
+
+    Args:
+        path (str): Path of the JSON cache file.
+        model: Keras model to look up.
+        input_shape (tuple): Shape of an input example.
+        default (int): Batch size to return if none is cached.
+
+    Returns:
+        int: The cached batch size, or `default`.
+    """
+    if not os.path.exists(path):
+        return default
+
+    with open(path, 'r') as f:
+        return json.load(f).get(cache_key(model, input_shape), default)
+
+
+def store(path, model, input_shape, batch_size):
+    """Cache the batch size for a model on this host.
+
+    Args:
+        path (str): Path of the JSON cache file.
+        model: Keras model that was tuned.
+        input_shape (tuple): Shape of the input examples it was tuned
+            with.
+        batch_size (int): Batch size to cache.
+    """
+    cache = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            cache = json.load(f)
+
+    cache[cache_key(model, input_shape)] = int(batch_size)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+
+
+def _reset_peak_rss():
+    """Reset the peak resident memory of this process, if supported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        pass
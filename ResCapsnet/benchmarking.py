@@ -0,0 +1,223 @@
+from collections import OrderedDict
+import os.path
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+_SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+"""str: Directory containing the source code of this program."""
+
+
+def measure_startup(statements):
+    """Measure the time taken to execute statements in a new process.
+
+    The statements are executed by a fresh Python interpreter, so the
+    measured time includes the time taken to import any modules. This
+    gives the cold start time of an inference engine, for example.
+
+    Args:
+        statements (str): Python statements to execute. The source
+            directory of this program is added to ``sys.path`` first.
+
+    Returns:
+        float: The time taken in seconds.
+    """
+    code = '\n'.join(['import sys, time',
+                      'onset = time.time()',
+                      'sys.path.insert(0, %r)' % _SOURCE_DIR,
+                      statements,
+                      'print(time.time() - onset)',
+                      ])
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def measure_training_step(input_shape, n_classes, batch_size,
+                          checkpoint=False, n_runs=5):
+    """Measure the time and memory taken by a GCCaps training step.
+
+    The model is trained on random data in a new process, so that the
+    peak memory usage of each configuration is measured separately.
+
+    Args:
+        input_shape (tuple): Shape of an input example.
+        n_classes (int): Number of classes for classification.
+        batch_size (int): Number of examples in a mini-batch.
+        checkpoint (bool): Whether to use gradient checkpointing (see
+            :func:`gated_conv.recompute_gradient`).
+        n_runs (int): Number of training steps to time.
+
+    Returns:
+        tuple: The median duration of a step in seconds and the peak
+        resident memory of the process in bytes.
+    """
+    code = '\n'.join([
+        'import sys, time',
+        'sys.path.insert(0, %r)' % _SOURCE_DIR,
+        'import numpy as np',
+        'import batch_tuning',
+        'import capsnet',
+        'model = capsnet.gccaps(input_shape=%r, n_classes=%d, '
+        'checkpoint=%r)' % (tuple(input_shape), n_classes, checkpoint),
+        "model.compile(loss='binary_crossentropy', optimizer='adam')",
+        'x = np.random.randn(*%r).astype(np.float32)'
+        % ((batch_size,) + tuple(input_shape),),
+        'y = np.random.randint(2, size=(%d, %d))' % (batch_size, n_classes),
+        'model.train_on_batch(x, y)',
+        'durations = []',
+        'for _ in range(%d):' % n_runs,
+        '    onset = time.time()',
+        '    model.train_on_batch(x, y)',
+        '    durations.append(time.time() - onset)',
+        'print(np.median(durations), batch_tuning.peak_rss())',
+    ])
+    output = subprocess.check_output([sys.executable, '-c', code])
+    duration, peak = output.decode().strip().splitlines()[-1].split()
+    return float(duration), int(peak)
+
+
+def measure_latency(predict, x, n_runs=50):
+    """Measure the latency of predicting a single example.
+
+    Args:
+        predict: Function that computes predictions for an array of
+            input examples.
+        x (np.ndarray): Array of input examples to select from.
+        n_runs (int): Number of predictions to time.
+
+    Returns:
+        tuple: The median and 99th percentile latencies in seconds.
+    """
+    # Warm up (e.g. for graph initialization)
+    predict(x[:1])
+
+    latencies = []
+    for i in range(n_runs):
+        example = x[i % len(x)][None]
+        onset = time.time()
+        predict(example)
+        latencies.append(time.time() - onset)
+
+    return np.median(latencies), np.percentile(latencies, 99)
+
+
+def measure_throughput(predict, x):
+    """Measure the number of examples predicted per second.
+
+    Args:
+        predict: Function that computes predictions for an array of
+            input examples.
+        x (np.ndarray): Array of input examples.
+
+    Returns:
+        float: The number of examples predicted per second.
+    """
+    # Warm up (e.g. for graph initialization)
+    predict(x[:1])
+
+    onset = time.time()
+    predict(x)
+    return len(x) / (time.time() - onset)
+
+
+def compare_engines(engines, x):
+    """Benchmark the startup time, latency and throughput of engines.
+
+    Args:
+        engines (OrderedDict): Mapping from the name of each inference
+            engine to a tuple of the form *(predict, statements)*, where
+            `predict` is a function that computes predictions for an
+            array of input examples and `statements` is passed to
+            :func:`measure_startup`. If `statements` is ``None``, the
+            startup time is not measured.
+        x (np.ndarray): Array of input examples.
+
+    Returns:
+        OrderedDict: The results for each engine.
+    """
+    results = OrderedDict()
+    for name, (predict, statements) in engines.items():
+        startup = measure_startup(statements) if statements else np.nan
+        latency, latency_p99 = measure_latency(predict, x)
+        results[name] = OrderedDict([
+            ('Startup (s)', startup),
+            ('Latency (ms)', latency * 1000),
+            ('p99 (ms)', latency_p99 * 1000),
+            ('Clips/s', measure_throughput(predict, x)),
+        ])
+
+    return results
+
+
+def count_flops(model):
+    """Count the floating point operations of a forward pass of a model.
+
+    Only the multiply-accumulate operations of convolutional, dense and
+    capsule layers are counted, as two operations each. These dominate
+    the cost of a GCCaps model, so element-wise operations such as
+    activations and gating are ignored. Nested models, such as the
+    members of an ensemble, are included.
+
+    Args:
+        model: Keras model whose input shape is fully specified.
+
+    Returns:
+        int: The number of operations needed to predict one example.
+    """
+    from keras.layers import TimeDistributed
+
+    flops = 0
+    for layer in model.layers:
+        if hasattr(layer, 'layers'):
+            flops += count_flops(layer)
+        elif isinstance(layer, TimeDistributed):
+            # The wrapped layer is applied to each time step
+            n_steps = layer.input_shape[1]
+            step_shape = layer.input_shape[:1] + layer.input_shape[2:]
+            flops += n_steps * _layer_flops(layer.layer, step_shape)
+        else:
+            flops += _layer_flops(layer, layer.input_shape)
+
+    return flops
+
+
+def _layer_flops(layer, input_shape):
+    """Count the floating point operations of a layer for one example.
+
+    Args:
+        layer: Keras layer (see :func:`count_flops`).
+        input_shape (tuple): Shape of the input of the layer.
+
+    Returns:
+        int: The number of operations, or 0 for other types of layers.
+    """
+    from keras.layers import Conv2D
+    from keras.layers import Dense
+    from keras.layers import SeparableConv2D
+
+    from capsules import CapsuleLayer
+
+    if isinstance(layer, (Conv2D, SeparableConv2D)):
+        output_shape = layer.compute_output_shape(input_shape)
+        n_positions = output_shape[1] * output_shape[2]
+        kernel_size = int(np.prod(layer.kernel_size))
+        n_channels = input_shape[-1]
+        if isinstance(layer, SeparableConv2D):
+            n_channels *= layer.depth_multiplier
+            macs = n_channels * (kernel_size + layer.filters)
+        else:
+            macs = kernel_size * n_channels * layer.filters
+        return 2 * n_positions * macs
+    if isinstance(layer, Dense):
+        return 2 * int(np.prod(input_shape[1:])) * layer.units
+    if isinstance(layer, CapsuleLayer):
+        # Computing the prediction vectors, followed by the weighted sum
+        # and agreement of each routing iteration
+        _, n_inputs, dim_input = input_shape
+        n_outputs = n_inputs * layer.n_capsules * layer.dim_capsule
+        return 2 * n_outputs * (dim_input + 2 * layer.routings)
+
+    return 0
@@ -1,6 +1,7 @@
 import numpy as np
 
 from keras import backend as K
+from keras.layers import Average
 from keras.layers import Dense
 from keras.layers import Dropout
 from keras.layers import Input
@@ -10,47 +11,291 @@ from keras.layers import TimeDistributed
 from keras.layers import BatchNormalization,Bidirectional,GRU,Concatenate,multiply
 from keras.models import Model
 
+import backend
 import capsules
 from capsules import CapsuleLayer
 
 import gated_conv
 
 
-def gccaps(input_shape, n_classes):
+def gccaps(input_shape, n_classes, folded=False, multi_output=False,
+           n_primary_channels=16, dim_capsule=8, routings=3,
+           checkpoint=False, n_filters=64, separable=False):
     """Create a model using the *GCCaps* architecture.
 
+    The architecture consists of a trunk of gated convolutions (see
+    :func:`gccaps_trunk`) followed by a capsule head (see
+    :func:`gccaps_head`).
+
     Args:
-        input_shape (tuple): Shape of the input tensor.
+        input_shape (tuple): Shape of the input tensor. The number of
+            frames may be ``None``, in which case the model accepts
+            inputs of any length, e.g. for training on short crops and
+            evaluating on full clips.
         n_classes (int): Number of classes for classification.
+        folded (bool): Whether to create the inference variant of the
+            architecture, in which batch normalization is folded into
+            neighbouring layers and dropout is omitted.
+        multi_output (bool): Whether the model should output the
+            frame-level (localization) predictions in addition to the
+            audio tagging predictions.
+        n_primary_channels (int): Number of primary capsule channels.
+        dim_capsule (int): Number of activation units per capsule of
+            the capsule layer.
+        routings (int): Number of routing iterations.
+        checkpoint (bool): Whether to recompute the activations of the
+            trunk during the backward pass instead of storing them (see
+            :func:`gated_conv.recompute_gradient`).
+        n_filters (int): Number of filters of each gated convolution.
+        separable (bool): Whether the gated convolutions are depthwise
+            separable (see :class:`gated_conv.SeparableGatedConv`).
 
     Returns:
         A Keras model of the GCCaps architecture.
+
+    See Also:
+        :func:`folding.fold_batch_norm`
     """
+    # Ensure the backend is configured before any model is created
+    backend.initialize()
+
     input_tensor = Input(shape=input_shape, name='input_tensor')
+    x = gccaps_trunk(input_tensor, folded, checkpoint, n_filters, separable)
+    x, caps = gccaps_head(x, n_classes, folded, n_primary_channels,
+                          dim_capsule, routings)
+
+    if multi_output:
+        return Model(input_tensor, [x, caps], name='GCCaps')
+    return Model(input_tensor, x, name='GCCaps')
+
 
-    x = Reshape(input_shape + (1,))(input_tensor)
+def gccaps_trunk(input_tensor, folded=False, checkpoint=False,
+                 n_filters=64, separable=False):
+    """Apply the convolutional trunk of the *GCCaps* architecture.
+
+    Args:
+        input_tensor: Keras tensor of logmel feature vectors.
+        folded (bool): Whether to create the inference variant.
+        checkpoint (bool): Whether to recompute the activations of each
+            block during the backward pass.
+        n_filters (int): Number of filters of each gated convolution.
+        separable (bool): Whether the gated convolutions are depthwise
+            separable.
+
+    Returns:
+        A Keras tensor with the dimensions (time, frequency, channels).
+    """
+    # The number of frames may be unknown (see :func:`gccaps`)
+    n_mels = int(input_tensor.shape[-1])
+    x = Reshape((-1, n_mels, 1))(input_tensor)
 
     # Apply three CRAM blocks of gated convolution with an attention layer
-    x = gated_conv.block(x, n_filters=64, pool_size=(2, 2))
-    x = gated_conv.block(x, n_filters=64, pool_size=(2, 2))
-    x = gated_conv.block(x, n_filters=64, pool_size=(2, 2))
+    x = gated_conv.block(x, n_filters=n_filters, pool_size=(2, 2),
+                         folded=folded, checkpoint=checkpoint,
+                         separable=separable)
+    x = gated_conv.block(x, n_filters=n_filters, pool_size=(2, 2),
+                         folded=folded, checkpoint=checkpoint,
+                         separable=separable)
+    x = gated_conv.block(x, n_filters=n_filters, pool_size=(2, 2),
+                         folded=folded, checkpoint=checkpoint,
+                         separable=separable)
     #x = gated_conv.block(x, n_filters=64, pool_size=(2, 2))
     #x = gated_conv.block(x, n_filters=64, pool_size=(2, 2))
-    n_steps = int(x.shape[1])  # Number of time slices
+    return x
+
+
+def gccaps_head(x, n_classes, folded=False, n_primary_channels=16,
+                dim_capsule=8, routings=3):
+    """Apply the capsule head of the *GCCaps* architecture.
+
+    Args:
+        x: Keras tensor output by :func:`gccaps_trunk`.
+        n_classes (int): Number of classes for classification.
+        folded (bool): Whether to create the inference variant.
+        n_primary_channels (int): Number of primary capsule channels.
+        dim_capsule (int): Number of activation units per capsule of
+            the capsule layer.
+        routings (int): Number of routing iterations.
+
+    Returns:
+        tuple: Keras tensors of the audio tagging predictions and the
+        frame-level (localization) predictions.
+    """
+    # Number of primary capsules per time slice
+    n_capsules = (int(x.shape[2]) + 1) // 2 * n_primary_channels
 
     # Apply primary capsule layer with batch norm 
-    x = capsules.primary_capsules(x, n_channels=16, dim_capsule=4,
-                                  kernel_size=3, strides=(1, 2),
-                                  padding='same', activation='relu',
+    x = capsules.primary_capsules(x, n_channels=n_primary_channels,
+                                  dim_capsule=4, kernel_size=3,
+                                  strides=(1, 2), padding='same',
+                                  activation='relu',
                                   name='primary_capsule_conv')
-    x = Reshape((n_steps, -1, 4))(x)
-    x = BatchNormalization(axis=-1)(x)
+    x = Reshape((-1, n_capsules, 4))(x)
+    if not folded:
+        x = BatchNormalization(axis=-1)(x)
 
     # Apply capsule layer layer to each time slice
     caps = TimeDistributed(CapsuleLayer(n_capsules=n_classes,
-                                        dim_capsule=8, routings=3))(x)
-               
-    return Model(input_tensor, x, name='GCCaps')
+                                        dim_capsule=dim_capsule,
+                                        routings=routings,
+                                        use_prediction_bias=folded),
+                           name='capsule_layer')(x)
+    # Use the capsule lengths as the frame-level predictions
+    caps = Lambda(capsules.length, name='localization_layer')(caps)
+
+    # Compute attention weights for each time slice
+    x = Reshape((-1, n_capsules * 4))(x)
+    if not folded:
+        x = Dropout(0.5)(x)
+    att = TimeDistributed(Dense(n_classes, activation='sigmoid'),
+                          name='attention_layer')(x)
+
+    # Merge the frame-level predictions using the attention weights
+    x = Lambda(_merge, name='output')([caps, att])
+
+    return x, caps
+
+
+def gccaps_head_model(input_shape, n_classes, **head):
+    """Create a model of only the capsule head of *GCCaps*.
+
+    The model takes the outputs of the trunk as its input, so that the
+    head can be trained from precomputed trunk outputs.
+
+    Args:
+        input_shape (tuple): Shape of the trunk output tensor.
+        n_classes (int): Number of classes for classification.
+        head: Keyword arguments passed to :func:`gccaps_head`.
+
+    Returns:
+        A Keras model of the capsule head.
+    """
+    backend.initialize()
+
+    input_tensor = Input(shape=input_shape, name='input_tensor')
+    x, _ = gccaps_head(input_tensor, n_classes, **head)
+    return Model(input_tensor, x, name='GCCapsHead')
+
+
+def head_layers(model):
+    """Return the layers with weights that belong to the capsule head.
+
+    Args:
+        model: Keras model of GCCaps architecture, or of its head only.
+
+    Returns:
+        list: The layers in the order they are applied.
+    """
+    layers = [layer for layer in model.layers if layer.weights]
+    names = [layer.name for layer in layers]
+    return layers[names.index('primary_capsule_conv'):]
+
+
+def head_config(model):
+    """Return the capsule head settings of a GCCaps model.
+
+    Args:
+        model: Keras model of GCCaps architecture.
+
+    Returns:
+        dict: The keyword arguments of :func:`gccaps_head` (other than
+        `n_classes` and `folded`) used to create the model.
+    """
+    conv = model.get_layer('primary_capsule_conv')
+    capsule_layer = model.get_layer('capsule_layer').layer
+    return {'n_primary_channels': conv.filters // 4,
+            'dim_capsule': capsule_layer.dim_capsule,
+            'routings': capsule_layer.routings,
+            }
+
+
+def trunk_config(model):
+    """Return the convolutional trunk settings of a GCCaps model.
+
+    Args:
+        model: Keras model of GCCaps architecture.
+
+    Returns:
+        dict: The keyword arguments of :func:`gccaps_trunk` (other than
+        `folded` and `checkpoint`) used to create the model.
+    """
+    convs = [layer for layer in model.layers
+             if isinstance(layer, gated_conv.GATED_CONVS)]
+    return {'n_filters': convs[0].n_filters,
+            'separable': isinstance(convs[0], gated_conv.SeparableGatedConv),
+            }
+
+
+def multi_output(model):
+    """Return a GCCaps model that outputs both types of predictions.
+
+    The returned model shares its layers (and hence its weights) with
+    the given model, but has the localization layer as a second output
+    so that the audio tagging and SED predictions can be computed in a
+    single forward pass. If the given model already has both outputs,
+    it is returned as is.
+
+    The returned model is created once per model and cached, so that
+    its graph and predict function are reused by later calls.
+
+    Args:
+        model: Keras model of GCCaps architecture.
+
+    Returns:
+        A Keras model with the audio tagging predictions as the first
+        output and the localization predictions as the second output.
+    """
+    if len(model.outputs) > 1:
+        return model
+
+    view = getattr(model, '_multi_output_view', None)
+    if view is None:
+        localization = model.get_layer('localization_layer').output
+        view = Model(model.input, [model.output, localization],
+                     name=model.name)
+        model._multi_output_view = view
+    return view
+
+
+def gccaps_ensemble(models):
+    """Create a model that averages the outputs of several GCCaps models.
+
+    The members of the ensemble share a single input, so each mini-batch
+    is fed to the graph once, and the members may be evaluated
+    concurrently by the backend. The outputs are averaged within the
+    graph, which means the outputs of the individual members are never
+    stored in full.
+
+    Args:
+        models (list): Keras models of GCCaps architecture.
+
+    Returns:
+        A Keras model with the averaged audio tagging predictions as the
+        first output and the averaged localization predictions as the
+        second output.
+    """
+    if len(models) == 1:
+        return multi_output(models[0])
+
+    input_tensor = Input(shape=models[0].input_shape[1:],
+                         name='input_tensor')
+
+    at_outputs, sed_outputs = [], []
+    for i, model in enumerate(models):
+        # The given models may be shared, e.g. by the model registry,
+        # so each is wrapped in a new model with a unique name. Calling
+        # the wrapper adds a node to it rather than to the shared layers.
+        view = multi_output(model)
+        member = Model(view.inputs, view.outputs, name='member_%d' % i)
+
+        at_output, sed_output = member(input_tensor)
+        at_outputs.append(at_output)
+        sed_outputs.append(sed_output)
+
+    at_output = Average(name='output')(at_outputs)
+    sed_output = Average(name='localization_layer')(sed_outputs)
+
+    return Model(input_tensor, [at_output, sed_output], name='GCCapsEnsemble')
 
 
 def gccaps_predict(x, model, batch_size=32):
@@ -65,23 +310,11 @@ def gccaps_predict(x, model, batch_size=32):
         tuple: A tuple containing the audio tagging predictions and
         SED predictions.
     """
+    # Compute both types of predictions using a single forward pass
+    at_preds, sed_preds = multi_output(model).predict(x, batch_size=batch_size)
 
-    # Compute audio tagging predictions
-    at_preds = model.predict(x, batch_size=batch_size)
-
-    # Prepare for sound event detection
-    input_tensor = model.get_layer('input_tensor').input
-    capsule_output = model.get_layer('localization_layer').output
-    func = K.function([input_tensor, K.learning_phase()], [capsule_output])
-
-    # Compute sound event detection predictions
-    n_steps = int(np.ceil(len(x) / batch_size))
-    sed_preds = [func([x[batch_size*i:batch_size*(i+1)]])[0]
-                 for i in range(n_steps)]
     # Transpose so that final dimension is the time axis
-    sed_preds = np.transpose(np.concatenate(sed_preds), (0, 2, 1))
-
-    return at_preds, sed_preds
+    return at_preds, np.transpose(sed_preds, (0, 2, 1))
 
 
 def _merge(inputs):
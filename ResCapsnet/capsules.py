@@ -17,6 +17,9 @@ class CapsuleLayer(Layer):
         dim_capsule (int): Number of units per output capsule.
         routings (int): Number of routing iterations.
         use_bias (bool): Whether to use a bias vector.
+        use_prediction_bias (bool): Whether to add a bias to each
+            prediction vector. This is used to fold a preceding batch
+            normalization layer into the capsule layer.
         kernel_initializer: Initializer for the kernel weights.
         bias_initializer: Initializer for the bias weights.
         kwargs: Other layer keyword arguments.
@@ -26,6 +29,8 @@ class CapsuleLayer(Layer):
         dim_capsule (int): Number of units per output capsule.
         routings (int): Number of routing iterations.
         use_bias (bool): Whether to use a bias vector.
+        use_prediction_bias (bool): Whether to add a bias to each
+            prediction vector.
         kernel_initializer: Initializer for the kernel weights.
         bias_initializer: Initializer for the bias weights.
 
@@ -35,6 +40,7 @@ class CapsuleLayer(Layer):
                (NIPS), Long Beach, CA, 2017, pp. 3859–3869.
     """
     def __init__(self, n_capsules, dim_capsule, routings=3, use_bias=False,
+                 use_prediction_bias=False,
                  kernel_initializer='glorot_uniform', bias_initializer='zeros',
                  **kwargs):
         super(CapsuleLayer, self).__init__(**kwargs)
@@ -43,6 +49,7 @@ class CapsuleLayer(Layer):
         self.dim_capsule = dim_capsule
         self.routings = routings
         self.use_bias = use_bias
+        self.use_prediction_bias = use_prediction_bias
         self.kernel_initializer = initializers.get(kernel_initializer)
         self.bias_initializer = initializers.get(bias_initializer)
 
@@ -61,6 +68,13 @@ class CapsuleLayer(Layer):
             self.bias = self.add_weight(shape=(self.n_capsules,),
                                         initializer=self.bias_initializer,
                                         name='bias')
+        if self.use_prediction_bias:
+            self.prediction_bias = self.add_weight(
+                shape=(self.n_capsules,
+                       self.n_input_capsules,
+                       self.dim_capsule),
+                initializer=self.bias_initializer,
+                name='prediction_bias')
 
         super(CapsuleLayer, self).build(input_shape)
 
@@ -74,6 +88,8 @@ class CapsuleLayer(Layer):
         # Apply linear transformation to compute prediction vectors
         inputs_hat = K.map_fn(lambda x: K.batch_dot(x, self.W, [2, 3]),
                               elems=inputs_tiled)
+        if self.use_prediction_bias:
+            inputs_hat += self.prediction_bias
         # Add bias to prediction vectors if specified
         if self.use_bias:
             inputs_hat = K.bias_add(inputs_hat, self.bias,
@@ -108,6 +124,7 @@ class CapsuleLayer(Layer):
         config['routings'] = self.routings
         config['kernel_initializer'] = self.kernel_initializer
         config['use_bias'] = self.use_bias
+        config['use_prediction_bias'] = self.use_prediction_bias
         return config
 
 
@@ -0,0 +1,465 @@
+import os
+import pickle
+import queue
+import threading
+
+import h5py
+import numpy as np
+
+import keras
+from keras import backend as K
+from keras.callbacks import Callback
+from keras.callbacks import EarlyStopping
+
+
+class CheckpointManager(Callback):
+    """A callback for saving the weights of the top models.
+
+    At the end of each epoch, the weights of the model are copied into
+    memory, which is fast, and written to disk by a background thread,
+    so that training does not wait for disk access. Only the weights
+    are saved, in the same format as ``model.save_weights``, so they can
+    be loaded using ``model.load_weights``.
+
+    Only the `n_best` checkpoints with the best value of `monitor` are
+    kept. Other checkpoints are deleted, or not written at all if they
+    are not among the best when their epoch ends.
+
+    The background thread is available as `writer` during training, so
+    that other file operations can be ordered after those of the
+    checkpoint manager (see :class:`TrainingStateSaver`).
+
+    Args:
+        filepath (str): Format string for the path of a checkpoint. It
+            may contain named formatting options that are filled with
+            the value of `epoch` and the keys in `logs`, as with
+            ``keras.callbacks.ModelCheckpoint``.
+        monitor (str): Quantity used to rank checkpoints.
+        mode (str): Either ``'max'`` or ``'min'``, indicating whether
+            higher or lower values of `monitor` are better.
+        n_best (int): Number of checkpoints to keep.
+
+    Attributes:
+        filepath (str): Format string for the path of a checkpoint.
+        monitor (str): Quantity used to rank checkpoints.
+        mode (str): Either ``'max'`` or ``'min'``.
+        n_best (int): Number of checkpoints to keep.
+        checkpoints (list): The retained checkpoints, from best to
+            worst, where each is a ``(score, epoch, path)`` tuple. The
+            score is negated if `mode` is ``'min'``.
+        writer: The thread that writes and deletes checkpoints, or
+            ``None`` if training is not in progress.
+    """
+    def __init__(self, filepath, monitor='val_f1_score', mode='max',
+                 n_best=5):
+        super(CheckpointManager, self).__init__()
+
+        if mode not in ['max', 'min']:
+            raise ValueError("'mode' must be either 'max' or 'min'")
+
+        self.filepath = filepath
+        self.monitor = monitor
+        self.mode = mode
+        self.n_best = n_best
+        self.checkpoints = []
+        self.writer = None
+
+    def on_train_begin(self, logs=None):
+        """Start the thread that writes checkpoints to disk."""
+        self.writer = _BackgroundWriter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        """Snapshot the weights and queue them if they rank highly."""
+        self.writer.check()
+
+        logs = logs or {}
+        score = logs[self.monitor]
+        if self.mode == 'min':
+            score = -score
+
+        # Skip the checkpoint if it will not be retained
+        if len(self.checkpoints) >= self.n_best \
+                and score <= self.checkpoints[-1][0]:
+            return
+
+        path = self.filepath.format(epoch=epoch + 1, **logs)
+        snapshot = [(layer.name,
+                     [weight.name for weight in layer.weights],
+                     K.batch_get_value(layer.weights))
+                    for layer in self.model.layers]
+        self.writer.submit(_write_weights, path, snapshot)
+
+        self.checkpoints.append((score, epoch + 1, path))
+        self.checkpoints.sort(key=lambda checkpoint: checkpoint[0],
+                              reverse=True)
+        for _, _, path in self.checkpoints[self.n_best:]:
+            self.writer.submit(_remove, path)
+        del self.checkpoints[self.n_best:]
+
+    def on_train_end(self, logs=None):
+        """Wait for all checkpoints to be written."""
+        self.writer.close()
+        self.writer = None
+
+    def reconcile(self):
+        """Make the checkpoint files match the retained checkpoints.
+
+        When a run is interrupted, the files may not match the retained
+        checkpoints of the restored state. A checkpoint may have been
+        written without the training state of its epoch, in which case
+        it would never be deleted and the resumed run could write a
+        second checkpoint for the same epoch. Such files are deleted.
+        Conversely, a retained checkpoint may have been deleted after a
+        better checkpoint was written, and is then no longer retained.
+        """
+        self.checkpoints = [checkpoint for checkpoint in self.checkpoints
+                            if os.path.exists(checkpoint[2])]
+
+        model_dir = os.path.dirname(self.filepath) or '.'
+        prefix = os.path.basename(self.filepath).split('.')[0]
+        retained = {os.path.abspath(path) for _, _, path in self.checkpoints}
+        for _, name in _checkpoint_files(model_dir, prefix):
+            path = os.path.join(model_dir, name)
+            if os.path.abspath(path) not in retained:
+                os.remove(path)
+
+
+class ResumableEarlyStopping(EarlyStopping):
+    """An early stopping callback whose progress can be restored.
+
+    Keras resets the number of epochs without improvement and the best
+    value of the monitored quantity when training begins. This callback
+    instead continues from the state given to :meth:`set_state`, if
+    any, so that a resumed run stops at the same epoch as an
+    uninterrupted run.
+
+    Args:
+        kwargs: Keyword arguments of ``keras.callbacks.EarlyStopping``.
+    """
+    def __init__(self, **kwargs):
+        super(ResumableEarlyStopping, self).__init__(**kwargs)
+
+        self._initial_state = None
+
+    def on_train_begin(self, logs=None):
+        """Reset or restore the state of early stopping."""
+        super(ResumableEarlyStopping, self).on_train_begin(logs)
+
+        if self._initial_state is not None:
+            self.wait = self._initial_state['wait']
+            self.best = self._initial_state['best']
+
+    def get_state(self):
+        """Return the state of early stopping.
+
+        Returns:
+            dict: The number of epochs without improvement and the best
+            value of the monitored quantity.
+        """
+        return {'wait': self.wait, 'best': self.best}
+
+    def set_state(self, state):
+        """Restore a state returned by :meth:`get_state`.
+
+        The state takes effect when training begins.
+
+        Args:
+            state (dict): The state to restore.
+        """
+        self._initial_state = dict(state)
+
+
+class TrainingStateSaver(Callback):
+    """A callback for saving the state needed to resume training.
+
+    At the end of each epoch, the following state is copied into memory
+    and written to a single pickle file by a background thread:
+
+      * The number of completed epochs.
+      * The weights of the model and of the optimizer.
+      * The current learning rate.
+      * The sampling state of the training data generator.
+      * The state of NumPy's global random number generator.
+      * The retained checkpoints of a :class:`CheckpointManager`.
+      * The state of a :class:`ResumableEarlyStopping` callback.
+
+    Restoring the learning rate means that a schedule that depends on
+    the previous learning rate continues from the same position. The
+    state of the generator is only accurate if it runs on the training
+    thread, i.e. if ``fit_generator`` is called with ``workers=0``. The
+    state of early stopping is only up to date if the early stopping
+    callback runs before this one.
+
+    If there is a checkpoint manager, the state is written by its
+    thread, after the checkpoints that the state refers to have been
+    written or deleted. The checkpoint manager must then precede this
+    callback.
+
+    Args:
+        path (str): Path of the output file.
+        generator (BalancedGenerator): Training data generator.
+        checkpoint_manager (CheckpointManager): Checkpoint manager whose
+            state should be saved, if any.
+        early_stopping (ResumableEarlyStopping): Early stopping callback
+            whose state should be saved, if any.
+
+    Attributes:
+        path (str): Path of the output file.
+        generator (BalancedGenerator): Training data generator.
+        checkpoint_manager (CheckpointManager): Checkpoint manager.
+        early_stopping (ResumableEarlyStopping): Early stopping callback.
+
+    See Also:
+        :func:`load_training_state`
+    """
+    def __init__(self, path, generator, checkpoint_manager=None,
+                 early_stopping=None):
+        super(TrainingStateSaver, self).__init__()
+
+        self.path = path
+        self.generator = generator
+        self.checkpoint_manager = checkpoint_manager
+        self.early_stopping = early_stopping
+
+        self._writer = None
+
+    def on_train_begin(self, logs=None):
+        """Start or share the thread that writes the state to disk."""
+        if self.checkpoint_manager is None:
+            self._writer = _BackgroundWriter()
+        elif self.checkpoint_manager.writer is not None:
+            self._writer = self.checkpoint_manager.writer
+        else:
+            raise ValueError('The checkpoint manager must precede the '
+                             'training state saver')
+
+    def on_epoch_end(self, epoch, logs=None):
+        """Snapshot the training state and queue it for writing."""
+        self._writer.check()
+
+        checkpoints = []
+        if self.checkpoint_manager is not None:
+            checkpoints = list(self.checkpoint_manager.checkpoints)
+
+        early_stopping = None
+        if self.early_stopping is not None:
+            early_stopping = self.early_stopping.get_state()
+
+        state = {'epoch': epoch + 1,
+                 'weights': self.model.get_weights(),
+                 'optimizer_weights': self.model.optimizer.get_weights(),
+                 'lr': K.get_value(self.model.optimizer.lr),
+                 'generator': self.generator.get_state(),
+                 'rng': np.random.get_state(),
+                 'checkpoints': checkpoints,
+                 'early_stopping': early_stopping,
+                 }
+        self._writer.submit(_write_pickle, self.path, state)
+
+    def on_train_end(self, logs=None):
+        """Wait for the state to be written."""
+        # A shared thread is closed by the checkpoint manager
+        if self.checkpoint_manager is None:
+            self._writer.close()
+
+
+def load_training_state(path, model, generator, checkpoint_manager=None,
+                        early_stopping=None):
+    """Restore the state saved by a :class:`TrainingStateSaver`.
+
+    The model must have been compiled, as the weights of its optimizer
+    are created here if needed. The checkpoint files are made to match
+    the retained checkpoints of the saved state (see
+    :meth:`CheckpointManager.reconcile`).
+
+    Args:
+        path (str): Path of the saved state.
+        model: Compiled Keras model to restore the weights of.
+        generator (BalancedGenerator): Generator to restore.
+        checkpoint_manager (CheckpointManager): Checkpoint manager to
+            restore, if any.
+        early_stopping (ResumableEarlyStopping): Early stopping callback
+            to restore, if any.
+
+    Returns:
+        int: The number of completed epochs.
+    """
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+
+    model.set_weights(state['weights'])
+
+    # The optimizer weights only exist once the training function has
+    # been created, which Keras otherwise does lazily.
+    model._make_train_function()
+    model.optimizer.set_weights(state['optimizer_weights'])
+    K.set_value(model.optimizer.lr, state['lr'])
+
+    generator.set_state(state['generator'])
+    np.random.set_state(state['rng'])
+    if checkpoint_manager is not None:
+        checkpoint_manager.checkpoints = list(state['checkpoints'])
+        checkpoint_manager.reconcile()
+    if early_stopping is not None and state.get('early_stopping'):
+        early_stopping.set_state(state['early_stopping'])
+
+    return state['epoch']
+
+
+class _BackgroundWriter(object):
+    """Thread that runs file operations in the order they are submitted.
+
+    Errors are reraised on the calling thread by :meth:`check` and
+    :meth:`close`.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        """Queue a call to `func` with the given arguments."""
+        self._queue.put((func, args))
+
+    def check(self):
+        """Reraise the first error raised by a queued call, if any."""
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Wait for all queued calls to complete."""
+        self._queue.put(None)
+        self._thread.join()
+        self.check()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            func, args = item
+            try:
+                func(*args)
+            except Exception as e:
+                self._error = self._error or e
+
+
+def _write_weights(path, snapshot):
+    """Write weights to an HDF5 file in the format used by Keras.
+
+    The file is written to a temporary path first and then renamed, so
+    that an interrupted write does not leave a corrupt checkpoint.
+
+    Args:
+        path (str): Path of the output file.
+        snapshot (list): List of ``(layer_name, weight_names, values)``
+            tuples for each layer of the model, in order.
+    """
+    tmp_path = path + '.tmp'
+    with h5py.File(tmp_path, 'w') as f:
+        f.attrs['layer_names'] = [name.encode('utf8')
+                                  for name, _, _ in snapshot]
+        f.attrs['backend'] = K.backend().encode('utf8')
+        f.attrs['keras_version'] = str(keras.__version__).encode('utf8')
+
+        for layer_name, weight_names, values in snapshot:
+            group = f.create_group(layer_name)
+            group.attrs['weight_names'] = [name.encode('utf8')
+                                           for name in weight_names]
+            for name, value in zip(weight_names, values):
+                dataset = group.create_dataset(name, value.shape,
+                                               dtype=value.dtype)
+                if value.shape:
+                    dataset[:] = value
+                else:
+                    dataset[()] = value
+
+    os.replace(tmp_path, path)
+
+
+def read_weights(path):
+    """Read the weights of a file written by ``model.save_weights``.
+
+    Args:
+        path (str): Path of the weights file.
+
+    Returns:
+        list: The weights of each layer that has any, in order, as a
+        list of ``(layer_name, values)`` tuples.
+    """
+    weights = []
+    with h5py.File(path, 'r') as f:
+        # Full model files store the weights in a subgroup
+        root = f['model_weights'] if 'model_weights' in f else f
+
+        for layer_name in root.attrs['layer_names']:
+            group = root[layer_name]
+            values = [group[name][()] for name in group.attrs['weight_names']]
+            if values:
+                weights.append((layer_name.decode('utf8'), values))
+
+    return weights
+
+
+def _write_pickle(path, obj):
+    """Pickle an object to a file via a temporary file.
+
+    Args:
+        path (str): Path of the output file.
+        obj: Object to pickle.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+
+    os.replace(tmp_path, path)
+
+
+def _remove(path):
+    """Remove a file if it exists.
+
+    Args:
+        path (str): Path of the file.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def retained_epochs(model_dir, prefix='gccaps'):
+    """Return the epoch numbers of the checkpoints in a directory.
+
+    Args:
+        model_dir (str): Directory containing the checkpoints.
+        prefix (str): Prefix of the checkpoint file names, which are
+            of the form ``<prefix>.<epoch>-<...>.hdf5``.
+
+    Returns:
+        list: The sorted epoch numbers.
+    """
+    return sorted(epoch for epoch, _ in _checkpoint_files(model_dir, prefix))
+
+
+def _checkpoint_files(model_dir, prefix='gccaps'):
+    """Return the checkpoint files in a directory and their epochs.
+
+    Args:
+        model_dir (str): Directory containing the checkpoints.
+        prefix (str): Prefix of the checkpoint file names (see
+            :func:`retained_epochs`).
+
+    Returns:
+        list: A ``(epoch, file_name)`` tuple for each checkpoint.
+    """
+    files = []
+    for name in os.listdir(model_dir):
+        if not (name.startswith(prefix + '.') and name.endswith('.hdf5')):
+            continue
+
+        epoch = name[len(prefix) + 1:].split('-')[0]
+        if epoch.isdigit() and '-' in name:
+            files.append((int(epoch), name))
+
+    return files
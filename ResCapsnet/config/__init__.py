@@ -1,6 +1,8 @@
+from .backend import *
 from .logmel import *
 from .paths import *
 from .prediction import *
+from .serving import *
 from .training import *
 
 
@@ -9,3 +11,50 @@ clip_duration = 10
 
 enable_augmentation = False
 """bool: Whether to enable data augmentation."""
+
+
+def override(**values):
+    """Override configuration values, e.g. for one run of a sweep.
+
+    The values are set in the submodule that defines them and in this
+    package. The paths that depend on ``training_id`` are derived again,
+    so it should usually be overridden too.
+
+    A key of the form ``'<name>.<key>'`` overrides a single entry of a
+    dict value, e.g. ``'learning_rate.initial'``.
+
+    Args:
+        values: Mapping from names of configuration values to their new
+            values.
+
+    Raises:
+        KeyError: If a name does not refer to a configuration value.
+    """
+    import importlib
+
+    from . import backend, logmel, paths, prediction, serving, training
+
+    modules = [backend, logmel, paths, prediction, serving, training]
+
+    def _module(name):
+        module = next((m for m in modules if hasattr(m, name)), None)
+        if module is None or name.startswith('_'):
+            raise KeyError('Unknown configuration value: %s' % name)
+        return module
+
+    for name, value in values.items():
+        if '.' in name:
+            name, key = name.split('.', 1)
+            value = dict(getattr(_module(name), name), **{key: value})
+        setattr(_module(name), name, value)
+
+    # Derive the paths again, but keep any that were overridden
+    path_values = {name: getattr(paths, name) for name in values
+                   if '.' not in name and hasattr(paths, name)}
+    importlib.reload(paths)
+    for name, value in path_values.items():
+        setattr(paths, name, value)
+
+    for module in modules:
+        globals().update({name: value for name, value in vars(module).items()
+                          if not name.startswith('_')})
@@ -0,0 +1,18 @@
+visible_devices = None
+"""str: Value to set ``CUDA_VISIBLE_DEVICES`` to, e.g. ``'2'``.
+
+A value of ``None`` leaves the environment unchanged, while an empty
+string hides all GPUs so that only the CPU is used.
+"""
+
+intra_op_threads = 0
+"""int: Number of threads used to parallelize a single operation.
+
+A value of 0 indicates that the number should be chosen automatically.
+"""
+
+inter_op_threads = 0
+"""int: Number of threads used to run independent operations.
+
+A value of 0 indicates that the number should be chosen automatically.
+"""
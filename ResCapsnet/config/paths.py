@@ -22,10 +22,41 @@ log_path = os.path.join(work_path, 'logs', training.training_id)
 history_path = os.path.join(log_path, 'history.csv')
 """str: Path to log file for training history."""
 
+step_timings_path = os.path.join(log_path, 'steps.csv')
+"""str: Path to log file for the timings of each training step."""
+
+timing_summary_path = os.path.join(log_path, 'timing.json')
+"""str: Path to the summary of where training time is spent."""
+
+training_state_path = os.path.join(model_path, 'training_state.p')
+"""str: Path to the file containing the state for resuming training."""
+
+feature_store_path = os.path.join(work_path, 'feature_store')
+"""str: Path to the directory of memory-mapped standardized features."""
+
+sweep_path = os.path.join(work_path, 'sweeps')
+"""str: Path to the output directory of hyperparameter sweeps."""
+
+trunk_cache_path = os.path.join(work_path, 'trunk_outputs')
+"""str: Path to the output directory of cached trunk outputs."""
+
+export_path = os.path.join(work_path, 'export', training.training_id)
+"""str: Path to the output directory of inference-optimized models."""
+
+student_path = os.path.join(work_path, 'students', training.training_id)
+"""str: Path to the output directory of distilled models."""
+
 predictions_path = os.path.join(
     work_path, 'predictions', training.training_id, '{}_{}_predictions.p')
 """str: Path to a model predictions file."""
 
+prediction_store_path = os.path.join(
+    work_path, 'predictions', training.training_id, '{}_predictions.h5')
+"""str: Path to the HDF5 file that chunked predictions are written to."""
+
+batch_size_cache_path = os.path.join(work_path, 'batch_sizes.json')
+"""str: Path to the file containing tuned prediction batch sizes."""
+
 results_path = os.path.join(
     work_path, 'results', training.training_id, '{}_{}_results.csv')
 """str: Path to the file containing results."""
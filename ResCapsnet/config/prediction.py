@@ -5,6 +5,139 @@ Either a list of epoch numbers or a string specifying how to select the
 epochs. The valid string values are ``'val_acc'`` and ``'val_eer'``.
 """
 
+n_warm_models = 5
+"""int: Maximum number of models to keep in memory for prediction.
+
+See Also:
+    :class:`registry.ModelRegistry`
+"""
+
+bn_n_examples = 2000
+"""int: Number of training examples used to recompute batch norm statistics.
+
+This is used when averaging the weights of the models selected by
+`prediction_epochs` into a single model.
+
+See Also:
+    :func:`averaging.recompute_batch_norm`
+"""
+
+calibration_n_examples = 500
+"""int: Number of validation examples used to calibrate quantization.
+
+See Also:
+    :func:`quantization.quantize_model`
+"""
+
+prediction_batch_size = -1
+"""int: Number of examples in a mini-batch when generating predictions.
+
+A value of -1 indicates that the batch size found by the ``tune``
+command should be used, or 32 if the model has not been tuned on this
+machine. This also applies to the validation callbacks used in training.
+
+See Also:
+    :func:`batch_tuning.tune_batch_size`
+"""
+
+tuning_batch_sizes = [8, 16, 32, 64, 128, 256]
+"""list: Candidate batch sizes tried by the ``tune`` command."""
+
+tuning_memory_limit = None
+"""int: Maximum peak resident memory when tuning, in megabytes.
+
+A value of ``None`` indicates that memory usage is not limited.
+"""
+
+predict_chunk_size = 256
+"""int: Number of examples read at a time when predicting in chunks.
+
+See Also:
+    :func:`features.iterate_features`
+"""
+
+predict_read_ahead = 2
+"""int: Number of chunks read ahead of the model when predicting."""
+
+window_hop = 5
+"""number: Duration between consecutive windows in seconds.
+
+Recordings of arbitrary length are split into overlapping windows with
+a duration of `clip_duration`. This value is rounded to the nearest
+multiple of the time resolution of the frame-level predictions.
+
+See Also:
+    :func:`sliding_window.predict`
+"""
+
+window_batch_size = 32
+"""int: Number of windows in a mini-batch when splitting recordings."""
+
+skip_silence = False
+"""bool: Whether to skip windows that contain no acoustic activity.
+
+This applies to recordings of arbitrary length and to streams. The
+predictions of skipped windows are taken to be zero.
+
+See Also:
+    :class:`activity.ActivityDetector`
+"""
+
+activity_energy_margin = 6
+"""number: Margin above the noise floor for activity in decibels.
+
+See Also:
+    :class:`activity.ActivityDetector`
+"""
+
+activity_flux_threshold = 3
+"""number: Spectral flux threshold for activity in decibels.
+
+See Also:
+    :class:`activity.ActivityDetector`
+"""
+
+activity_floor_rise = 0.001
+"""float: Rate at which the noise floor rises per frame.
+
+See Also:
+    :class:`activity.ActivityDetector`
+"""
+
+stream_hop = 1
+"""number: Duration between scored windows when streaming, in seconds.
+
+This value is rounded to the nearest multiple of the time resolution of
+the frame-level predictions.
+
+See Also:
+    :class:`streaming.StreamingDetector`
+"""
+
+stream_latency = 5
+"""number: Maximum delay of streamed onsets and offsets in seconds.
+
+This must be at least `stream_hop`. Larger values give the dilation and
+erosion steps more context, at the cost of responsiveness.
+
+See Also:
+    :class:`streaming.StreamingDetector`
+"""
+
+stream_chunk_duration = 0.1
+"""number: Duration of the audio chunks of a replayed stream in seconds.
+
+See Also:
+    :func:`streaming.replay`
+"""
+
+engine_tolerance = 1e-4
+"""float: Maximum difference allowed between the outputs of engines.
+
+See Also:
+    :mod:`numpy_inference`
+"""
+
 at_threshold = -1
 """number: Number for thresholding audio tagging predictions.
 
@@ -23,6 +156,19 @@ See Also:
     :func:`evaluation.compute_thresholds`
 """
 
+sed_gate_threshold = None
+"""number: Clip-level threshold for post-processing SED predictions.
+
+The SED predictions of a class are only binarized if its audio tagging
+prediction exceeds this value. A value of ``None`` disables gating.
+
+See Also:
+    :func:`inference.cascade_gate`
+"""
+
+cascade_thresholds = [0.05, 0.1, 0.2]
+"""list: Gating thresholds compared by the ``cascade`` command."""
+
 sed_dilation = 10
 """int: Dilation parameter for binarizing predictions.
 
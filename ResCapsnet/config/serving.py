@@ -0,0 +1,31 @@
+server_host = '127.0.0.1'
+"""str: Host name or address that the inference server listens on."""
+
+server_port = 8000
+"""int: Port that the inference server listens on."""
+
+server_max_batch_size = 32
+"""int: Maximum number of requests in a micro-batch.
+
+See Also:
+    :class:`server.MicroBatcher`
+"""
+
+server_max_wait = 0.01
+"""float: Maximum time to wait for a micro-batch to fill up in seconds.
+
+See Also:
+    :class:`server.MicroBatcher`
+"""
+
+loadtest_batch_sizes = [1, 8, 32]
+"""list: Maximum micro-batch sizes compared by the load generator."""
+
+loadtest_max_waits = [0.002, 0.01, 0.05]
+"""list: Maximum wait times compared by the load generator."""
+
+loadtest_n_requests = 500
+"""int: Number of requests sent for each batching configuration."""
+
+loadtest_concurrency = 32
+"""int: Number of requests in flight at once during a load test."""
@@ -13,6 +13,18 @@ n_epochs = 30
 A value of -1 indicates an early stopping condition should be used.
 """
 
+crop_duration = None
+"""float: Duration in seconds of the random crops to train on.
+
+Training examples are cropped to this duration at random positions,
+while validation uses full clips. A value of ``None``, or one that is
+not shorter than ``clip_duration``, indicates that full clips should be
+used for training.
+
+See Also:
+    :func:`training.crop_length`
+"""
+
 learning_rate = {'initial': 0.001,
                  'decay': 0.9,
                  'decay_rate': 2.,
@@ -25,3 +37,141 @@ Keyword Args:
         value of 1 indicates the learning rate should not be decayed.
     decay_rate (float): Number of epochs until learning rate is decayed.
 """
+
+gradient_checkpointing = False
+"""bool: Whether to recompute the activations of the CRAM blocks during
+the backward pass instead of storing them.
+
+This reduces the memory needed to train with larger mini-batches or
+longer inputs, at the cost of recomputing the blocks once per step.
+
+See Also:
+    :func:`gated_conv.recompute_gradient`
+"""
+
+gradient_checkpointing_batch_sizes = [44, 88, 176]
+"""list: Batch sizes to benchmark with and without gradient
+checkpointing.
+"""
+
+capsule_head = {'n_primary_channels': 16,
+                'dim_capsule': 8,
+                'routings': 3,
+                }
+"""dict: Settings of the capsule head of the network.
+
+These are used both for training and for loading trained models, so
+they must match the settings that the models were trained with.
+
+Keyword Args:
+    n_primary_channels (int): Number of primary capsule channels.
+    dim_capsule (int): Number of activation units per capsule of the
+        capsule layer.
+    routings (int): Number of routing iterations.
+
+See Also:
+    :func:`capsnet.gccaps_head`
+"""
+
+n_checkpoints = 5
+"""int: Number of model checkpoints to keep.
+
+See Also:
+    :class:`checkpointing.CheckpointManager`
+"""
+
+checkpoint_monitor = 'val_f1_score'
+"""str: Validation metric used to decide which checkpoints to keep.
+
+This should usually match ``prediction_epochs``, as only the epochs with
+a retained checkpoint can be selected for prediction.
+"""
+
+checkpoint_mode = 'max'
+"""str: Whether higher (``'max'``) or lower (``'min'``) values of
+`checkpoint_monitor` are better.
+"""
+
+validate_sed = False
+"""bool: Whether to compute SED metrics for the validation set.
+
+These are computed from the same predictions as the audio tagging
+metrics, but require strongly-labeled validation metadata.
+
+See Also:
+    :class:`training.ValidationLogger`
+"""
+
+n_workers = 1
+"""int: Number of worker processes used for training.
+
+A value greater than 1 enables data-parallel training on the CPU, in
+which each worker trains on a separate shard of the training set.
+
+See Also:
+    :func:`parallel.train`
+"""
+
+sync_period = 1
+"""int: Number of training steps between averaging the weights of the
+workers when `n_workers` is greater than 1.
+"""
+
+worker_threads = 0
+"""int: Number of TensorFlow threads used by each training worker.
+
+A value of 0 divides the CPU cores evenly between the workers.
+"""
+
+target_monitor = 'val_f1_score'
+"""str: Validation metric used to compare the time-to-accuracy of
+training runs.
+
+See Also:
+    :func:`parallel.time_to_target`
+"""
+
+target_score = 0.5
+"""float: Value of `target_monitor` that a training run must reach."""
+
+sweep_n_parallel = 2
+"""int: Maximum number of training runs of a sweep to run at a time.
+
+See Also:
+    :func:`sweeps.run`
+"""
+
+sweep_threads = 0
+"""int: Number of TensorFlow threads used by each run of a sweep.
+
+A value of 0 divides the CPU cores evenly between concurrent runs.
+"""
+
+model_variants = {
+    'narrow': {'n_filters': 32},
+    'separable': {'separable': True},
+    'compact': {'n_filters': 32,
+                'separable': True,
+                'n_primary_channels': 8,
+                'dim_capsule': 4,
+                },
+}
+"""dict: Compact variants of the network for low-latency deployment.
+
+Each variant is named by its key and specified by keyword arguments of
+:func:`capsnet.gccaps` that override the default architecture. The
+variants are trained by distillation from the prediction ensemble.
+
+See Also:
+    :func:`distillation.train_student`
+"""
+
+distillation_alpha = 0.5
+"""float: Weight of the ground truth, relative to the audio tagging
+predictions of the teacher, in the targets of a distilled model.
+"""
+
+distillation_sed_weight = 1.
+"""float: Weight of the loss between the frame-level predictions of a
+distilled model and those of the teacher.
+"""
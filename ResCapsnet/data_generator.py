@@ -1,54 +1,149 @@
 import numpy as np
 
 
-def balanced_generator(x, y, batch_size=32):
+def balanced_generator(x, y, batch_size=32, subset=None, crop_length=None,
+                       targets=None):
     """Return a generator that creates class-balanced mini-batches.
 
     The generator yields batches in which there is a 'fair'[1]_ number
-    of examples from each class.
+    of examples from each class. Its sampling state can be saved and
+    restored (see :class:`BalancedGenerator`).
 
     Args:
         x (np.ndarray): Array of training examples to select from.
         y (np.ndarray): Target values of the training examples.
         batch_size (int): Number of examples in a mini-batch.
+        subset (np.ndarray): Indexes of the examples to select from. If
+            ``None``, all examples are selected from.
+        crop_length (int): Number of frames of a random crop to take
+            from each example. If ``None``, or if it is not shorter than
+            the examples, examples are not cropped.
+        targets (list): Arrays of target values to yield instead of
+            `y`, e.g. one for each output of a model. The classes are
+            still balanced according to `y`.
 
-    Yields:
-        tuple: Mini-batch of the form *(batch_x, batch_y)*.
+    Returns:
+        BalancedGenerator: Iterator that yields mini-batches of the form
+        *(batch_x, batch_y)*.
 
     References:
         .. [1] Y. Xu, Q. Kong, W. Wang, and M. D. Plumbley, "Large-scale
                weakly supervised audio classification using gated
                convolutional neural network," ArXiv e-prints, 2017.
     """
-    # Create an index list for each class, e.g. indexes[0] is a list
-    # of indexes (locations) for class *0* w.r.t. `y`.
-    n_classes = y.shape[1]
-    indexes = [np.where(y[:, label] == 1)[0]
-               for label in range(n_classes)]
-
-    # Calculate the number of examples per class
-    n_examples = np.sum(y, axis=0).astype(int)
-
-    # Compute the probabilities of an example belonging to a particular
-    # class being sampled for the mini-batch, e.g. class_p[0] is the
-    # probability that an example from class *0* is sampled.
-    class_p = [min(n // 1000 + 1, 5) for n in n_examples]
-    class_p = np.array(class_p) / sum(class_p)
-
-    offsets = [0] * n_classes
-    while True:
-        batch_x = np.empty((batch_size,) + x.shape[1:])
-        batch_y = np.empty((batch_size, n_classes))
-
-        labels = np.random.choice(n_classes, size=(batch_size,), p=class_p)
+    return BalancedGenerator(x, y, batch_size, subset, crop_length, targets)
+
+
+class BalancedGenerator(object):
+    """Iterator that creates class-balanced mini-batches.
+
+    This is the iterator returned by :func:`balanced_generator`. Its
+    sampling state can be saved and restored, so that a training run
+    can be resumed with the same sequence of mini-batches.
+
+    Args:
+        x (np.ndarray): Array of training examples to select from.
+        y (np.ndarray): Target values of the training examples.
+        batch_size (int): Number of examples in a mini-batch.
+        subset (np.ndarray): Indexes of the examples to select from. If
+            ``None``, all examples are selected from.
+        crop_length (int): Number of frames of a random crop to take
+            from each example. If ``None``, or if it is not shorter than
+            the examples, examples are not cropped.
+        targets (list): Arrays of target values to yield instead of
+            `y`. The classes are still balanced according to `y`.
+
+    Attributes:
+        x (np.ndarray): Array of training examples to select from.
+        y (np.ndarray): Target values of the training examples.
+        batch_size (int): Number of examples in a mini-batch.
+        crop_length (int): Number of frames of a random crop.
+        targets (list): Arrays of target values to yield instead of `y`.
+        indexes (list): Shuffled example indexes for each class.
+        offsets (list): Position of the next example in `indexes` for
+            each class.
+    """
+
+    def __init__(self, x, y, batch_size=32, subset=None, crop_length=None,
+                 targets=None):
+        self.x = x
+        self.y = y
+        self.batch_size = batch_size
+        self.crop_length = crop_length
+        self.targets = targets
+
+        if subset is None:
+            subset = np.arange(len(y))
+
+        # Create an index list for each class, e.g. indexes[0] is a list
+        # of indexes (locations) for class *0* w.r.t. `y`.
+        n_classes = y.shape[1]
+        self.indexes = [subset[y[subset, label] == 1]
+                        for label in range(n_classes)]
+
+        # Calculate the number of examples per class
+        self._n_examples = np.array([len(indexes)
+                                     for indexes in self.indexes])
+
+        # Compute the probabilities of an example belonging to a
+        # particular class being sampled for the mini-batch, e.g.
+        # class_p[0] is the probability that an example from class *0*
+        # is sampled. Classes without examples (e.g. in a shard of the
+        # training set) are never sampled.
+        class_p = [min(n // 1000 + 1, 5) if n > 0 else 0
+                   for n in self._n_examples]
+        self._class_p = np.array(class_p) / sum(class_p)
+
+        self.offsets = [0] * n_classes
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        n_classes = self.y.shape[1]
+        n_frames = self.x.shape[1]
+        length = min(self.crop_length or n_frames, n_frames)
+        batch_x = np.empty((self.batch_size, length) + self.x.shape[2:])
+        batch_y = np.empty((self.batch_size, n_classes))
+        batch_indexes = np.empty(self.batch_size, dtype=int)
+
+        labels = np.random.choice(n_classes, size=(self.batch_size,),
+                                  p=self._class_p)
         for i, label in enumerate(labels):
-            idx = indexes[label][offsets[label]]
-            batch_x[i] = x[idx]
-            batch_y[i] = y[idx]
+            idx = self.indexes[label][self.offsets[label]]
+            if length < n_frames:
+                # The weak labels are assumed to apply to the crop
+                onset = np.random.randint(n_frames - length + 1)
+                batch_x[i] = self.x[idx, onset:onset + length]
+            else:
+                batch_x[i] = self.x[idx]
+            batch_y[i] = self.y[idx]
+            batch_indexes[i] = idx
+
+            self.offsets[label] += 1
+            if self.offsets[label] >= self._n_examples[label]:
+                np.random.shuffle(self.indexes[label])
+                self.offsets[label] = 0
+
+        if self.targets is not None:
+            return batch_x, [target[batch_indexes] for target in self.targets]
+        return batch_x, batch_y
+
+    def get_state(self):
+        """Return a copy of the sampling state.
+
+        Returns:
+            dict: The shuffled indexes and offsets of each class.
+        """
+        return {'indexes': [np.copy(indexes) for indexes in self.indexes],
+                'offsets': list(self.offsets),
+                }
 
-            offsets[label] += 1
-            if offsets[label] >= n_examples[label]:
-                np.random.shuffle(indexes[label])
-                offsets[label] = 0
+    def set_state(self, state):
+        """Restore a sampling state returned by :meth:`get_state`.
 
-        yield batch_x, batch_y
+        Args:
+            state (dict): The sampling state to restore.
+        """
+        self.indexes = [np.copy(indexes) for indexes in state['indexes']]
+        self.offsets = list(state['offsets'])
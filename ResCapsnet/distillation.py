@@ -0,0 +1,158 @@
+import glob
+import os
+
+from keras.callbacks import CSVLogger
+from keras.callbacks import EarlyStopping
+from keras.callbacks import LearningRateScheduler
+from keras.optimizers import Adam
+
+import capsnet
+import checkpointing
+import config as cfg
+import data_generator
+import training
+import utils
+
+
+def teacher_targets(teacher, x, batch_size=32):
+    """Compute the predictions of a teacher model for distillation.
+
+    Args:
+        teacher: Keras model of GCCaps architecture, or an ensemble of
+            such models (see :func:`capsnet.gccaps_ensemble`).
+        x (np.ndarray): Array of input examples.
+        batch_size (int): Number of examples in a prediction batch.
+
+    Returns:
+        tuple: The audio tagging predictions and the frame-level
+        predictions, the latter in the format of the localization
+        layer, i.e. with the time axis before the class axis.
+    """
+    return tuple(capsnet.multi_output(teacher).predict(
+        x, batch_size=batch_size))
+
+
+def train_student(tr_x, tr_y, val_x, val_y, teacher_at, teacher_sed,
+                  output_path, architecture, sed_metrics_fn=None):
+    """Train a GCCaps model to mimic the predictions of a teacher.
+
+    The student is trained on both of its outputs. The targets of the
+    audio tagging output are a mixture of the ground truth and the
+    predictions of the teacher, weighted by ``cfg.distillation_alpha``,
+    and the targets of the localization output are the frame-level
+    predictions of the teacher, whose loss is weighted by
+    ``cfg.distillation_sed_weight``. Otherwise, training proceeds as in
+    :func:`training.train`, except that random crops are not used, as
+    the frame-level targets are given for full clips.
+
+    The checkpoints of the best epochs and the training history are
+    saved in `output_path`.
+
+    Args:
+        tr_x (np.ndarray): Array of training examples.
+        tr_y (np.ndarray): Target values of the training examples.
+        val_x (np.ndarray): Array of validation examples.
+        val_y (np.ndarray): Target values of the validation examples.
+        teacher_at (np.ndarray): Audio tagging predictions of the
+            teacher for the training examples.
+        teacher_sed (np.ndarray): Frame-level predictions of the teacher
+            for the training examples (see :func:`teacher_targets`).
+        output_path (str): Path of the output directory.
+        architecture (dict): Keyword arguments of :func:`capsnet.gccaps`
+            that specify the architecture of the student.
+        sed_metrics_fn: Optional function that computes SED metrics for
+            the validation set (see :class:`training.ValidationLogger`).
+
+    See Also:
+        :func:`load_student`
+    """
+    n_classes = tr_y.shape[1]
+    model = capsnet.gccaps(input_shape=tr_x.shape[1:],
+                           n_classes=n_classes,
+                           multi_output=True,
+                           **architecture)
+    model.compile(loss='binary_crossentropy',
+                  loss_weights=[1., cfg.distillation_sed_weight],
+                  optimizer=Adam(lr=cfg.learning_rate['initial']),
+                  )
+
+    # Binary cross-entropy is linear in the target values, so mixing the
+    # targets is equivalent to mixing the two losses
+    alpha = cfg.distillation_alpha
+    at_targets = alpha * tr_y + (1 - alpha) * teacher_at
+
+    batch_size = cfg.batch_size
+    generator = data_generator.balanced_generator(
+        tr_x, tr_y, batch_size, targets=[at_targets, teacher_sed])
+
+    callbacks = [training.ValidationLogger(
+        val_x, val_y,
+        batch_size=training._validation_batch_size(model, val_x),
+        sed_metrics_fn=sed_metrics_fn,
+    )]
+
+    path = os.path.join(output_path, 'gccaps.{epoch:02d}-{val_acc:.4f}.hdf5')
+    callbacks.append(checkpointing.CheckpointManager(
+        filepath=path,
+        monitor=cfg.checkpoint_monitor,
+        mode=cfg.checkpoint_mode,
+        n_best=cfg.n_checkpoints,
+    ))
+    callbacks.append(CSVLogger(os.path.join(output_path, 'history.csv')))
+
+    if cfg.learning_rate['decay'] < 1.:
+        callbacks.append(LearningRateScheduler(schedule=training.lr_schedule))
+    if cfg.n_epochs == -1:
+        callbacks.append(EarlyStopping(monitor='val_loss',
+                                       min_delta=0,
+                                       patience=5,
+                                       ))
+
+    n_epochs = cfg.n_epochs if cfg.n_epochs >= 0 else 10000
+
+    return model.fit_generator(generator=generator,
+                               steps_per_epoch=len(tr_x) // batch_size,
+                               epochs=n_epochs,
+                               callbacks=callbacks,
+                               workers=0,
+                               use_multiprocessing=False,
+                               )
+
+
+def load_student(output_path, input_shape, n_classes, architecture):
+    """Load the best checkpoint of a model trained by distillation.
+
+    The best checkpoint is the retained checkpoint that is ranked
+    highest by ``cfg.checkpoint_monitor`` in the training history.
+
+    Args:
+        output_path (str): Path of the output directory of
+            :func:`train_student`.
+        input_shape (tuple): Shape of the input tensor.
+        n_classes (int): Number of classes for classification.
+        architecture (dict): Keyword arguments of :func:`capsnet.gccaps`
+            that the model was trained with.
+
+    Returns:
+        A Keras model with both audio tagging and localization outputs,
+        or ``None`` if there is no checkpoint.
+    """
+    if not os.path.isdir(output_path):
+        return None
+
+    history = utils.read_training_history(
+        os.path.join(output_path, 'history.csv'),
+        ordering=cfg.checkpoint_monitor)
+    retained = checkpointing.retained_epochs(output_path)
+    epochs = [int(epoch) + 1 for epoch, *_ in history]
+    epochs = [epoch for epoch in epochs if epoch in retained]
+    if not epochs:
+        return None
+
+    model = capsnet.gccaps(input_shape=input_shape,
+                           n_classes=n_classes,
+                           multi_output=True,
+                           **architecture)
+    model.load_weights(glob.glob(os.path.join(
+        output_path, 'gccaps.%.02d-*.hdf5' % epochs[0]))[0])
+    return model
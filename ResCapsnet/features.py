@@ -1,5 +1,7 @@
 import os.path
 import datetime as dt
+import queue
+import threading
 
 import h5py
 import librosa
@@ -90,6 +92,47 @@ def load_features(path):
         return np.array(f['F'])
 
 
+def iterate_features(path, batch_size=256, start=0, read_ahead=2):
+    """Iterate over batches of feature vectors in an HDF5 file.
+
+    Batches are read by a background thread, which stays up to
+    `read_ahead` batches ahead of the consumer. This overlaps disk
+    access with computation while keeping memory usage bounded.
+
+    Args:
+        path (str): Path to the HDF5 file.
+        batch_size (int): Number of examples in each batch.
+        start (int): Index of the first example to read.
+        read_ahead (int): Maximum number of batches to buffer.
+
+    Yields:
+        tuple: The index of the first example in the batch and the
+        array of feature vectors.
+    """
+    batches = queue.Queue(maxsize=read_ahead)
+
+    def _read():
+        try:
+            with h5py.File(path, 'r') as f:
+                feats = f['F']
+                for i in range(start, len(feats), batch_size):
+                    batches.put((i, np.array(feats[i:i + batch_size])))
+        except Exception as e:
+            batches.put(e)
+        batches.put(None)
+
+    thread = threading.Thread(target=_read, daemon=True)
+    thread.start()
+
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        if isinstance(batch, Exception):
+            raise batch
+        yield batch
+
+
 class LogmelExtractor(object):
     """Feature extractor for logmel representations.
 
@@ -0,0 +1,115 @@
+import numpy as np
+
+from keras.layers import BatchNormalization
+
+import capsnet
+from gated_conv import GATED_CONVS
+
+
+def fold_batch_norm(model):
+    """Create an inference model in which batch normalization is folded.
+
+    At inference time, a batch normalization layer is an affine
+    transformation with fixed parameters, so it can be absorbed into a
+    neighbouring layer. In each CRAM block, the transformation that
+    follows a gated convolution is folded into the linear half of the
+    convolution kernel, with the remaining shift becoming an output bias
+    of the gated convolution. The transformation that follows the
+    primary capsules cannot be moved across the squashing function, so
+    it is instead folded into the two layers that consume the primary
+    capsules: the capsule layer and the attention layer.
+
+    Dropout layers are omitted, as they are identity functions at
+    inference time.
+
+    Args:
+        model: Keras model of GCCaps architecture.
+
+    Returns:
+        A Keras model of the folded GCCaps architecture with both audio
+        tagging and localization outputs. The outputs of this model are
+        identical (up to floating point error) to the inference-time
+        outputs of `model`.
+
+    See Also:
+        :func:`capsnet.gccaps`
+    """
+    n_classes = model.get_layer('output').output_shape[-1]
+    folded = capsnet.gccaps(input_shape=model.input_shape[1:],
+                            n_classes=n_classes,
+                            folded=True,
+                            multi_output=True,
+                            **dict(capsnet.trunk_config(model),
+                                   **capsnet.head_config(model))
+                            )
+
+    # Map each output tensor to the layer that produced it
+    producers = {layer.output.name: layer for layer in model.layers}
+
+    # Determine the affine transformation of each batch norm layer and
+    # associate it with the layer that precedes it.
+    conv_affines = {}
+    caps_affines = []
+    for layer in model.layers:
+        if not isinstance(layer, BatchNormalization):
+            continue
+
+        producer = producers[layer.input.name]
+        if isinstance(producer, GATED_CONVS):
+            conv_affines[producer.name] = _batch_norm_affine(layer)
+        else:
+            caps_affines.append(_batch_norm_affine(layer))
+
+    if len(caps_affines) != 1:
+        raise ValueError('Expected a single batch normalization layer '
+                         'for the primary capsules')
+
+    # Fold batch norm into the gated convolutions
+    convs = [layer for layer in model.layers if isinstance(layer, GATED_CONVS)]
+    folded_convs = [layer for layer in folded.layers
+                    if isinstance(layer, GATED_CONVS)]
+    for conv, folded_conv in zip(convs, folded_convs):
+        # A separable convolution has a depthwise and a pointwise kernel,
+        # of which only the latter produces the output channels
+        *kernels, bias = conv.get_weights()
+        scale, shift = conv_affines[conv.name]
+
+        n_filters = conv.n_filters
+        kernels[-1][..., :n_filters] *= scale
+        bias[:n_filters] *= scale
+        folded_conv.set_weights(kernels + [bias, shift])
+
+    name = 'primary_capsule_conv'
+    folded.get_layer(name).set_weights(model.get_layer(name).get_weights())
+
+    # Fold batch norm into the transformation matrices of the capsule
+    # layer. The shift becomes a bias for each prediction vector.
+    scale, shift = caps_affines[0]
+    W = model.get_layer('capsule_layer').get_weights()[0]
+    folded.get_layer('capsule_layer').set_weights([W * scale,
+                                                   np.dot(W, shift)])
+
+    # Fold batch norm into the attention layer. The input of this layer
+    # is the flattened primary capsules, so the transformation is tiled.
+    kernel, bias = model.get_layer('attention_layer').get_weights()
+    n_capsules = kernel.shape[0] // len(scale)
+    scale = np.tile(scale, n_capsules)
+    shift = np.tile(shift, n_capsules)
+    folded.get_layer('attention_layer').set_weights(
+        [kernel * scale[:, None], bias + np.dot(shift, kernel)])
+
+    return folded
+
+
+def _batch_norm_affine(layer):
+    """Return the inference-time affine transformation of a batch norm.
+
+    Args:
+        layer: Keras batch normalization layer.
+
+    Returns:
+        tuple: The scale and shift vectors of the transformation.
+    """
+    gamma, beta, mean, variance = layer.get_weights()
+    scale = gamma / np.sqrt(variance + layer.epsilon)
+    return scale, beta - mean * scale
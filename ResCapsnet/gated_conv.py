@@ -1,12 +1,23 @@
+import tensorflow as tf
+
+from keras import backend as K
 from keras.layers import Activation
 from keras.layers import BatchNormalization
 from keras.layers import Dropout
 from keras.layers import Conv2D
+from keras.layers import Lambda
 from keras.layers import MaxPooling2D,Add
 from keras.layers import Multiply
+from keras.layers import SeparableConv2D
+
+
+_n_recompute_gradients = 0
+"""int: Number of gradient functions registered for recomputation."""
+
 
 #Defining CRAM block
-def block(x, n_filters=64, pool_size=(2, 2), dropout_rate=0.2):
+def block(x, n_filters=64, pool_size=(2, 2), dropout_rate=0.2,
+          folded=False, checkpoint=False, separable=False):
     """Apply two gated convolutions followed by a max-pooling operation.
 
     Batch normalization and dropout are applied for regularization.
@@ -16,50 +27,244 @@ def block(x, n_filters=64, pool_size=(2, 2), dropout_rate=0.2):
         n_filters (int): Number of filters for each gated convolution.
         pool_size (int or tuple): Pool size of max-pooling operation.
         dropout_rate (float): Fraction of units to drop.
+        folded (bool): Whether to create the inference variant of the
+            block, in which batch normalization is folded into the
+            gated convolutions and dropout is omitted.
+        checkpoint (bool): Whether to recompute the activations of the
+            block during the backward pass instead of storing them (see
+            :func:`recompute_gradient`). This reduces the memory used
+            for training at the cost of an extra forward pass.
+        separable (bool): Whether to use depthwise-separable gated
+            convolutions (see :class:`SeparableGatedConv`).
 
     Returns:
         A Keras tensor of the resulting output.
+
+    See Also:
+        :func:`folding.fold_batch_norm`
     """
-    x1 = GatedConv(n_filters, padding='same')(x)
-    x2 = BatchNormalization(axis=-1)(x1)
-    x3 = Activation('relu')(x2)
-    x4 = Dropout(rate=dropout_rate)(x3)
-    x5 = GatedConv(n_filters, padding='same')(x4)
-    x6 = BatchNormalization(axis=-1)(x5)
-    x7 = Dropout(rate=dropout_rate)(x6)
-    x8 = Add()([x,x7])
-    x = MaxPooling2D(pool_size=pool_size)(x8)
-    
-    return Activation('relu')(x)
-
-
-class GatedConv(Conv2D):
-   
-    def __init__(self, n_filters=64, kernel_size=(3, 3), **kwargs):
-        super(GatedConv, self).__init__(filters=n_filters*2,
-                                        kernel_size=kernel_size,
-                                        **kwargs)
+    dropout = SeededDropout if checkpoint else Dropout
+    conv = SeparableGatedConv if separable else GatedConv
+
+    # Create the layers in the order they are applied
+    layers = [conv(n_filters, padding='same', use_output_bias=folded)]
+    if not folded:
+        layers.append(BatchNormalization(axis=-1))
+    layers.append(Activation('relu'))
+    if not folded:
+        layers.append(dropout(rate=dropout_rate))
+    layers.append(conv(n_filters, padding='same', use_output_bias=folded))
+    if not folded:
+        layers.append(BatchNormalization(axis=-1))
+        layers.append(dropout(rate=dropout_rate))
+    add = Add()
+    pool = MaxPooling2D(pool_size=pool_size)
+    activation = Activation('relu')
+
+    def _apply(x, call):
+        y = x
+        for layer in layers:
+            y = call(layer, y)
+        y = call(add, [x, y])
+        x = call(pool, y)
+        return call(activation, x)
+
+    def _recompute(x):
+        # The layers are called directly, so that no nodes are added to
+        # the Keras graph
+        return _apply(x, lambda layer, inputs: layer.call(inputs))
+
+    output = _apply(x, lambda layer, inputs: layer(inputs))
+    if not checkpoint:
+        return output
+
+    weights = [weight for layer in layers
+               for weight in layer.trainable_weights]
+    return Lambda(recompute_gradient,
+                  output_shape=lambda input_shapes: input_shapes[1],
+                  arguments={'forward': _recompute, 'weights': weights},
+                  )([x, output])
+
+
+def recompute_gradient(inputs, forward, weights):
+    """Recompute the activations of a subgraph when backpropagating.
+
+    The output of the subgraph is passed through an ``IdentityN`` op
+    along with its input and weights. The gradient of this op is
+    overridden so that the subgraph is recomputed from its input, once
+    the gradient of its output is available, and the gradients with
+    respect to the input and weights are computed from the recomputed
+    subgraph. No gradient is propagated to the original output, so the
+    intermediate activations of the subgraph are not kept for the
+    backward pass.
+
+    The subgraph must be deterministic given its input, which is why
+    :class:`SeededDropout` is used instead of dropout.
+
+    Args:
+        inputs (list): The input tensor and output tensor of the
+            subgraph.
+        forward: Function that recomputes the output given the input.
+        weights (list): Trainable weights used by the subgraph.
+
+    Returns:
+        A tensor equal to the output of the subgraph.
+    """
+    global _n_recompute_gradients
+
+    x, output = inputs
+    name = 'RecomputeGradient_%d' % _n_recompute_gradients
+    _n_recompute_gradients += 1
+
+    @tf.RegisterGradient(name)
+    def _gradient(op, grad, *_):
+        # Delay the recomputation until it is needed
+        with tf.control_dependencies([grad]):
+            x = tf.identity(op.inputs[1])
+        grads = tf.gradients(forward(x), [x] + list(op.inputs[2:]),
+                             grad_ys=grad)
+        return [None] + grads
+
+    weights = [tf.convert_to_tensor(weight) for weight in weights]
+    with tf.get_default_graph().gradient_override_map({'IdentityN': name}):
+        return tf.identity_n([output, x] + weights)[0]
+
+
+class SeededDropout(Dropout):
+    """A dropout layer whose mask can be recomputed.
+
+    The mask is generated using a stateless random number generator
+    whose seed is drawn once per training step. Calling the layer again
+    with the same input during the same step, e.g. when recomputing
+    activations (see :func:`recompute_gradient`), gives the same mask.
+
+    Attributes:
+        seed_tensor: Tensor of the seed, which is created by the first
+            call of the layer.
+    """
+
+    def __init__(self, rate, **kwargs):
+        super(SeededDropout, self).__init__(rate, **kwargs)
+
+        self.seed_tensor = None
+
+    def call(self, inputs, training=None):
+        """Apply dropout using the seed of the current step."""
+        if not 0. < self.rate < 1.:
+            return inputs
+
+        if self.seed_tensor is None:
+            self.seed_tensor = tf.random_uniform(
+                [2], maxval=2 ** 31 - 1, dtype=tf.int64)
+
+        def dropped_inputs():
+            noise = tf.contrib.stateless.stateless_random_uniform(
+                tf.shape(inputs), self.seed_tensor)
+            mask = K.cast(noise >= self.rate, K.dtype(inputs))
+            return inputs * mask / (1. - self.rate)
+
+        return K.in_train_phase(dropped_inputs, inputs, training=training)
+
+
+class _Gating(object):
+    """Mixin that turns a convolution layer into a gated convolution.
+
+    The mixin must precede the convolution class in the bases of the
+    layer, so that the convolution is created with twice the number of
+    filters and its output is gated (see :class:`GatedConv`).
+    """
+
+    def __init__(self, n_filters=64, kernel_size=(3, 3),
+                 use_output_bias=False, **kwargs):
+        super(_Gating, self).__init__(filters=n_filters*2,
+                                      kernel_size=kernel_size,
+                                      **kwargs)
 
         self.n_filters = n_filters
+        self.use_output_bias = use_output_bias
+
+    def build(self, input_shape):
+        """Create the layer weights."""
+        super(_Gating, self).build(input_shape)
+
+        if self.use_output_bias:
+            self.output_bias = self.add_weight(shape=(self.n_filters,),
+                                               initializer='zeros',
+                                               name='output_bias')
 
     def call(self, inputs):
         """Apply gated convolution."""
-        output = super(GatedConv, self).call(inputs)
+        output = super(_Gating, self).call(inputs)
 
         n_filters = self.n_filters
         linear = Activation('linear')(output[:, :, :, :n_filters])
         sigmoid = Activation('sigmoid')(output[:, :, :, n_filters:])
+        output = Multiply()([linear, sigmoid])
 
-        return Multiply()([linear, sigmoid])
+        if self.use_output_bias:
+            output = K.bias_add(output, self.output_bias,
+                                data_format=self.data_format)
+
+        return output
 
     def compute_output_shape(self, input_shape):
         """Compute shape of layer output."""
-        output_shape = super(GatedConv, self).compute_output_shape(input_shape)
+        output_shape = super(_Gating, self).compute_output_shape(input_shape)
         return tuple(output_shape[:3]) + (self.n_filters,)
 
     def get_config(self):
         """Return the config of the layer."""
-        config = super(GatedConv, self).get_config()
+        config = super(_Gating, self).get_config()
         config['n_filters'] = self.n_filters
+        config['use_output_bias'] = self.use_output_bias
         del config['filters']
         return config
+
+
+class GatedConv(_Gating, Conv2D):
+    """A Keras layer implementing a gated convolution.
+
+    The convolution produces twice the number of filters. The first
+    half is the linear output and the second half is passed through a
+    sigmoid to give the gates. The output is their element-wise product.
+
+    Args:
+        n_filters (int): Number of output filters.
+        kernel_size (int or tuple): Size of convolution kernel.
+        use_output_bias (bool): Whether to add a bias vector after the
+            gating operation. This is used to fold a subsequent batch
+            normalization layer into the gated convolution.
+        kwargs: Other layer keyword arguments.
+
+    Attributes:
+        n_filters (int): Number of output filters.
+        use_output_bias (bool): Whether to add a bias vector after the
+            gating operation.
+    """
+
+
+class SeparableGatedConv(_Gating, SeparableConv2D):
+    """A gated convolution that is depthwise separable.
+
+    The convolution is factorized into a depthwise convolution, which
+    filters each input channel separately, and a pointwise convolution,
+    which mixes the channels. This requires far fewer weights and
+    operations than :class:`GatedConv` for the same number of filters.
+    The gating operation is the same.
+
+    Args:
+        n_filters (int): Number of output filters.
+        kernel_size (int or tuple): Size of the depthwise kernel.
+        use_output_bias (bool): Whether to add a bias vector after the
+            gating operation.
+        kwargs: Other layer keyword arguments, e.g. `depth_multiplier`.
+
+    Attributes:
+        n_filters (int): Number of output filters.
+        use_output_bias (bool): Whether to add a bias vector after the
+            gating operation.
+    """
+
+
+GATED_CONVS = (GatedConv, SeparableGatedConv)
+"""tuple: The gated convolution layer classes."""
@@ -0,0 +1,252 @@
+import os
+
+import h5py
+import numpy as np
+
+from keras.callbacks import CSVLogger
+from keras.callbacks import EarlyStopping
+from keras.callbacks import LearningRateScheduler
+from keras.layers import Input
+from keras.models import Model
+from keras.optimizers import Adam
+
+import backend
+import capsnet
+import checkpointing
+import config as cfg
+import data_generator
+import instrumentation
+import training
+
+
+def trunk_outputs(checkpoint_path, x, cache_path, batch_size=32,
+                  chunk_size=256):
+    """Return the outputs of a trained trunk, computing them if needed.
+
+    The outputs of the convolutional trunk of the checkpoint (see
+    :func:`capsnet.gccaps_trunk`) are computed in inference mode and
+    written to an HDF5 file chunk by chunk. The file records the path
+    and modification time of the checkpoint, so the outputs are only
+    recomputed if the checkpoint or the number of examples changes.
+
+    Args:
+        checkpoint_path (str): Path of the weights of a GCCaps model.
+        x (np.ndarray): Array of input examples.
+        cache_path (str): Path of the HDF5 cache file.
+        batch_size (int): Number of examples in a prediction batch.
+        chunk_size (int): Number of examples to predict before writing
+            them to disk.
+
+    Returns:
+        np.ndarray: The trunk outputs of the examples.
+    """
+    mtime = os.path.getmtime(checkpoint_path)
+    if os.path.exists(cache_path):
+        with h5py.File(cache_path, 'r') as f:
+            if f.attrs['checkpoint'] == checkpoint_path.encode('utf8') \
+                    and f.attrs['mtime'] == mtime \
+                    and len(f['outputs']) == len(x):
+                return np.array(f['outputs'])
+
+    trunk = _load_trunk(checkpoint_path, x.shape[1:])
+    output_shape = trunk.output_shape[1:]
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with h5py.File(tmp_path, 'w') as f:
+        dataset = f.create_dataset('outputs', (len(x),) + output_shape,
+                                   dtype='float32')
+        for start in range(0, len(x), chunk_size):
+            end = start + chunk_size
+            dataset[start:end] = trunk.predict(x[start:end],
+                                               batch_size=batch_size)
+
+        f.attrs['checkpoint'] = checkpoint_path.encode('utf8')
+        f.attrs['mtime'] = mtime
+        outputs = np.array(dataset)
+
+    os.replace(tmp_path, cache_path)
+    return outputs
+
+
+def train_head(tr_z, tr_y, val_z, val_y, checkpoint_path, input_shape,
+               sed_metrics_fn=None):
+    """Train the capsule head of a GCCaps model on cached trunk outputs.
+
+    The head is created with the settings of ``cfg.capsule_head``. Its
+    weights are initialized from the checkpoint for every layer whose
+    weights are compatible, and randomly otherwise. Training proceeds
+    as in :func:`training.train`, except that the trunk is frozen and
+    never evaluated, as its outputs are given by `tr_z` and `val_z`.
+
+    The checkpoints of the best epochs are saved as full GCCaps models,
+    with the trunk of the original checkpoint, so they can be used in
+    the same way as the checkpoints of :func:`training.train`.
+
+    Args:
+        tr_z (np.ndarray): Trunk outputs of the training examples.
+        tr_y (np.ndarray): Target values of the training examples.
+        val_z (np.ndarray): Trunk outputs of the validation examples.
+        val_y (np.ndarray): Target values of the validation examples.
+        checkpoint_path (str): Path of the checkpoint that the trunk
+            outputs were computed with.
+        input_shape (tuple): Shape of the input of the full model.
+        sed_metrics_fn: Optional function that computes SED metrics for
+            the validation set (see :class:`training.ValidationLogger`).
+
+    See Also:
+        :func:`trunk_outputs`
+    """
+    n_classes = tr_y.shape[1]
+    head = capsnet.gccaps_head_model(tr_z.shape[1:], n_classes,
+                                     **cfg.capsule_head)
+    model = capsnet.gccaps(input_shape, n_classes, **cfg.capsule_head)
+
+    # Copy the trunk of the checkpoint into the full model, and as much
+    # of the head as is compatible into the head model
+    weights = checkpointing.read_weights(checkpoint_path)
+    layers = [layer for layer in model.layers if layer.weights]
+    n_trunk = len(layers) - len(capsnet.head_layers(model))
+    for layer, (_, values) in zip(layers[:n_trunk], weights[:n_trunk]):
+        layer.set_weights(values)
+    n_copied = _copy_compatible(weights[n_trunk:],
+                                capsnet.head_layers(head))
+    print('Initialized %d of %d head layers from %s'
+          % (n_copied, len(capsnet.head_layers(head)), checkpoint_path))
+
+    head.compile(loss='binary_crossentropy',
+                 optimizer=Adam(lr=cfg.learning_rate['initial']),
+                 metrics=['accuracy'],
+                 )
+
+    batch_size = cfg.batch_size
+    generator = data_generator.balanced_generator(tr_z, tr_y, batch_size)
+
+    callbacks = [training.ValidationLogger(
+        val_z, val_y,
+        batch_size=training._validation_batch_size(head, val_z),
+        sed_metrics_fn=sed_metrics_fn,
+    )]
+
+    path = os.path.join(cfg.model_path,
+                        'gccaps.{epoch:02d}-{val_acc:.4f}.hdf5')
+    checkpoint_manager = FullModelCheckpointManager(
+        model,
+        filepath=path,
+        monitor=cfg.checkpoint_monitor,
+        mode=cfg.checkpoint_mode,
+        n_best=cfg.n_checkpoints,
+    )
+    callbacks.append(checkpoint_manager)
+    callbacks.append(CSVLogger(cfg.history_path))
+
+    if cfg.learning_rate['decay'] < 1.:
+        callbacks.append(LearningRateScheduler(schedule=training.lr_schedule))
+    if cfg.n_epochs == -1:
+        callbacks.append(EarlyStopping(monitor='val_loss',
+                                       min_delta=0,
+                                       patience=5,
+                                       ))
+
+    n_epochs = cfg.n_epochs if cfg.n_epochs >= 0 else 10000
+
+    # Record the throughput and elapsed time for comparison with
+    # training the full model
+    iterator = instrumentation.TimedIterator(generator)
+    monitor = instrumentation.TrainingMonitor(
+        callbacks, iterator, batch_size,
+        checkpoint_callbacks=[checkpoint_manager],
+    )
+
+    return head.fit_generator(generator=iterator,
+                              steps_per_epoch=len(tr_z) // batch_size,
+                              epochs=n_epochs,
+                              callbacks=[monitor],
+                              workers=0,
+                              use_multiprocessing=False,
+                              )
+
+
+class FullModelCheckpointManager(checkpointing.CheckpointManager):
+    """A checkpoint manager that saves a head as part of a full model.
+
+    Before each checkpoint is taken, the weights of the head model being
+    trained are copied into the head of `full_model`, whose weights are
+    then saved instead.
+
+    Args:
+        full_model: Keras model of GCCaps architecture with the same
+            head settings as the model being trained.
+        kwargs: Keyword arguments of
+            :class:`checkpointing.CheckpointManager`.
+
+    Attributes:
+        full_model: The model whose weights are saved.
+        head_model: The head model being trained.
+    """
+    def __init__(self, full_model, **kwargs):
+        super(FullModelCheckpointManager, self).__init__(**kwargs)
+
+        self.full_model = full_model
+        self.head_model = None
+
+    def set_model(self, model):
+        self.head_model = model
+        super(FullModelCheckpointManager, self).set_model(self.full_model)
+
+    def on_epoch_end(self, epoch, logs=None):
+        """Copy the head weights and checkpoint the full model."""
+        for src, dst in zip(capsnet.head_layers(self.head_model),
+                            capsnet.head_layers(self.full_model)):
+            dst.set_weights(src.get_weights())
+
+        super(FullModelCheckpointManager, self).on_epoch_end(epoch, logs)
+
+
+def _load_trunk(checkpoint_path, input_shape):
+    """Create a trunk model with the weights of a checkpoint.
+
+    Only the trunk is created, so the head settings of the checkpoint
+    need not be known.
+
+    Args:
+        checkpoint_path (str): Path of the weights of a GCCaps model.
+        input_shape (tuple): Shape of the input tensor.
+
+    Returns:
+        A Keras model of the trunk.
+    """
+    backend.initialize()
+
+    input_tensor = Input(shape=input_shape, name='input_tensor')
+    trunk = Model(input_tensor, capsnet.gccaps_trunk(input_tensor),
+                  name='GCCapsTrunk')
+
+    layers = [layer for layer in trunk.layers if layer.weights]
+    weights = checkpointing.read_weights(checkpoint_path)
+    for layer, (_, values) in zip(layers, weights):
+        layer.set_weights(values)
+
+    return trunk
+
+
+def _copy_compatible(weights, layers):
+    """Set the weights of layers if their shapes match.
+
+    Args:
+        weights (list): List of ``(layer_name, values)`` tuples, as
+            returned by :func:`checkpointing.read_weights`.
+        layers (list): The layers to set the weights of, in the same
+            order as `weights`.
+
+    Returns:
+        int: The number of layers whose weights were set.
+    """
+    n_copied = 0
+    for layer, (_, values) in zip(layers, weights):
+        shapes = [value.shape for value in values]
+        if shapes == [tuple(w.shape) for w in layer.get_weights()]:
+            layer.set_weights(values)
+            n_copied += 1
+
+    return n_copied
@@ -37,7 +37,7 @@ def binarize_predictions_2d(predictions, threshold=0.5):
 
 
 def binarize_predictions_3d(predictions, threshold=0.5,
-                            n_dilation=1, n_erosion=1):
+                            n_dilation=1, n_erosion=1, gate=None):
     """Convert prediction probabilities to binary values.
 
     This function is intended for sound event detection predictions. The
@@ -55,17 +55,51 @@ def binarize_predictions_3d(predictions, threshold=0.5,
             will be 'filled'.
         n_erosion (int): A sequence of ones of this length or less in
             isolation will be removed.
+        gate (np.ndarray): 2D boolean array specifying which classes of
+            each sample are processed. The binary values of the other
+            classes are set to zero. If ``None``, all are processed.
 
     Returns:
         np.ndarray: Binarized prediction values.
+
+    See Also:
+        :func:`cascade_gate`
     """
     predictions = np.transpose(predictions, (0, 2, 1))
     binary_preds = (predictions > threshold).astype(int)
     binary_preds = np.transpose(binary_preds, (0, 2, 1))
 
+    if gate is None:
+        gate = np.ones(binary_preds.shape[:2], dtype=bool)
+
     return np.array([[_erode(_dilate(label_pred, n_dilation), n_erosion)
-                      for label_pred in sample_pred]
-                     for sample_pred in binary_preds])
+                      if label_gate else np.zeros_like(label_pred)
+                      for label_pred, label_gate in zip(sample_pred,
+                                                        sample_gate)]
+                     for sample_pred, sample_gate in zip(binary_preds, gate)])
+
+
+def cascade_gate(at_predictions, threshold=0.1):
+    """Determine which SED predictions are worth post-processing.
+
+    Most clips contain few of the target classes, and the frame-level
+    predictions of a class are unlikely to contain events if the
+    clip-level prediction is low. Gating the classes of each clip by
+    their audio tagging predictions allows SED post-processing to be
+    skipped for the majority of clip-class pairs.
+
+    Args:
+        at_predictions (np.ndarray): 2D array of audio tagging
+            predictions.
+        threshold (float or list): Threshold that a clip-level
+            prediction must exceed for the class to be processed. If a
+            list is given, it must specify a threshold for each class.
+
+    Returns:
+        np.ndarray: 2D boolean array to pass as the `gate` argument of
+        :func:`binarize_predictions_3d`.
+    """
+    return at_predictions > threshold
 
 
 def generate_event_lists(predictions, resolution):
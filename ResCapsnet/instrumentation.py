@@ -0,0 +1,233 @@
+import csv
+import json
+import os.path
+import time
+
+from keras.callbacks import Callback
+
+import batch_tuning
+
+
+class TimedIterator(object):
+    """Iterator that records the time spent waiting for another.
+
+    Args:
+        iterator: Iterator to wrap, e.g. a training data generator.
+
+    Attributes:
+        iterator: The wrapped iterator.
+        total_time (float): Total time spent in ``next`` in seconds.
+    """
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.total_time = 0.
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        onset = time.time()
+        try:
+            return next(self.iterator)
+        finally:
+            self.total_time += time.time() - onset
+
+
+class TrainingMonitor(Callback):
+    """A callback that measures where training time is spent.
+
+    The monitor wraps the other training callbacks and calls them
+    itself, so that the time spent in them can be measured. For each
+    training step, it records the time spent waiting for the training
+    data, the time spent computing the forward and backward passes, and
+    the time spent in callbacks. These are written to a CSV file.
+
+    At the end of each epoch, the totals are added to the logs, along
+    with the time spent in checkpointing callbacks, the number of
+    training steps and examples per second, the peak resident memory
+    in megabytes, and the time elapsed since training began. The logs
+    are updated before each wrapped callback is called, so callbacks
+    such as ``CSVLogger`` and ``TensorBoard`` record these values as
+    long as they come after the callbacks being timed. A JSON summary
+    of every epoch is also written, which indicates whether training
+    is input-bound or compute-bound.
+
+    Args:
+        callbacks (list): Callbacks to wrap, in the order they should be
+            called.
+        iterator (TimedIterator): Timed training data iterator.
+        batch_size (int): Number of examples in a mini-batch.
+        steps_path (str): Path of the CSV file for step timings. If
+            ``None``, step timings are not written.
+        summary_path (str): Path of the JSON summary file. If ``None``,
+            no summary is written.
+        checkpoint_callbacks (list): Wrapped callbacks whose epoch-end
+            time counts as checkpoint time rather than callback time.
+
+    Attributes:
+        callbacks (list): The wrapped callbacks.
+        iterator (TimedIterator): Timed training data iterator.
+        batch_size (int): Number of examples in a mini-batch.
+        steps_path (str): Path of the CSV file for step timings.
+        summary_path (str): Path of the JSON summary file.
+        checkpoint_callbacks (list): Checkpointing callbacks.
+        epochs (list): Timing summary of each completed epoch.
+    """
+
+    def __init__(self, callbacks, iterator, batch_size, steps_path=None,
+                 summary_path=None, checkpoint_callbacks=()):
+        super(TrainingMonitor, self).__init__()
+
+        self.callbacks = callbacks
+        self.iterator = iterator
+        self.batch_size = batch_size
+        self.steps_path = steps_path
+        self.summary_path = summary_path
+        self.checkpoint_callbacks = list(checkpoint_callbacks)
+        self.epochs = []
+
+        self._steps_file = None
+        self._writer = None
+
+    def set_params(self, params):
+        super(TrainingMonitor, self).set_params(params)
+        for callback in self.callbacks:
+            callback.set_params(params)
+
+    def set_model(self, model):
+        super(TrainingMonitor, self).set_model(model)
+        for callback in self.callbacks:
+            callback.set_model(model)
+
+    def on_train_begin(self, logs=None):
+        if self.steps_path is not None:
+            append = os.path.exists(self.steps_path)
+            self._steps_file = open(self.steps_path, 'a' if append else 'w')
+            self._writer = csv.writer(self._steps_file)
+            if not append:
+                self._writer.writerow(['epoch', 'step', 'data_time',
+                                       'compute_time', 'callback_time'])
+
+        self._train_onset = time.time()
+        self._call('on_train_begin', logs)
+
+    def on_train_end(self, logs=None):
+        self._call('on_train_end', logs)
+
+        if self._steps_file is not None:
+            self._steps_file.close()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+        self._totals = {'data_time': 0.,
+                        'compute_time': 0.,
+                        'callback_time': 0.,
+                        'checkpoint_time': 0.,
+                        }
+        self._n_steps = 0
+        self._data_mark = self.iterator.total_time
+        self._epoch_onset = time.time()
+
+        self._totals['callback_time'] += self._call('on_epoch_begin',
+                                                    epoch, logs)
+
+    def on_batch_begin(self, batch, logs=None):
+        data_time = self.iterator.total_time - self._data_mark
+        self._data_mark = self.iterator.total_time
+
+        callback_time = self._call('on_batch_begin', batch, logs)
+        self._step = [data_time, callback_time]
+        self._compute_onset = time.time()
+
+    def on_batch_end(self, batch, logs=None):
+        compute_time = time.time() - self._compute_onset
+        data_time, callback_time = self._step
+        callback_time += self._call('on_batch_end', batch, logs)
+
+        self._totals['data_time'] += data_time
+        self._totals['compute_time'] += compute_time
+        self._totals['callback_time'] += callback_time
+        self._n_steps += 1
+
+        if self._writer is not None:
+            self._writer.writerow([self._epoch + 1, batch, data_time,
+                                   compute_time, callback_time])
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs if logs is not None else {}
+        train_time = time.time() - self._epoch_onset
+
+        for callback in self.callbacks:
+            logs.update(self._epoch_logs(train_time))
+
+            onset = time.time()
+            callback.on_epoch_end(epoch, logs)
+            duration = time.time() - onset
+
+            if callback in self.checkpoint_callbacks:
+                self._totals['checkpoint_time'] += duration
+            else:
+                self._totals['callback_time'] += duration
+
+        summary = self._epoch_logs(train_time)
+        summary['epoch'] = epoch + 1
+        summary['epoch_time'] = time.time() - self._epoch_onset
+        self.epochs.append(summary)
+
+        if self._steps_file is not None:
+            self._steps_file.flush()
+        if self.summary_path is not None:
+            self._write_summary()
+
+    def _call(self, method, *args):
+        """Call a method of each wrapped callback and time it.
+
+        Args:
+            method (str): Name of the method to call.
+            args: Arguments to pass to the method.
+
+        Returns:
+            float: The total time taken in seconds.
+        """
+        onset = time.time()
+        for callback in self.callbacks:
+            getattr(callback, method)(*args)
+        return time.time() - onset
+
+    def _epoch_logs(self, train_time):
+        """Return the timing values of the current epoch for logging.
+
+        Args:
+            train_time (float): Time taken by the training steps.
+
+        Returns:
+            dict: The timing values.
+        """
+        n_samples = self._n_steps * self.batch_size
+        return {'time_data': self._totals['data_time'],
+                'time_compute': self._totals['compute_time'],
+                'time_callbacks': self._totals['callback_time'],
+                'time_checkpoint': self._totals['checkpoint_time'],
+                'samples_per_sec': n_samples / max(train_time, 1e-9),
+                'steps_per_sec': self._n_steps / max(train_time, 1e-9),
+                'peak_rss_mb': batch_tuning.peak_rss() / 1024 ** 2,
+                'time_elapsed': time.time() - self._train_onset,
+                }
+
+    def _write_summary(self):
+        """Write the timing summary of all epochs to a JSON file."""
+        totals = {key: sum(epoch[key] for epoch in self.epochs)
+                  for key in ['time_data', 'time_compute',
+                              'time_callbacks', 'time_checkpoint']}
+        input_fraction = totals['time_data'] / max(
+            totals['time_data'] + totals['time_compute'], 1e-9)
+
+        summary = {'epochs': self.epochs,
+                   'totals': totals,
+                   'input_fraction': input_fraction,
+                   'bottleneck': 'input' if input_fraction > 0.5
+                   else 'compute',
+                   }
+        with open(self.summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
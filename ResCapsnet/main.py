@@ -1,5 +1,8 @@
+from collections import OrderedDict
 import argparse
+import functools
 import glob
+import json
 import os
 import pickle
 import sys
@@ -9,22 +12,10 @@ import numpy as np
 import config as cfg
 import utils
 
-import tensorflow as tf
-from keras.backend.tensorflow_backend import set_session
-import keras.backend.tensorflow_backend as KTF
-os.system('nvidia-smi -q -d Memory |grep -A4 GPU|grep Free >tmp')
-memory_gpu = [int(x.split()[2]) for x in open('tmp', 'r').readlines()]
 
-os.environ["CUDA_VISIBLE_DEVICES"] = "2"
-config = tf.ConfigProto()
-config.gpu_options.allow_growth=True
+_registry = None
+"""registry.ModelRegistry: Cache of warm models used for prediction."""
 
-sess = set_session(tf.Session(config=config))
-KTF.set_session(sess)
-
-import os
-os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
-os.environ["CUDA_VISIBLE_DEVICES"] = "2"
 
 def main():
     """Execute a task based on the given command-line arguments.
@@ -43,7 +34,47 @@ def main():
                                 )
 
     # Add sub-parser for training
-    subparsers.add_parser('train')
+    parser_train = subparsers.add_parser('train')
+    parser_train.add_argument('--resume', action='store_true')
+    parser_train.add_argument('--workers', type=int, default=cfg.n_workers)
+
+    # Add sub-parser for training only the capsule head
+    parser_train_head = subparsers.add_parser('train-head')
+    parser_train_head.add_argument('checkpoint')
+
+    # Add sub-parser for hyperparameter sweeps
+    parser_sweep = subparsers.add_parser('sweep')
+    parser_sweep.add_argument('spec')
+    parser_sweep.add_argument('--parallel', type=int,
+                              default=cfg.sweep_n_parallel)
+    parser_sweep.add_argument('--threads', type=int,
+                              default=cfg.sweep_threads)
+
+    # Add sub-parser for comparing the time-to-accuracy of training runs
+    parser_compare = subparsers.add_parser('compare')
+    parser_compare.add_argument('history_paths', nargs='+')
+
+    # Add sub-parser for training compact variants by distillation
+    parser_distill = subparsers.add_parser('distill')
+    parser_distill.add_argument('variant', choices=sorted(cfg.model_variants))
+
+    # Add sub-parser for comparing the compact variants
+    parser_variants = subparsers.add_parser('variants')
+    parser_variants.add_argument('dataset',
+                                 nargs='?',
+                                 choices=['validation', 'test'],
+                                 default='validation',
+                                 )
+
+    # Add sub-parser for tuning the prediction batch size
+    parser_tune = subparsers.add_parser('tune')
+    parser_tune.add_argument('dataset',
+                             nargs='?',
+                             choices=['validation', 'test'],
+                             default='validation',
+                             )
+    parser_tune.add_argument('--folded', action='store_true')
+    parser_tune.add_argument('--swa', action='store_true')
 
     # Add sub-parser for inference
     parser_predict = subparsers.add_parser('predict')
@@ -52,6 +83,81 @@ def main():
                                 choices=['validation', 'test'],
                                 default='test',
                                 )
+    parser_predict.add_argument('--folded', action='store_true')
+    parser_predict.add_argument('--swa', action='store_true')
+    parser_predict.add_argument('--chunked', action='store_true')
+
+    # Add sub-parser for detecting events in recordings of any length
+    parser_detect = subparsers.add_parser('detect')
+    parser_detect.add_argument('paths', nargs='+')
+    parser_detect.add_argument('--output', default=os.path.join(
+        os.path.dirname(cfg.predictions_path), 'events.csv'))
+    parser_detect.add_argument('--folded', action='store_true')
+    parser_detect.add_argument('--swa', action='store_true')
+
+    # Add sub-parser for replaying recordings as audio streams
+    parser_stream = subparsers.add_parser('stream')
+    parser_stream.add_argument('path')
+    parser_stream.add_argument('--chunk', type=float,
+                               default=cfg.stream_chunk_duration)
+    parser_stream.add_argument('--folded', action='store_true')
+    parser_stream.add_argument('--swa', action='store_true')
+
+    # Add sub-parser for serving predictions over HTTP
+    parser_serve = subparsers.add_parser('serve')
+    parser_serve.add_argument('--host', default=cfg.server_host)
+    parser_serve.add_argument('--port', type=int, default=cfg.server_port)
+    parser_serve.add_argument('--folded', action='store_true')
+    parser_serve.add_argument('--swa', action='store_true')
+
+    # Add sub-parser for load testing the inference server
+    parser_loadtest = subparsers.add_parser('loadtest')
+    parser_loadtest.add_argument('dataset',
+                                 nargs='?',
+                                 choices=['validation', 'test'],
+                                 default='validation',
+                                 )
+    parser_loadtest.add_argument('--folded', action='store_true')
+    parser_loadtest.add_argument('--swa', action='store_true')
+
+    # Add sub-parser for evaluating cascaded SED post-processing
+    parser_cascade = subparsers.add_parser('cascade')
+    parser_cascade.add_argument('dataset',
+                                nargs='?',
+                                choices=['validation', 'test'],
+                                default='validation',
+                                )
+
+    # Add sub-parser for exporting inference models
+    parser_export = subparsers.add_parser('export')
+    parser_export.add_argument('--numpy', action='store_true')
+
+    # Add sub-parser for averaging the weights of the prediction models
+    parser_average = subparsers.add_parser('average')
+    parser_average.add_argument('dataset',
+                                nargs='?',
+                                choices=['validation', 'test'],
+                                default='validation',
+                                )
+
+    # Add sub-parser for quantizing the exported models
+    parser_quantize = subparsers.add_parser('quantize')
+    parser_quantize.add_argument('dataset',
+                                 nargs='?',
+                                 choices=['validation', 'test'],
+                                 default='test',
+                                 )
+
+    # Add sub-parser for benchmarking inference engines
+    parser_benchmark = subparsers.add_parser('benchmark')
+    parser_benchmark.add_argument('engine',
+                                  choices=['numpy', 'silence',
+                                           'checkpointing'])
+    parser_benchmark.add_argument('dataset',
+                                  nargs='?',
+                                  choices=['validation', 'test'],
+                                  default='validation',
+                                  )
 
     # Add sub-parser for evaluation
     parser_evaluate = subparsers.add_parser('evaluate')
@@ -72,9 +178,46 @@ def main():
     if args.mode == 'extract':
         extract(cfg.to_dataset(args.dataset))
     elif args.mode == 'train':
-        train()
+        if args.resume and args.workers > 1:
+            parser.error('--resume is not supported with multiple workers')
+        train(args.resume, args.workers)
+    elif args.mode == 'train-head':
+        train_head(args.checkpoint)
+    elif args.mode == 'sweep':
+        sweep(args.spec, args.parallel, args.threads)
+    elif args.mode == 'compare':
+        compare(args.history_paths)
+    elif args.mode == 'distill':
+        distill(args.variant)
+    elif args.mode == 'variants':
+        variants(cfg.to_dataset(args.dataset))
+    elif args.mode == 'tune':
+        tune(cfg.to_dataset(args.dataset), args.folded, args.swa)
     elif args.mode == 'predict':
-        predict(cfg.to_dataset(args.dataset))
+        predict(cfg.to_dataset(args.dataset),
+                args.folded, args.swa, args.chunked)
+    elif args.mode == 'detect':
+        detect(args.paths, args.output, args.folded, args.swa)
+    elif args.mode == 'stream':
+        stream(args.path, args.chunk, args.folded, args.swa)
+    elif args.mode == 'serve':
+        serve(args.host, args.port, args.folded, args.swa)
+    elif args.mode == 'loadtest':
+        loadtest(cfg.to_dataset(args.dataset), args.folded, args.swa)
+    elif args.mode == 'cascade':
+        cascade(cfg.to_dataset(args.dataset))
+    elif args.mode == 'export':
+        export(args.numpy)
+    elif args.mode == 'average':
+        average(cfg.to_dataset(args.dataset))
+    elif args.mode == 'quantize':
+        quantize(cfg.to_dataset(args.dataset))
+    elif args.mode == 'benchmark' and args.engine == 'checkpointing':
+        benchmark_checkpointing()
+    elif args.mode == 'benchmark' and args.engine == 'silence':
+        benchmark_silence(cfg.to_dataset(args.dataset))
+    elif args.mode == 'benchmark':
+        benchmark(args.engine, cfg.to_dataset(args.dataset))
     elif args.mode == 'evaluate':
         eval_all = args.task == 'all'
         dataset = cfg.to_dataset(args.dataset)
@@ -126,17 +269,28 @@ def extract(dataset):
                              )
 
 
-def train():
+def train(resume=False, n_workers=1):
     """Train the neural network model.
 
+    Args:
+        resume (bool): Whether to resume an interrupted training run
+            from its last completed epoch.
+        n_workers (int): Number of worker processes. If greater than 1,
+            data-parallel training is used, which cannot be resumed.
+
     See Also:
         :func:`training.train`
+        :func:`parallel.train`
 
     Note:
         For reproducibility, the random seed is set to a fixed value.
+        When resuming, the saved random state is restored instead.
     """
     import training
 
+    if resume and n_workers > 1:
+        raise ValueError('Resuming is not supported with multiple workers')
+
     # Ensure output directories exist
     os.makedirs(os.path.dirname(cfg.scaler_path), exist_ok=True)
     os.makedirs(cfg.model_path, exist_ok=True)
@@ -146,6 +300,10 @@ def train():
     tr_x, tr_y, _ = _load_data(cfg.training_set, is_training=True)
     val_x, val_y, _ = _load_data(cfg.validation_set)
 
+    sed_metrics_fn = None
+    if cfg.validate_sed:
+        sed_metrics_fn = _sed_metrics_fn(cfg.validation_set)
+
     # Try to create reproducible results
     np.random.seed(cfg.initial_seed)
 
@@ -153,39 +311,346 @@ def train():
     utils.log_parameters(cfg.training, os.path.join(cfg.model_path,
                                                     'parameters.json'))
 
-    training.train(tr_x, tr_y, val_x, val_y)
+    if n_workers > 1:
+        import parallel
 
+        parallel.train(tr_x, tr_y, val_x, val_y, n_workers,
+                       sync_period=cfg.sync_period,
+                       n_threads=cfg.worker_threads,
+                       sed_metrics_fn=sed_metrics_fn,
+                       )
+    else:
+        training.train(tr_x, tr_y, val_x, val_y, sed_metrics_fn, resume)
 
-def predict(dataset):
-    """Generate predictions for audio tagging and sound event detection.
 
-    This function uses an ensemble of trained models to generate the
-    predictions, with the averaging function being an arithmetic mean.
-    Computed predictions are then saved to disk.
+def train_head(checkpoint_path):
+    """Train only the capsule head of a trained model.
+
+    The outputs of the trunk of the given checkpoint are cached for the
+    training and validation sets, and a head with the settings of
+    ``cfg.capsule_head`` is trained on them.
+
+    The checkpoints and history are written to the directories of the
+    current ``cfg.training_id``, which must not contain the results of
+    another run, e.g. that of the given checkpoint.
 
     Args:
-        dataset: Dataset to generate predictions for.
+        checkpoint_path (str): Path of the weights of a trained model.
+
+    See Also:
+        :func:`head_training.train_head`
+    """
+    import checkpointing
+    import head_training
+
+    # Refuse to overwrite the history and mix in the checkpoints of
+    # another run, as the best epochs are determined from these
+    if os.path.exists(cfg.history_path) or (
+            os.path.isdir(cfg.model_path)
+            and checkpointing.retained_epochs(cfg.model_path)):
+        raise ValueError('Training ID %r already has a training history '
+                         'or checkpoints; set a new training_id'
+                         % cfg.training_id)
+
+    # Ensure output directories exist
+    os.makedirs(cfg.model_path, exist_ok=True)
+    os.makedirs(cfg.log_path, exist_ok=True)
+
+    cache_dir = os.path.join(
+        cfg.trunk_cache_path,
+        os.path.splitext(os.path.basename(checkpoint_path))[0])
+
+    # Load (standardized) input data and compute the trunk outputs
+    tr_x, tr_y, _ = _load_data(cfg.training_set, is_training=True)
+    tr_z = utils.timeit(lambda: head_training.trunk_outputs(
+        checkpoint_path, tr_x, os.path.join(cache_dir, 'training.h5')),
+        'Computed trunk outputs of training dataset')
+    del tr_x
+
+    val_x, val_y, _ = _load_data(cfg.validation_set)
+    val_z = utils.timeit(lambda: head_training.trunk_outputs(
+        checkpoint_path, val_x, os.path.join(cache_dir, 'validation.h5')),
+        'Computed trunk outputs of validation dataset')
+    del val_x
+
+    sed_metrics_fn = None
+    if cfg.validate_sed:
+        sed_metrics_fn = _sed_metrics_fn(cfg.validation_set)
+
+    # Try to create reproducible results
+    np.random.seed(cfg.initial_seed)
+
+    # Save free parameters to disk
+    utils.log_parameters(cfg.training, os.path.join(cfg.model_path,
+                                                    'parameters.json'))
+
+    head_training.train_head(tr_z, tr_y, val_z, val_y, checkpoint_path,
+                             _input_shape(), sed_metrics_fn)
+
+
+def sweep(spec_path, n_parallel=2, n_threads=0):
+    """Train a model for each configuration of a hyperparameter sweep.
+
+    The standardized training and validation features are written to a
+    memory-mapped feature store, which is shared by the training runs.
+    A table comparing the results of the runs is printed and written to
+    ``results.csv`` in the output directory of the sweep.
+
+    Args:
+        spec_path (str): Path of the JSON specification of the sweep
+            (see :func:`sweeps.expand`).
+        n_parallel (int): Maximum number of concurrent training runs.
+        n_threads (int): Number of TensorFlow threads per run.
+
+    See Also:
+        :func:`sweeps.run`
+    """
+    import sweeps
+
+    with open(spec_path, 'r') as f:
+        spec = json.load(f)
+    runs = sweeps.expand(spec)
+    print('Sweep %s: %d runs' % (spec['name'], len(runs)))
+
+    def _arrays():
+        tr_x, tr_y, _ = _load_data(cfg.training_set, is_training=True)
+        val_x, val_y, _ = _load_data(cfg.validation_set)
+        return {'tr_x': tr_x, 'tr_y': tr_y, 'val_x': val_x, 'val_y': val_y}
+
+    sources = [os.path.join(cfg.extraction_path, dataset.name + '.h5')
+               for dataset in [cfg.training_set, cfg.validation_set]]
+    if os.path.exists(cfg.scaler_path):
+        sources.append(cfg.scaler_path)
+    settings = {'training_set': list(cfg.training_set),
+                'validation_set': list(cfg.validation_set),
+                'enable_augmentation': cfg.enable_augmentation,
+                }
+    if sweeps.write_feature_store(cfg.feature_store_path, _arrays,
+                                  sources, settings):
+        print('Wrote feature store to %s' % cfg.feature_store_path)
+
+    output_path = os.path.join(cfg.sweep_path, spec['name'])
+    summaries = sweeps.run(runs, cfg.feature_store_path, output_path,
+                           n_parallel, n_threads)
+
+    rows = sweeps.write_table(summaries,
+                              os.path.join(output_path, 'results.csv'))
+    widths = [max(len(str(row[i])) for row in rows) + 2
+              for i in range(len(rows[0]))]
+    for row in rows:
+        print(''.join(str(value).ljust(width)
+                      for value, width in zip(row, widths)))
+
+
+def compare(history_paths):
+    """Compare the time-to-accuracy of several training runs.
+
+    For each run, the epoch and time at which ``cfg.target_monitor``
+    first reached ``cfg.target_score`` are printed, along with the best
+    score, the number of training steps per second, and the speedup
+    relative to the first run.
+
+    Args:
+        history_paths (list): Paths of the CSV history files.
+
+    See Also:
+        :func:`parallel.time_to_target`
+    """
+    import parallel
+
+    mode = 'min' if cfg.target_monitor in ['val_loss', 'val_eer'] else 'max'
+    print('Target: %s = %s' % (cfg.target_monitor, cfg.target_score))
+    print('%-40s%-10s%-12s%-10s%-10s%-10s'
+          % ('Run', 'Epoch', 'Time (s)', 'Best', 'Steps/s', 'Speedup'))
+
+    reference = None
+    for path in history_paths:
+        epoch, elapsed, best, steps_per_sec = parallel.time_to_target(
+            path, cfg.target_monitor, cfg.target_score, mode)
+        if reference is None:
+            reference = elapsed
+
+        speedup = '-'
+        if elapsed is not None and reference is not None:
+            speedup = '%.2fx' % (reference / elapsed)
+        print('%-40s%-10s%-12s%-10.4f%-10s%-10s'
+              % (path, epoch or '-',
+                 '-' if elapsed is None else '%.1f' % elapsed, best,
+                 '-' if steps_per_sec is None else '%.2f' % steps_per_sec,
+                 speedup))
+
+
+def distill(variant):
+    """Train a compact variant of the network by distillation.
+
+    The predictions of the ensemble selected by ``cfg.prediction_epochs``
+    are computed for the training set and used as the targets of a model
+    with the architecture of ``cfg.model_variants[variant]``. The
+    checkpoints and training history are saved in the ``variant``
+    directory of ``cfg.student_path``.
+
+    Args:
+        variant (str): Name of the variant to train.
+
+    See Also:
+        :func:`distillation.train_student`
+    """
+    import distillation
+
+    # Ensure output directory exists
+    output_path = os.path.join(cfg.student_path, variant)
+    os.makedirs(output_path, exist_ok=True)
+
+    # Load (standardized) input data and target values
+    tr_x, tr_y, _ = _load_data(cfg.training_set, is_training=True)
+    val_x, val_y, _ = _load_data(cfg.validation_set)
+
+    # Compute the predictions of the ensemble for the training set
+    teacher = _load_ensemble()
+    teacher_at, teacher_sed = utils.timeit(
+        lambda: distillation.teacher_targets(
+            teacher, tr_x, _prediction_batch_size(teacher, tr_x.shape[1:])),
+        'Computed teacher predictions for training dataset')
+    del teacher
+
+    sed_metrics_fn = None
+    if cfg.validate_sed:
+        sed_metrics_fn = _sed_metrics_fn(cfg.validation_set)
+
+    # Try to create reproducible results
+    np.random.seed(cfg.initial_seed)
+
+    # Save free parameters to disk
+    utils.log_parameters(cfg.training, os.path.join(output_path,
+                                                    'parameters.json'))
+
+    distillation.train_student(tr_x, tr_y, val_x, val_y,
+                               teacher_at, teacher_sed, output_path,
+                               _variant_architecture(variant),
+                               sed_metrics_fn)
+
+
+def variants(dataset):
+    """Compare the compact variants of the network with the ensemble.
+
+    For the ensemble selected by ``cfg.prediction_epochs`` and for each
+    variant of ``cfg.model_variants`` that has been trained using
+    :func:`distill`, the number of floating point operations and
+    parameters, the CPU latency of predicting a single clip, and the
+    audio tagging and SED scores are printed.
+
+    Args:
+        dataset: Dataset used to evaluate the models.
+
+    See Also:
+        :func:`benchmarking.count_flops`
     """
+    import benchmarking
     import capsnet
+    import distillation
+
+    # Measure the latency on the CPU, as for deployment
+    cfg.visible_devices = ''
+
+    x, _, _ = _load_data(dataset)
+
+    models = OrderedDict([('Ensemble', _load_ensemble())])
+    for name in sorted(cfg.model_variants):
+        model = distillation.load_student(
+            os.path.join(cfg.student_path, name), _input_shape(),
+            len(utils.LABELS), _variant_architecture(name))
+        if model is None:
+            print("Skipping variant '%s' as it has not been trained"
+                  % name)
+        else:
+            models[name] = model
+
+    results = OrderedDict()
+    for name, model in models.items():
+        latency, _ = benchmarking.measure_latency(model.predict, x)
+        results[name] = OrderedDict([
+            ('MFLOPs', benchmarking.count_flops(model) / 1e6),
+            ('Params (K)', model.count_params() / 1e3),
+            ('Latency (ms)', latency * 1000),
+        ])
+
+        batch_size = _prediction_batch_size(model, x.shape[1:])
+        at_pred, sed_pred = capsnet.gccaps_predict(x, model, batch_size)
+        results[name].update(_compute_scores(dataset, at_pred, sed_pred))
+
+    print('Results for %s set:' % dataset.name)
+    _print_scores(results)
+
+
+def tune(dataset, folded=False, swa=False):
+    """Tune the prediction batch size for this machine.
+
+    The throughput of the selected models is measured for each batch
+    size in ``cfg.tuning_batch_sizes``, subject to the memory limit
+    ``cfg.tuning_memory_limit``, and the best batch size is cached. The
+    same is done for a single untrained model, as used by the validation
+    callbacks during training.
 
-    # Load (standardized) input data and associated file names
-    test_x, _, names = _load_data(dataset)
+    Args:
+        dataset: Dataset to draw input examples from.
+        folded (bool): Whether to tune the inference-optimized models
+            created by :func:`export`.
+        swa (bool): Whether to tune the single model created by
+            :func:`average` instead of the ensemble.
 
-    # Predict class probabilities for each model (epoch)
-    at_preds, sed_preds = [], []
+    See Also:
+        :func:`batch_tuning.tune_batch_size`
+    """
+    import batch_tuning
+    import capsnet
 
-    for epoch in _determine_epochs(cfg.prediction_epochs):
-        model = _load_model(epoch)
-        at_pred, sed_pred = utils.timeit(
-            lambda: capsnet.gccaps_predict(test_x, model),
-            '[Epoch %d] Predicted class probabilities' % epoch)
+    x, _, _ = _load_data(dataset)
+    x = x[:max(cfg.tuning_batch_sizes)]
+
+    memory_limit = cfg.tuning_memory_limit
+    if memory_limit is not None:
+        memory_limit *= 1024 ** 2
+
+    models = OrderedDict([
+        ('Prediction', _load_ensemble(folded, swa)),
+        ('Training', capsnet.gccaps(input_shape=_input_shape(),
+                                    n_classes=len(utils.LABELS),
+                                    **cfg.capsule_head)),
+    ])
+    for name, model in models.items():
+        best, results = batch_tuning.tune_batch_size(
+            lambda x, batch_size: model.predict(x, batch_size=batch_size),
+            x, cfg.tuning_batch_sizes, memory_limit)
+        batch_tuning.store(cfg.batch_size_cache_path, model, x.shape[1:],
+                           best)
+
+        print('%s model (best batch size: %d)' % (name, best))
+        for batch_size, (throughput, peak) in sorted(results.items()):
+            print('  %4d  %10.1f clips/s  %8.1f MB peak'
+                  % (batch_size, throughput, peak / 1024 ** 2))
+
+
+def predict(dataset, folded=False, swa=False, chunked=False):
+    """Generate predictions for audio tagging and sound event detection.
 
-        at_preds.append(at_pred)
-        sed_preds.append(sed_pred)
+    This function uses an ensemble of trained models to generate the
+    predictions, with the averaging function being an arithmetic mean.
+    Computed predictions are then saved to disk.
+
+    Args:
+        dataset: Dataset to generate predictions for.
+        folded (bool): Whether to use the inference-optimized models
+            created by :func:`export`.
+        swa (bool): Whether to use the single model created by
+            :func:`average` instead of the ensemble.
+        chunked (bool): Whether to read the input data in chunks and
+            write predictions incrementally (see
+            :func:`_predict_chunked`).
 
-    # Average predictions to give an overall output
-    total_at_pred = np.mean(at_preds, axis=0)
-    total_sed_pred = np.mean(sed_preds, axis=0)
+    See Also:
+        :func:`capsnet.gccaps_ensemble`
+    """
+    import capsnet
 
     # Ensure output directory exists and set file path format
     os.makedirs(os.path.dirname(cfg.predictions_path), exist_ok=True)
@@ -196,11 +661,614 @@ def predict(dataset):
                          os.path.join(os.path.dirname(cfg.predictions_path),
                                       'parameters.json'))
 
+    # Predict class probabilities, averaging the outputs of the models
+    # within the graph so that each batch is fed only once.
+    model = _load_ensemble(folded, swa)
+    if chunked:
+        _predict_chunked(dataset, model, key=_ensemble_key(folded, swa))
+        return
+
+    # Load (standardized) input data and associated file names
+    test_x, _, names = _load_data(dataset)
+    batch_size = _prediction_batch_size(model, test_x.shape[1:])
+    total_at_pred, total_sed_pred = utils.timeit(
+        lambda: capsnet.gccaps_predict(test_x, model, batch_size),
+        'Predicted class probabilities')
+
     # Write predictions to disk
     utils.write_predictions(names, total_at_pred, predictions_path % 'at')
     utils.write_predictions(names, total_sed_pred, predictions_path % 'sed')
 
 
+def detect(paths, output_path, folded=False, swa=False):
+    """Detect sound events in audio recordings of arbitrary length.
+
+    Each recording is split into overlapping windows with the same
+    duration as the clips the models were trained with, and the
+    predictions of the windows are merged (see
+    :func:`sliding_window.predict`). The feature vectors are referenced
+    and clipped per clip-length segment, as in training (see
+    :func:`_reference_segments`). The detected events are printed and
+    written to a file in the same format as the metadata files.
+
+    Args:
+        paths (list): Paths of the audio files.
+        output_path (str): Path of the output file.
+        folded (bool): Whether to use the inference-optimized models
+            created by :func:`export`.
+        swa (bool): Whether to use the single model created by
+            :func:`average` instead of the ensemble.
+    """
+    import librosa
+
+    import capsnet
+    import features
+    import inference
+    import sliding_window
+
+    extractor = features.LogmelExtractor(sample_rate=cfg.sample_rate,
+                                         n_window=cfg.n_window,
+                                         hop_length=cfg.hop_length,
+                                         n_mels=cfg.n_mels,
+                                         )
+    with open(cfg.scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+
+    model = _load_ensemble(folded, swa)
+
+    # Determine the window parameters in terms of feature vectors
+    window_length = _input_shape()[0]
+    ratio = window_length // model.output_shape[1][1]
+    hop_length = cfg.window_hop * cfg.sample_rate / cfg.hop_length
+    hop_length = max(int(round(hop_length / ratio)), 1) * ratio
+
+    threshold = _determine_threshold(cfg.at_threshold)
+    names, event_lists = [], []
+    for path in paths:
+        x = extractor.extract(*librosa.load(path, sr=None))
+        active = None
+        if cfg.skip_silence:
+            active = _activity_detector().process(x)
+        x = _standardize(_reference_segments(x, window_length), scaler,
+                         clip=False)
+        at_pred, sed_pred, ratio = utils.timeit(
+            lambda: sliding_window.predict(
+                x, lambda x: capsnet.gccaps_predict(x, model),
+                window_length, hop_length, batch_size=cfg.window_batch_size,
+                active=active),
+            'Predicted class probabilities for %s' % path)
+
+        # Determine the detected events and clip-level labels
+        y_pred_b = inference.binarize_predictions_3d(
+            sed_pred[None], threshold=_determine_threshold(cfg.sed_threshold),
+            n_dilation=cfg.sed_dilation, n_erosion=cfg.sed_erosion)
+        resolution = ratio * cfg.hop_length / cfg.sample_rate
+        events = inference.generate_event_lists(y_pred_b, resolution)[0]
+        labels = inference.binarize_predictions_2d(at_pred[None], threshold)
+
+        print('%s: %s' % (path, ', '.join(utils.LABELS[i] for i
+                                          in np.flatnonzero(labels[0]))))
+        for label, onset, offset in events:
+            print('  %8.2f %8.2f  %s' % (onset, offset, label))
+
+        names.append(os.path.basename(path))
+        event_lists.append(events)
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    utils.write_event_lists(names, event_lists, output_path)
+
+
+def stream(path, chunk_duration, folded=False, swa=False):
+    """Replay an audio recording through the streaming detector.
+
+    The recording is fed to a :class:`streaming.StreamingDetector` in
+    chunks, and the onsets and offsets are printed as they are emitted,
+    along with their end-to-end latency. The real-time factor and
+    latency statistics are printed at the end.
+
+    Args:
+        path (str): Path of the audio file.
+        chunk_duration (float): Duration of each chunk in seconds.
+        folded (bool): Whether to use the inference-optimized models
+            created by :func:`export`.
+        swa (bool): Whether to use the single model created by
+            :func:`average` instead of the ensemble.
+    """
+    import capsnet
+    import streaming
+
+    with open(cfg.scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+
+    model = _load_ensemble(folded, swa)
+
+    # Determine the window parameters in terms of feature vectors
+    window_length = _input_shape()[0]
+    ratio = window_length // model.output_shape[1][1]
+    hop_length = cfg.stream_hop * cfg.sample_rate / cfg.hop_length
+    hop_length = max(int(round(hop_length / ratio)), 1) * ratio
+
+    frontend = streaming.StreamingLogmel(sample_rate=cfg.sample_rate,
+                                         n_window=cfg.n_window,
+                                         hop_length=cfg.hop_length,
+                                         n_mels=cfg.n_mels,
+                                         )
+    detector = streaming.StreamingDetector(
+        lambda x: capsnet.gccaps_predict(x, model),
+        frontend, scaler, window_length, hop_length, ratio,
+        resolution=ratio * cfg.hop_length / cfg.sample_rate,
+        latency=cfg.stream_latency,
+        threshold=_determine_threshold(cfg.sed_threshold),
+        n_dilation=cfg.sed_dilation,
+        n_erosion=cfg.sed_erosion,
+        activity=_activity_detector() if cfg.skip_silence else None,
+    )
+
+    emitted, stats = streaming.replay(path, detector, cfg.sample_rate,
+                                      chunk_duration)
+
+    for kind, label, time, latency in emitted:
+        print('%8.2f  %-6s  %-26s (latency: %.2f s)'
+              % (time, kind, label, latency))
+
+    print('\nReal-time factor: %.3f' % stats['rtf'])
+    print('Latency (mean/p50/p99/max): %.2f/%.2f/%.2f/%.2f s'
+          % (stats['latency_mean'], stats['latency_p50'],
+             stats['latency_p99'], stats['latency_max']))
+    print('Chunk processing time (p99): %.1f ms'
+          % (stats['chunk_time_p99'] * 1000))
+    print('Windows skipped: %.1f%%' % (stats['skipped'] * 100))
+
+
+def serve(host, port, folded=False, swa=False):
+    """Serve predictions over HTTP until interrupted.
+
+    Requests are grouped into micro-batches of up to
+    ``cfg.server_max_batch_size`` clips (see :mod:`server`).
+
+    Args:
+        host (str): Host name or address to listen on.
+        port (int): Port to listen on.
+        folded (bool): Whether to use the inference-optimized models
+            created by :func:`export`.
+        swa (bool): Whether to use the single model created by
+            :func:`average` instead of the ensemble.
+    """
+    httpd = _inference_server((host, port), cfg.server_max_batch_size,
+                              cfg.server_max_wait,
+                              _inference_functions(folded, swa))
+
+    print('Serving predictions on http://%s:%d' % httpd.server_address[:2])
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        httpd.batcher.close()
+
+
+def loadtest(dataset, folded=False, swa=False):
+    """Measure the throughput of the inference server under load.
+
+    A server is started locally for each combination of the batching
+    parameters ``cfg.loadtest_batch_sizes`` and
+    ``cfg.loadtest_max_waits``, and concurrent requests containing the
+    logmel features of the dataset are sent to it. The throughput,
+    latency and mean batch size of each configuration are printed.
+
+    Args:
+        dataset: Dataset to draw request payloads from.
+        folded (bool): Whether to use the inference-optimized models
+            created by :func:`export`.
+        swa (bool): Whether to use the single model created by
+            :func:`average` instead of the ensemble.
+    """
+    import threading
+
+    import features
+    import server
+
+    features_path = os.path.join(cfg.extraction_path, dataset.name + '.h5')
+    x = features.load_features(features_path)
+    payloads = [{'logmel': example.tolist()} for example
+                in x[:cfg.loadtest_concurrency]]
+
+    # The models are loaded once and shared by every configuration
+    functions = _inference_functions(folded, swa)
+
+    results = OrderedDict()
+    for max_batch_size in cfg.loadtest_batch_sizes:
+        for max_wait in cfg.loadtest_max_waits:
+            httpd = _inference_server(('127.0.0.1', 0), max_batch_size,
+                                      max_wait, functions)
+            thread = threading.Thread(target=httpd.serve_forever)
+            thread.start()
+
+            url = 'http://127.0.0.1:%d/predict' % httpd.server_address[1]
+            stats = server.generate_load(url, payloads,
+                                         cfg.loadtest_n_requests,
+                                         cfg.loadtest_concurrency)
+            metrics = httpd.batcher.metrics()
+
+            httpd.shutdown()
+            httpd.server_close()
+            httpd.batcher.close()
+            thread.join()
+
+            n_batches = sum(metrics['batch_sizes'].values())
+            name = 'batch=%d, wait=%gms' % (max_batch_size, max_wait * 1000)
+            results[name] = OrderedDict([
+                ('Requests/s', stats['throughput']),
+                ('p50 (ms)', stats['latency_p50'] * 1000),
+                ('p99 (ms)', stats['latency_p99'] * 1000),
+                ('Mean batch', metrics['n_examples'] / n_batches),
+            ])
+
+    _print_scores(results)
+
+
+def cascade(dataset):
+    """Compare cascaded SED post-processing with the full version.
+
+    The predictions generated by :func:`predict` are post-processed with
+    and without gating by the audio tagging predictions, for each
+    gating threshold in ``cfg.cascade_thresholds``. The SED scores, the
+    post-processing time, and the fraction of clip-class pairs that are
+    skipped are printed for each.
+
+    Args:
+        dataset: Dataset to evaluate predictions of.
+
+    See Also:
+        :func:`inference.cascade_gate`
+    """
+    import time
+
+    import evaluation
+
+    names, ground_truth = utils.read_metadata(dataset.metadata_path,
+                                              weakly_labeled=False)
+    _, sed_pred = _read_predictions('sed', dataset)
+
+    results = OrderedDict()
+    for threshold in [None] + cfg.cascade_thresholds:
+        gate = None
+        if threshold is not None:
+            gate = _cascade_gate(dataset, threshold)
+
+        onset = time.time()
+        predictions = _generate_event_lists(sed_pred, gate)
+        duration = time.time() - onset
+
+        metrics = evaluation.evaluate_sed(ground_truth, predictions, names)
+        overall = metrics.results_overall_metrics()
+
+        name = 'No gating' if gate is None else 'Gate > %g' % threshold
+        results[name] = OrderedDict([
+            ('SED F1', overall['f_measure']['f_measure']),
+            ('SED ER', overall['error_rate']['error_rate']),
+            ('Time (s)', duration),
+            ('Skipped', 0. if gate is None else 1 - gate.mean()),
+        ])
+
+    _print_scores(results)
+
+
+def export(export_numpy=False):
+    """Export inference-optimized versions of the prediction models.
+
+    Batch normalization is folded into neighbouring layers and dropout
+    is removed for each model selected by ``cfg.prediction_epochs``. As
+    a sanity check, the outputs of the original and optimized models
+    are compared for a batch of random inputs.
+
+    Args:
+        export_numpy (bool): Whether to also export the optimized models
+            for use with the NumPy inference engine.
+
+    See Also:
+        :func:`folding.fold_batch_norm`,
+        :func:`numpy_inference.export_model`
+    """
+    import capsnet
+    import folding
+    import numpy_inference
+
+    os.makedirs(cfg.export_path, exist_ok=True)
+
+    for epoch in _determine_epochs(cfg.prediction_epochs):
+        model = _load_model(epoch)
+        folded = utils.timeit(lambda: folding.fold_batch_norm(model),
+                              '[Epoch %d] Folded batch normalization' % epoch)
+
+        # Compare outputs of the original and folded models
+        x = np.random.randn(8, *model.input_shape[1:])
+        error = max(np.abs(pred - folded_pred).max() for pred, folded_pred
+                    in zip(capsnet.gccaps_predict(x, model),
+                           capsnet.gccaps_predict(x, folded)))
+        print('[Epoch %d] Parameters: %d -> %d, maximum output error: %g'
+              % (epoch, model.count_params(), folded.count_params(), error))
+
+        folded.save(_export_model_path(epoch), include_optimizer=False)
+        if export_numpy:
+            numpy_inference.export_model(folded, _numpy_model_path(epoch))
+
+
+def average(dataset):
+    """Create a single model by averaging the weights of the ensemble.
+
+    The weights of the models selected by ``cfg.prediction_epochs`` are
+    averaged, as in stochastic weight averaging (SWA), after which the
+    batch norm statistics are recomputed using a random subset of the
+    training set. The averaged model is saved to disk, and its scores
+    are printed next to the scores of the ensemble it replaces.
+
+    Args:
+        dataset: Dataset used to compare the averaged model with the
+            ensemble.
+
+    See Also:
+        :func:`averaging.average_weights`
+    """
+    import averaging
+    import capsnet
+
+    epochs = _determine_epochs(cfg.prediction_epochs)
+    _model_registry().reserve(len(epochs))
+    models = [_load_model(epoch) for epoch in epochs]
+
+    # Create a new model instance with the averaged weights
+    model = capsnet.gccaps(input_shape=_input_shape(),
+                           n_classes=len(utils.LABELS),
+                           multi_output=True,
+                           **cfg.capsule_head
+                           )
+    model.set_weights(averaging.average_weights(models))
+
+    # Recompute batch norm statistics using a subset of the training set
+    tr_x, _, _ = _load_data(cfg.training_set)
+    n_examples = min(cfg.bn_n_examples, len(tr_x))
+    indexes = np.random.RandomState(cfg.initial_seed).choice(
+        len(tr_x), n_examples, replace=False)
+    utils.timeit(lambda: averaging.recompute_batch_norm(model, tr_x[indexes]),
+                 'Recomputed batch norm statistics')
+    del tr_x
+
+    model.save(_swa_model_path(), include_optimizer=False)
+
+    # Compare the averaged model with the ensemble
+    x, _, _ = _load_data(dataset)
+    ensemble = capsnet.gccaps_ensemble(models)
+    at_pred, sed_pred = capsnet.gccaps_predict(x, ensemble)
+
+    _print_scores(OrderedDict([
+        ('Ensemble (%d models)' % len(models),
+         _compute_scores(dataset, at_pred, sed_pred)),
+        ('SWA', _compute_scores(dataset, *capsnet.gccaps_predict(x, model))),
+    ]))
+
+
+def quantize(dataset):
+    """Quantize the exported prediction models to 8-bit integers.
+
+    Each model selected by ``cfg.prediction_epochs`` must have been
+    exported for the NumPy inference engine using :func:`export`. The
+    models are calibrated using a random subset of the validation set.
+    For each model, the scores, file size and CPU performance of the
+    original model are printed next to those of the quantized model,
+    both with 32-bit and with simulated 8-bit activations. The weights
+    are dequantized when loaded, so only the file size is reduced (see
+    :func:`numpy_inference.load_model`).
+
+    Args:
+        dataset: Dataset used to evaluate the quantized models.
+
+    See Also:
+        :func:`quantization.quantize_model`
+    """
+    import benchmarking
+    import numpy_inference
+    import quantization
+
+    # Select a random subset of the validation set for calibration
+    val_x, _, _ = _load_data(cfg.validation_set)
+    n_examples = min(cfg.calibration_n_examples, len(val_x))
+    indexes = np.random.RandomState(cfg.initial_seed).choice(
+        len(val_x), n_examples, replace=False)
+    calibration_x = val_x[indexes]
+    del val_x
+
+    x, _, _ = _load_data(dataset)
+
+    for epoch in _determine_epochs(cfg.prediction_epochs):
+        model_path = _numpy_model_path(epoch)
+        output_path = _numpy_model_path(epoch, quantized=True)
+        utils.timeit(lambda: quantization.quantize_model(
+            model_path, calibration_x, output_path),
+            '[Epoch %d] Quantized model' % epoch)
+
+        models = OrderedDict([
+            ('float32', numpy_inference.load_model(model_path)),
+            ('int8 weights', numpy_inference.load_model(output_path)),
+            ('int8 (simulated)', numpy_inference.load_model(
+                output_path, quantize_activations=True)),
+        ])
+        sizes = [os.path.getsize(model_path), os.path.getsize(output_path),
+                 os.path.getsize(output_path)]
+
+        # Compute the scores and the CPU performance of each variant
+        results = OrderedDict()
+        engines = OrderedDict()
+        for name, model in models.items():
+            results[name] = _compute_scores(
+                dataset, *numpy_inference.gccaps_predict(x, model))
+            engines[name] = (functools.partial(numpy_inference.gccaps_predict,
+                                               model=model), None)
+
+        performance = benchmarking.compare_engines(engines, x)
+        for (name, scores), size in zip(results.items(), sizes):
+            scores['Size (MB)'] = size / 2 ** 20
+            scores['Latency (ms)'] = performance[name]['Latency (ms)']
+            scores['Clips/s'] = performance[name]['Clips/s']
+
+        print('[Epoch %d] Results for %s set:' % (epoch, dataset.name))
+        _print_scores(results)
+
+
+def benchmark(engine, dataset):
+    """Benchmark an alternative inference engine against Keras.
+
+    The first model selected by ``cfg.prediction_epochs`` is used, which
+    must have been exported using :func:`export`. The outputs of the two
+    engines are compared, and the startup time, per-clip latency and
+    throughput of each engine are printed.
+
+    Args:
+        engine (str): Name of the inference engine. The only supported
+            engine is ``'numpy'`` (see :mod:`numpy_inference`).
+        dataset: Dataset to draw input examples from.
+    """
+    import benchmarking
+    import capsnet
+    import numpy_inference
+
+    epoch = _determine_epochs(cfg.prediction_epochs)[0]
+    x, _, _ = _load_data(dataset)
+
+    keras_model = _load_model(epoch, folded=True)
+    keras_startup = '\n'.join([
+        'import numpy as np',
+        'import registry',
+        'model = registry.ModelRegistry().get(%r, input_shape=%r, '
+        'n_classes=%d, folded=True, multi_output=True)'
+        % (_export_model_path(epoch), _input_shape(), len(utils.LABELS)),
+        'model.predict(np.zeros((1,) + %r))' % (_input_shape(),),
+    ])
+
+    numpy_model = numpy_inference.load_model(_numpy_model_path(epoch))
+    numpy_startup = '\n'.join([
+        'import numpy as np',
+        'import numpy_inference',
+        'model = numpy_inference.load_model(%r)' % _numpy_model_path(epoch),
+        'model.predict(np.zeros((1,) + %r))' % (_input_shape(),),
+    ])
+
+    # Check that the outputs of the engines match
+    error = max(np.abs(pred - numpy_pred).max() for pred, numpy_pred
+                in zip(capsnet.gccaps_predict(x, keras_model),
+                       numpy_inference.gccaps_predict(x, numpy_model)))
+    print('Maximum difference between Keras and NumPy outputs: %g' % error)
+    if error > cfg.engine_tolerance:
+        print('Warning: Difference exceeds tolerance of %g'
+              % cfg.engine_tolerance)
+
+    _print_scores(benchmarking.compare_engines(OrderedDict([
+        ('Keras', (lambda x: capsnet.gccaps_predict(x, keras_model),
+                   keras_startup)),
+        ('NumPy', (lambda x: numpy_inference.gccaps_predict(x, numpy_model),
+                   numpy_startup)),
+    ]), x))
+
+
+def benchmark_checkpointing():
+    """Benchmark training with and without gradient checkpointing.
+
+    For each batch size in ``cfg.gradient_checkpointing_batch_sizes``,
+    the duration of a training step, the throughput and the peak memory
+    usage are printed, along with the compute overhead of checkpointing.
+
+    See Also:
+        :func:`benchmarking.measure_training_step`
+    """
+    import benchmarking
+
+    results = OrderedDict()
+    for batch_size in cfg.gradient_checkpointing_batch_sizes:
+        baseline = None
+        for checkpoint in [False, True]:
+            duration, peak = benchmarking.measure_training_step(
+                _input_shape(), len(utils.LABELS), batch_size, checkpoint)
+            baseline = baseline or duration
+
+            name = 'Batch %d%s' % (batch_size,
+                                   ' (checkpoint)' if checkpoint else '')
+            results[name] = OrderedDict([
+                ('Step (ms)', duration * 1000),
+                ('Clips/s', batch_size / duration),
+                ('Peak (MB)', peak / 1024 ** 2),
+                ('Overhead (%)', (duration / baseline - 1) * 100),
+            ])
+
+    _print_scores(results)
+
+
+def benchmark_silence(dataset):
+    """Benchmark long-audio inference with and without silence skipping.
+
+    The clips of the dataset are concatenated into a single recording,
+    which is processed using :func:`sliding_window.predict` with and
+    without skipping inactive windows. The throughput in hours of audio
+    per hour, the fraction of windows skipped, and the largest
+    difference between the SED predictions are printed.
+
+    Args:
+        dataset: Dataset whose clips are concatenated.
+    """
+    import time
+
+    import capsnet
+    import features
+    import sliding_window
+
+    features_path = os.path.join(cfg.extraction_path, dataset.name + '.h5')
+    x = features.load_features(features_path)
+    x = x.reshape((-1, x.shape[-1]))
+
+    with open(cfg.scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+
+    model = _load_ensemble()
+
+    window_length = _input_shape()[0]
+    ratio = window_length // model.output_shape[1][1]
+    hop_length = cfg.window_hop * cfg.sample_rate / cfg.hop_length
+    hop_length = max(int(round(hop_length / ratio)), 1) * ratio
+    n_windows = 1 + int(np.ceil(max(len(x) - window_length, 0)
+                                / hop_length))
+    duration = len(x) * cfg.hop_length / cfg.sample_rate
+
+    results = OrderedDict()
+    sed_preds = []
+    for skip in [False, True]:
+        active = None
+        n_active = n_windows
+        onset = time.time()
+        if skip:
+            active = _activity_detector().process(x)
+            n_active = sum(active[i:i + window_length].any() for i
+                           in range(0, n_windows * hop_length, hop_length))
+        _, sed_pred, _ = sliding_window.predict(
+            _standardize(x, scaler),
+            lambda x: capsnet.gccaps_predict(x, model),
+            window_length, hop_length, batch_size=cfg.window_batch_size,
+            active=active)
+        elapsed = time.time() - onset
+
+        sed_preds.append(sed_pred)
+        name = 'Skipping on' if skip else 'Skipping off'
+        results[name] = OrderedDict([
+            ('Audio (h)', duration / 3600),
+            ('Time (s)', elapsed),
+            ('Speed (x RT)', duration / elapsed),
+            ('Skipped', 1 - n_active / n_windows),
+        ])
+
+    _print_scores(results)
+    print('Maximum difference between SED predictions: %g'
+          % np.abs(sed_preds[0] - sed_preds[1]).max())
+
+
 def evaluate_audio_tagging(dataset, compute_thresholds=False):
     """Evaluate the audio tagging predictions and write results.
 
@@ -215,8 +1283,7 @@ def evaluate_audio_tagging(dataset, compute_thresholds=False):
     import evaluation
 
     _, y_true = utils.read_metadata(dataset.metadata_path)
-    path = cfg.predictions_path.format('at', dataset.name)
-    _, y_pred = utils.read_predictions(path)
+    _, y_pred = _read_predictions('at', dataset)
 
     # Compute thresholds if flag is set
     if compute_thresholds:
@@ -244,23 +1311,18 @@ def evaluate_sed(dataset):
         dataset: Dataset for retrieving ground truth.
     """
     import evaluation
-    import inference
 
     names, ground_truth = utils.read_metadata(dataset.metadata_path,
                                               weakly_labeled=False)
 
-    # Load and binarize predictions
-    path = cfg.predictions_path.format('sed', dataset.name)
-    _, y_pred = utils.read_predictions(path)
-    threshold = _determine_threshold(cfg.sed_threshold)
-    y_pred_b = inference.binarize_predictions_3d(y_pred,
-                                                 threshold=threshold,
-                                                 n_dilation=cfg.sed_dilation,
-                                                 n_erosion=cfg.sed_erosion)
+    # Load predictions and convert to event list format
+    _, y_pred = _read_predictions('sed', dataset)
+    gate = None
+    if cfg.sed_gate_threshold is not None:
+        gate = _cascade_gate(dataset, cfg.sed_gate_threshold)
+    predictions = _generate_event_lists(y_pred, gate)
 
-    # Convert to event list format and evaluate SED performance
-    resolution = cfg.clip_duration / y_pred.shape[2]
-    predictions = inference.generate_event_lists(y_pred_b, resolution)
+    # Evaluate SED performance
     metrics = evaluation.evaluate_sed(ground_truth, predictions, names)
 
     # Ensure output directory exist and write results
@@ -271,6 +1333,239 @@ def evaluate_sed(dataset):
         f.write(metrics.result_report_class_wise())
 
 
+def _generate_event_lists(y_pred, gate=None):
+    """Binarize SED predictions and convert them to event lists.
+
+    Args:
+        y_pred (np.ndarray): 3D array of SED predictions.
+        gate (np.ndarray): 2D boolean array specifying which classes of
+            each clip to process (see :func:`inference.cascade_gate`).
+
+    Returns:
+        list: A list of event lists.
+
+    See Also:
+        :func:`inference.generate_event_lists`
+    """
+    import inference
+
+    threshold = _determine_threshold(cfg.sed_threshold)
+    y_pred_b = inference.binarize_predictions_3d(y_pred,
+                                                 threshold=threshold,
+                                                 n_dilation=cfg.sed_dilation,
+                                                 n_erosion=cfg.sed_erosion,
+                                                 gate=gate)
+
+    resolution = cfg.clip_duration / y_pred.shape[2]
+    return inference.generate_event_lists(y_pred_b, resolution)
+
+
+def _cascade_gate(dataset, threshold):
+    """Gate SED post-processing using saved audio tagging predictions.
+
+    Args:
+        dataset: Dataset that the predictions were generated for.
+        threshold (float): Clip-level gating threshold.
+
+    Returns:
+        np.ndarray: 2D boolean array of clip-class pairs to process.
+
+    See Also:
+        :func:`inference.cascade_gate`
+    """
+    import inference
+
+    _, at_pred = _read_predictions('at', dataset)
+    return inference.cascade_gate(at_pred, threshold)
+
+
+def _sed_metrics_fn(dataset):
+    """Create a function that computes the SED scores of a dataset.
+
+    Args:
+        dataset: Dataset for retrieving ground truth.
+
+    Returns:
+        A function that returns a dict containing the segment-based F1
+        score and error rate of the given SED predictions.
+
+    See Also:
+        :class:`training.ValidationLogger`
+    """
+    import evaluation
+
+    names, ground_truth = utils.read_metadata(dataset.metadata_path,
+                                              weakly_labeled=False)
+
+    def _compute(sed_pred):
+        predictions = _generate_event_lists(sed_pred)
+        metrics = evaluation.evaluate_sed(ground_truth, predictions, names)
+        overall = metrics.results_overall_metrics()
+        return {'val_sed_f1': overall['f_measure']['f_measure'],
+                'val_sed_er': overall['error_rate']['error_rate'],
+                }
+
+    return _compute
+
+
+def _compute_scores(dataset, at_pred, sed_pred):
+    """Compute the main audio tagging and SED scores of predictions.
+
+    Args:
+        dataset: Dataset for retrieving ground truth.
+        at_pred (np.ndarray): 2D array of audio tagging predictions.
+        sed_pred (np.ndarray): 3D array of SED predictions.
+
+    Returns:
+        OrderedDict: The micro-averaged audio tagging F1 score,
+        precision and recall, and the segment-based SED F1 score and
+        error rate.
+    """
+    import evaluation
+
+    _, y_true = utils.read_metadata(dataset.metadata_path)
+    names, ground_truth = utils.read_metadata(dataset.metadata_path,
+                                              weakly_labeled=False)
+
+    threshold = _determine_threshold(cfg.at_threshold)
+    _, _, micro_scores = evaluation.evaluate_audio_tagging(
+        y_true, at_pred, threshold=threshold)
+
+    predictions = _generate_event_lists(sed_pred)
+    metrics = evaluation.evaluate_sed(ground_truth, predictions, names)
+    overall = metrics.results_overall_metrics()
+
+    return OrderedDict([('AT F1', micro_scores[0]),
+                        ('AT Precision', micro_scores[1]),
+                        ('AT Recall', micro_scores[2]),
+                        ('SED F1', overall['f_measure']['f_measure']),
+                        ('SED ER', overall['error_rate']['error_rate']),
+                        ])
+
+
+def _print_scores(results):
+    """Print the scores of several sets of predictions as a table.
+
+    Args:
+        results (OrderedDict): Mapping from a description of each set
+            of predictions to its scores (see :func:`_compute_scores`).
+    """
+    header = list(next(iter(results.values())))
+    print('%-24s' % '' + ''.join('%-14s' % name for name in header))
+    for description, scores in results.items():
+        print('%-24s' % description
+              + ''.join('%-14.4f' % score for score in scores.values()))
+
+
+def _predict_chunked(dataset, model, key):
+    """Generate predictions chunk by chunk, writing them incrementally.
+
+    The feature vectors are read from the feature store in chunks of
+    ``cfg.predict_chunk_size`` examples with read-ahead, so only a few
+    chunks are held in memory at once. The dynamic range is clipped to
+    90 dB below 0 dB, which is the maximum of every clip, as the clips
+    are referenced to their own maximum when they are extracted.
+
+    The predictions of each chunk are written to an HDF5 file along
+    with the number of examples predicted so far. If the function is
+    interrupted, the next call with the same `key` resumes from there.
+    This file takes the place of the pickle files written by
+    :func:`predict` (see :func:`_read_predictions`). Once all examples
+    are predicted, the CSV files of the predictions are written from
+    the HDF5 file a chunk at a time.
+
+    Args:
+        dataset: Dataset to generate predictions for.
+        model: Keras model used to generate predictions.
+        key (str): Description of the model. Partial results are only
+            reused if the key matches.
+    """
+    import h5py
+    from tqdm import tqdm
+
+    import capsnet
+    import features
+
+    names, _ = utils.read_metadata(dataset.metadata_path)
+    features_path = os.path.join(cfg.extraction_path, dataset.name + '.h5')
+    with open(cfg.scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+
+    # Remove any predictions written by a previous call of predict, so
+    # that they are not mistaken for the predictions of this call
+    predictions_path = cfg.predictions_path.format('%s', dataset.name)
+    for kind in ['at', 'sed']:
+        if os.path.exists(predictions_path % kind):
+            os.remove(predictions_path % kind)
+
+    batch_size = _prediction_batch_size(model, _input_shape())
+    output_path = cfg.prediction_store_path.format(dataset.name)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    n_classes, n_steps = len(utils.LABELS), model.output_shape[1][1]
+    with h5py.File(output_path, 'a') as f:
+        # Discard partial results that were computed differently
+        if f.attrs.get('key') != key:
+            for name in list(f):
+                del f[name]
+            f.attrs['key'] = key
+            f.attrs['n_done'] = 0
+
+        at_pred = f.require_dataset('at', (len(names), n_classes),
+                                    dtype=np.float32)
+        sed_pred = f.require_dataset('sed', (len(names), n_classes, n_steps),
+                                     dtype=np.float32)
+
+        start = int(f.attrs['n_done'])
+        if start > 0:
+            print('Resuming from example %d of %d' % (start, len(names)))
+
+        with tqdm(total=len(names), initial=start) as progress:
+            for i, x in features.iterate_features(features_path,
+                                                  cfg.predict_chunk_size,
+                                                  start,
+                                                  cfg.predict_read_ahead):
+                x = utils.standardize(np.maximum(x, -90.0), scaler)
+                at_pred[i:i + len(x)], sed_pred[i:i + len(x)] = \
+                    capsnet.gccaps_predict(x, model, batch_size)
+
+                # Record progress only once the chunk has been written
+                f.attrs['n_done'] = i + len(x)
+                f.flush()
+                progress.update(len(x))
+
+        for kind, preds in [('at', at_pred), ('sed', sed_pred)]:
+            utils.write_predictions_to_csv(
+                names, preds, (predictions_path % kind)[:-1] + 'csv',
+                chunk_size=cfg.predict_chunk_size)
+
+
+def _read_predictions(kind, dataset):
+    """Read the predictions of a dataset generated by :func:`predict`.
+
+    The predictions are read from the pickle file if there is one, or
+    else from the HDF5 file written by :func:`_predict_chunked`.
+
+    Args:
+        kind (str): Type of predictions, either ``'at'`` or ``'sed'``.
+        dataset: Dataset that the predictions were generated for.
+
+    Returns:
+        tuple: The file names and the array of predictions.
+    """
+    import h5py
+
+    path = cfg.predictions_path.format(kind, dataset.name)
+    if os.path.exists(path):
+        return utils.read_predictions(path)
+
+    names, _ = utils.read_metadata(dataset.metadata_path)
+    with h5py.File(cfg.prediction_store_path.format(dataset.name), 'r') as f:
+        if f.attrs['n_done'] < len(names):
+            raise ValueError('Chunked predictions of %s are incomplete'
+                             % dataset.name)
+        return names, f[kind][()]
+
+
 def _load_data(dataset, is_training=False):
     """Load input data, target values and file names for a dataset.
 
@@ -312,7 +1607,7 @@ def _load_data(dataset, is_training=False):
         with open(scaler_path, 'wb') as f:
             pickle.dump(scaler, f)
 
-    x = utils.timeit(lambda: utils.standardize(x, scaler),
+    x = utils.timeit(lambda: _standardize(x, scaler, clip=False),
                      'Standardized %s features' % dataset.name)
 
     names, y = utils.timeit(lambda: utils.read_metadata(dataset.metadata_path),
@@ -323,6 +1618,48 @@ def _load_data(dataset, is_training=False):
     return x, y, names
 
 
+def _standardize(x, scaler, clip=True):
+    """Standardize feature vectors using the given scaler.
+
+    Args:
+        x (np.ndarray): Array of feature vectors.
+        scaler (StandardScaler): Scaler used for transformation.
+        clip (bool): Whether to first clip the dynamic range of the
+            feature vectors to 90 dB.
+
+    Returns:
+        np.ndarray: The standardized feature vectors.
+    """
+    if clip:
+        x = np.maximum(x, x.max() - 90.0)
+
+    return utils.standardize(x, scaler)
+
+
+def _reference_segments(x, segment_length):
+    """Reference each clip-length segment of a recording to its maximum.
+
+    The training clips are referenced to their own maximum and clipped
+    to a dynamic range of 90 dB (see :func:`_standardize`). Applying the
+    same to each segment of a long recording, rather than to the entire
+    recording, ensures that quiet parts of the recording are scaled as
+    they would be in a clip of their own.
+
+    Args:
+        x (np.ndarray): 2D array of logmel feature vectors in decibels.
+        segment_length (int): Number of feature vectors in a segment.
+
+    Returns:
+        np.ndarray: The referenced and clipped feature vectors.
+    """
+    x = np.array(x)
+    for i in range(0, len(x), segment_length):
+        segment = x[i:i + segment_length]
+        segment -= segment.max()
+        np.maximum(segment, -90.0, out=segment)
+    return x
+
+
 def _determine_epochs(spec, n=5):
     """Return a list of epoch numbers based on the given argument.
 
@@ -330,7 +1667,9 @@ def _determine_epochs(spec, n=5):
     Otherwise, `spec` should be a string, in which case this function
     returns the top `n` epochs based on the training history file
     and the contents of `spec`. For example, if `spec` is ``'val_acc'``,
-    the epochs that achieved the highest accuracy are returned.
+    the epochs that achieved the highest accuracy are returned. Only
+    epochs for which a checkpoint was retained are considered (see
+    :class:`checkpointing.CheckpointManager`).
 
     Args:
         spec: A list of epoch numbers or a string specifying how to
@@ -342,8 +1681,12 @@ def _determine_epochs(spec, n=5):
     if type(spec) is list:
         return spec
 
+    import checkpointing
+
     history = utils.read_training_history(cfg.history_path, ordering=spec)
-    return [int(epoch) + 1 for epoch, *_ in history[:n]]
+    retained = checkpointing.retained_epochs(cfg.model_path)
+    epochs = [int(epoch) + 1 for epoch, *_ in history]
+    return [epoch for epoch in epochs if epoch in retained][:n]
 
 
 def _determine_threshold(threshold, clip_min=0.1, clip_max=0.9):
@@ -375,29 +1718,335 @@ def _determine_threshold(threshold, clip_min=0.1, clip_max=0.9):
         return np.clip(thresholds, clip_min, clip_max)
 
 
-def _load_model(epoch):
+def _load_ensemble(folded=False, swa=False):
+    """Load the models used for prediction as a single model.
+
+    Args:
+        folded (bool): Whether to load the inference-optimized models
+            created by :func:`export`.
+        swa (bool): Whether to load the single model created by
+            :func:`average` instead of the ensemble.
+
+    Returns:
+        A Keras model that outputs the averaged predictions of the
+        models (see :func:`capsnet.gccaps_ensemble`).
+    """
+    import capsnet
+
+    if swa:
+        models = [_load_model_file(_swa_model_path())]
+    else:
+        epochs = _determine_epochs(cfg.prediction_epochs)
+        _model_registry().reserve(len(epochs))
+        models = [_load_model(epoch, folded) for epoch in epochs]
+    _print_registry_stats()
+
+    return capsnet.gccaps_ensemble(models)
+
+
+def _load_model(epoch, folded=False):
     """Load model based on specified epoch number.
 
     Args:
         epoch (int): Epoch number of the model to load.
+        folded (bool): Whether to load the inference-optimized model
+            created by :func:`export` instead of the original model.
 
     Returns:
         An instance of a Keras model.
     """
-    import keras.models
+    return _load_model_file(_model_path(epoch, folded), folded)
+
+
+def _model_path(epoch, folded=False):
+    """Return the path of the model file of an epoch.
+
+    Args:
+        epoch (int): Epoch number of the model.
+        folded (bool): Whether to return the path of the
+            inference-optimized model created by :func:`export`.
+
+    Returns:
+        str: Path of the model file.
+    """
+    if folded:
+        return _export_model_path(epoch)
+    return glob.glob(os.path.join(cfg.model_path,
+                                  'gccaps.%.02d-*.hdf5' % epoch))[0]
+
+
+def _ensemble_key(folded=False, swa=False):
+    """Return a key that identifies the models used for prediction.
+
+    The key consists of the path and modification time of each model
+    file loaded by :func:`_load_ensemble`, so it changes when different
+    models are selected or when the models are retrained.
+
+    Args:
+        folded (bool): Whether the inference-optimized models are used.
+        swa (bool): Whether the averaged model is used.
+
+    Returns:
+        str: The key.
+    """
+    if swa:
+        paths = [_swa_model_path()]
+    else:
+        paths = [_model_path(epoch, folded)
+                 for epoch in _determine_epochs(cfg.prediction_epochs)]
+    return repr([(path, os.path.getmtime(path)) for path in paths])
+
+
+def _load_model_file(model_path, folded=False):
+    """Load model from the specified file.
+
+    The model is retrieved from the model registry, which builds the
+    graph of the architecture and loads only the weights from the file.
+
+    Args:
+        model_path (str): Path of the model (or weights) file.
+        folded (bool): Whether the file is of an inference-optimized
+            model created by :func:`export`.
+
+    Returns:
+        An instance of a Keras model with both audio tagging and
+        localization outputs.
+
+    See Also:
+        :class:`registry.ModelRegistry`
+    """
+    return _model_registry().get(model_path,
+                                 input_shape=_input_shape(),
+                                 n_classes=len(utils.LABELS),
+                                 folded=folded,
+                                 multi_output=True,
+                                 **cfg.capsule_head
+                                 )
+
+
+def _variant_architecture(variant):
+    """Return the architecture settings of a compact variant.
+
+    Args:
+        variant (str): Name of a variant in ``cfg.model_variants``.
+
+    Returns:
+        dict: The settings of ``cfg.capsule_head`` updated with those
+        of the variant, as keyword arguments of :func:`capsnet.gccaps`.
+    """
+    return dict(cfg.capsule_head, **cfg.model_variants[variant])
+
+
+def _inference_server(address, max_batch_size, max_wait, functions):
+    """Create an inference server for the selected models.
+
+    Args:
+        address (tuple): Host and port to listen on.
+        max_batch_size (int): Maximum number of requests in a batch.
+        max_wait (float): Maximum time to wait for a batch to fill up.
+        functions (tuple): The prediction, preprocessing and
+            postprocessing functions returned by
+            :func:`_inference_functions`.
+
+    Returns:
+        server.InferenceServer: The inference server.
+    """
+    import server
+
+    predict_fn, preprocess_fn, postprocess_fn = functions
+    batcher = server.MicroBatcher(predict_fn, max_batch_size, max_wait)
+    return server.InferenceServer(address, batcher, preprocess_fn,
+                                  postprocess_fn)
+
+
+def _inference_functions(folded=False, swa=False):
+    """Load the selected models and create the functions of a server.
+
+    Args:
+        folded (bool): Whether to use the inference-optimized models
+            created by :func:`export`.
+        swa (bool): Whether to use the single model created by
+            :func:`average` instead of the ensemble.
+
+    Returns:
+        tuple: The functions that compute predictions for a batch,
+        convert a request body into an input example, and convert the
+        predictions for an example into a response (see
+        :class:`server.InferenceServer`).
+    """
+    from keras import backend as K
+
+    import capsnet
+    import features
+    import inference
+
+    extractor = features.LogmelExtractor(sample_rate=cfg.sample_rate,
+                                         n_window=cfg.n_window,
+                                         hop_length=cfg.hop_length,
+                                         n_mels=cfg.n_mels,
+                                         )
+    with open(cfg.scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+
+    # Predictions are computed in a worker thread, so the graph must
+    # be finalized and made the default in that thread.
+    model = _load_ensemble(folded, swa)
+    model._make_predict_function()
+    graph = K.get_session().graph
+
+    def _predict(x):
+        with graph.as_default():
+            return capsnet.gccaps_predict(x, model, batch_size=len(x))
+
+    def _preprocess(payload):
+        if 'logmel' in payload:
+            x = np.array(payload['logmel'], dtype=np.float32)
+        else:
+            x = extractor.extract(np.array(payload['audio'], np.float32),
+                                  payload['sample_rate'])
+
+        if x.ndim != 2 or x.shape[1] != cfg.n_mels:
+            raise ValueError('Expected a 2D array with %d columns'
+                             % cfg.n_mels)
+
+        x = utils.pad_truncate(x, _input_shape()[0])
+        return _standardize(x, scaler)
+
+    at_threshold = _determine_threshold(cfg.at_threshold)
+    sed_threshold = _determine_threshold(cfg.sed_threshold)
+    resolution = cfg.clip_duration / model.output_shape[1][1]
+
+    def _postprocess(preds):
+        at_pred, sed_pred = preds
+        labels = inference.binarize_predictions_2d(at_pred[None],
+                                                   at_threshold)[0]
+        y_pred_b = inference.binarize_predictions_3d(
+            sed_pred[None], threshold=sed_threshold,
+            n_dilation=cfg.sed_dilation, n_erosion=cfg.sed_erosion)
+        events = inference.generate_event_lists(y_pred_b, resolution)[0]
+
+        return {'tags': [utils.LABELS[i] for i in np.flatnonzero(labels)],
+                'probabilities': dict(zip(utils.LABELS,
+                                          at_pred.tolist())),
+                'events': [[label, float(onset), float(offset)]
+                           for label, onset, offset in events],
+                }
+
+    return _predict, _preprocess, _postprocess
+
+
+def _activity_detector():
+    """Create an activity detector for skipping silent windows.
+
+    Returns:
+        activity.ActivityDetector: The activity detector.
+    """
+    import activity
+
+    return activity.ActivityDetector(
+        energy_margin=cfg.activity_energy_margin,
+        flux_threshold=cfg.activity_flux_threshold,
+        floor_rise=cfg.activity_floor_rise,
+    )
+
+
+def _prediction_batch_size(model, input_shape):
+    """Return the batch size to use when predicting with a model.
+
+    Args:
+        model: Keras model used to generate predictions.
+        input_shape (tuple): Shape of the input examples to predict.
+
+    Returns:
+        int: ``cfg.prediction_batch_size``, or the tuned batch size if
+        this is -1 (see :func:`tune`).
+    """
+    import batch_tuning
+
+    if cfg.prediction_batch_size > 0:
+        return cfg.prediction_batch_size
+
+    return batch_tuning.lookup(cfg.batch_size_cache_path, model,
+                               input_shape)
+
+
+def _model_registry():
+    """Return the model registry, creating it if necessary.
+
+    Returns:
+        registry.ModelRegistry: The model registry.
+    """
+    global _registry
 
-    from capsules import CapsuleLayer
-    from gated_conv import GatedConv
+    if _registry is None:
+        import registry
 
-    model_path = glob.glob(os.path.join(
-        cfg.model_path, '*.%.02d*.hdf5' % epoch))[0]
+        _registry = registry.ModelRegistry(capacity=cfg.n_warm_models)
 
-    custom_objects = {
-        'GatedConv': GatedConv,
-        'CapsuleLayer': CapsuleLayer,
-    }
+    return _registry
 
-    return keras.models.load_model(model_path, custom_objects)
+
+def _print_registry_stats():
+    """Print the load-time metrics of the model registry."""
+    stats = _model_registry().stats
+    print('Model registry: %d hit(s), %d miss(es), %d eviction(s), '
+          '%d graph build(s) in %f seconds, weights loaded in %f seconds'
+          % (stats['hits'], stats['misses'], stats['evictions'],
+             stats['builds'], stats['build_time'], stats['load_time']))
+
+
+def _input_shape():
+    """Return the shape of a (standardized) feature vector.
+
+    Returns:
+        tuple: The input shape of the model, excluding the batch axis.
+
+    See Also:
+        :meth:`features.LogmelExtractor.output_shape`
+    """
+    n_samples = cfg.clip_duration * cfg.sample_rate
+    n_frames = (n_samples - cfg.n_window) // cfg.hop_length + 1
+    return (n_frames, cfg.n_mels)
+
+
+def _export_model_path(epoch):
+    """Return the path of the inference-optimized model for an epoch.
+
+    Args:
+        epoch (int): Epoch number of the model.
+
+    Returns:
+        str: Path of the exported model file.
+    """
+    return os.path.join(cfg.export_path, 'gccaps.%.02d.folded.hdf5' % epoch)
+
+
+def _numpy_model_path(epoch, quantized=False):
+    """Return the path of the NumPy inference model for an epoch.
+
+    Args:
+        epoch (int): Epoch number of the model.
+        quantized (bool): Whether to return the path of the model
+            created by :func:`quantize` instead.
+
+    Returns:
+        str: Path of the exported model file.
+
+    See Also:
+        :mod:`numpy_inference`
+    """
+    suffix = '.int8' if quantized else ''
+    return os.path.join(cfg.export_path,
+                        'gccaps.%.02d%s.npz' % (epoch, suffix))
+
+
+def _swa_model_path():
+    """Return the path of the model created by :func:`average`.
+
+    Returns:
+        str: Path of the averaged model file.
+    """
+    return os.path.join(cfg.model_path, 'gccaps.swa.hdf5')
 
 
 if __name__ == '__main__':
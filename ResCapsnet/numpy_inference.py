@@ -0,0 +1,438 @@
+"""Inference engine for GCCaps models that only depends on NumPy.
+
+A trained Keras model is first converted using :func:`export_model`,
+which requires Keras. The resulting file can then be loaded using
+:func:`load_model` and evaluated on the CPU without importing Keras or
+TensorFlow.
+"""
+
+import json
+
+import numpy as np
+
+
+EPSILON = 1e-7
+"""float: Fuzz factor used by Keras (see ``keras.backend.epsilon``)."""
+
+
+def export_model(model, output_path):
+    """Export a Keras model of GCCaps architecture to a NumPy file.
+
+    The graph of the model is serialized in JSON format, and the weights
+    of each layer are stored as separate arrays.
+
+    Args:
+        model: Keras model to export.
+        output_path (str): Path of the output ``.npz`` file.
+    """
+    # Map each output tensor to the layer that produced it
+    producers = {layer.output.name: layer.name for layer in model.layers}
+
+    def _inbound(layer):
+        inputs = layer.input if isinstance(layer.input, list) \
+            else [layer.input]
+        return [producers[tensor.name] for tensor in inputs
+                if tensor.name in producers and producers[tensor.name]
+                != layer.name]
+
+    graph = {'layers': [], 'outputs': [producers[tensor.name]
+                                       for tensor in model.outputs]}
+    arrays = {}
+    for layer in model.layers:
+        spec = _layer_spec(layer)
+        spec['name'] = layer.name
+        spec['inbound'] = _inbound(layer)
+        graph['layers'].append(spec)
+
+        for i, weights in enumerate(layer.get_weights()):
+            arrays['%s/%d' % (layer.name, i)] = weights
+
+    arrays['graph'] = np.array(json.dumps(graph))
+    np.savez(output_path, **arrays)
+
+
+def load_model(path, quantize_activations=False):
+    """Load a model that was exported using :func:`export_model`.
+
+    Weights that were quantized using :func:`quantization.quantize_model`
+    are dequantized to 32-bit floating point when they are loaded, as
+    NumPy has no fast 8-bit integer kernels. A quantized model therefore
+    uses as much memory and computation at run time as the original
+    model; only its file is smaller.
+
+    Args:
+        path (str): Path of the ``.npz`` file.
+        quantize_activations (bool): Whether to round the inputs of
+            layers for which calibrated activation scales are available
+            to the values representable in 8-bit integers. This only
+            simulates integer inputs, to measure the effect on the
+            scores, and makes prediction slower rather than faster.
+
+    Returns:
+        NumpyModel: The loaded model.
+    """
+    with np.load(path) as f:
+        graph = json.loads(str(f['graph']))
+
+        weights = {}
+        for key in f.files:
+            if key == 'graph' or key.endswith('/scale'):
+                continue
+
+            weights[key] = f[key].astype(np.float32)
+            if key + '/scale' in f.files:
+                weights[key] *= f[key + '/scale']
+
+    if not quantize_activations:
+        graph.pop('activation_scales', None)
+
+    return NumpyModel(graph, weights)
+
+
+def gccaps_predict(x, model, batch_size=32):
+    """Generate output predictions for the given input examples.
+
+    This is the NumPy equivalent of :func:`capsnet.gccaps_predict`.
+
+    Args:
+        x (np.ndarray): Array of input examples.
+        model (NumpyModel): Model of GCCaps architecture with both audio
+            tagging and localization outputs.
+        batch_size (int): Number of examples in a mini-batch.
+
+    Returns:
+        tuple: A tuple containing the audio tagging predictions and
+        SED predictions.
+    """
+    at_preds, sed_preds = model.predict(x, batch_size=batch_size)
+
+    # Transpose so that final dimension is the time axis
+    return at_preds, np.transpose(sed_preds, (0, 2, 1))
+
+
+class NumpyModel(object):
+    """A model that evaluates an exported Keras graph using NumPy.
+
+    Args:
+        graph (dict): Serialized graph of the model.
+        weights (dict): Mapping from ``'<layer name>/<index>'`` to the
+            corresponding weight array.
+
+    Attributes:
+        layers (list): Specification of each layer in topological order.
+        outputs (list): Names of the output layers.
+        activation_scales (dict): Mapping from layer names to the scale
+            used to quantize the input of the layer to 8-bit integers.
+            Layers that are not included are evaluated in full precision.
+    """
+
+    def __init__(self, graph, weights):
+        self.layers = graph['layers']
+        self.outputs = graph['outputs']
+        self.activation_scales = graph.get('activation_scales', {})
+
+        self._weights = {}
+        for layer in self.layers:
+            name = layer['name']
+            self._weights[name] = [weights['%s/%d' % (name, i)]
+                                   for i in range(layer['n_weights'])]
+
+    def predict(self, x, batch_size=32, observer=None):
+        """Compute the outputs of the model for the given inputs.
+
+        Args:
+            x (np.ndarray): Array of input examples.
+            batch_size (int): Number of examples in a mini-batch.
+            observer: Optional function that is called with the name and
+                input arrays of each layer before it is evaluated.
+
+        Returns:
+            list: The output arrays, one for each model output.
+        """
+        outputs = [self._forward(x[i:i + batch_size].astype(np.float32),
+                                 observer)
+                   for i in range(0, len(x), batch_size)]
+        return [np.concatenate(output) for output in zip(*outputs)]
+
+    def _forward(self, x, observer=None):
+        """Compute the outputs of the model for a single mini-batch.
+
+        Args:
+            x (np.ndarray): Mini-batch of input examples.
+            observer: Optional function that is called with the name and
+                input arrays of each layer before it is evaluated.
+
+        Returns:
+            list: The output arrays, one for each model output.
+        """
+        tensors = {}
+        for layer in self.layers:
+            name = layer['name']
+            inputs = [tensors[inbound] for inbound in layer['inbound']] or [x]
+
+            if observer:
+                observer(name, inputs)
+            if name in self.activation_scales:
+                inputs = [_fake_quantize(inputs[0],
+                                         self.activation_scales[name])]
+
+            tensors[name] = _apply(layer, self._weights[name], inputs)
+
+        return [tensors[name] for name in self.outputs]
+
+
+def _layer_spec(layer):
+    """Return the information needed to evaluate a Keras layer.
+
+    Args:
+        layer: Keras layer to describe.
+
+    Returns:
+        dict: Specification of the layer.
+
+    Raises:
+        ValueError: If the layer type is not supported.
+    """
+    class_name = type(layer).__name__
+    config = layer.get_config()
+    spec = {'class_name': class_name, 'n_weights': len(layer.get_weights())}
+
+    if class_name == 'TimeDistributed':
+        inner_spec = _layer_spec(layer.layer)
+        inner_spec['class_name'] = 'TimeDistributed' \
+            + inner_spec['class_name']
+        inner_spec['n_weights'] = spec['n_weights']
+        return inner_spec
+    elif class_name == 'Reshape':
+        spec['target_shape'] = list(layer.target_shape)
+    elif class_name in ['Conv2D', 'GatedConv']:
+        spec['strides'] = list(layer.strides)
+        spec['padding'] = layer.padding
+        spec['activation'] = config['activation']
+        spec['use_bias'] = layer.use_bias
+        if class_name == 'GatedConv':
+            spec['n_filters'] = layer.n_filters
+            spec['use_output_bias'] = layer.use_output_bias
+    elif class_name == 'BatchNormalization':
+        spec['epsilon'] = layer.epsilon
+    elif class_name == 'Activation':
+        spec['activation'] = config['activation']
+    elif class_name == 'MaxPooling2D':
+        spec['pool_size'] = list(layer.pool_size)
+    elif class_name == 'Lambda':
+        spec['function'] = layer.function.__name__
+    elif class_name == 'Dense':
+        spec['activation'] = config['activation']
+        spec['use_bias'] = layer.use_bias
+    elif class_name == 'CapsuleLayer':
+        spec['routings'] = layer.routings
+        spec['use_bias'] = layer.use_bias
+        spec['use_prediction_bias'] = layer.use_prediction_bias
+    elif class_name not in ['InputLayer', 'Dropout', 'Add']:
+        raise ValueError('Unsupported layer type: %s' % class_name)
+
+    return spec
+
+
+def _apply(spec, weights, inputs):
+    """Evaluate a layer for the given inputs.
+
+    Args:
+        spec (dict): Specification of the layer.
+        weights (list): Weights of the layer.
+        inputs (list): Input arrays of the layer.
+
+    Returns:
+        np.ndarray: The output of the layer.
+    """
+    class_name = spec['class_name']
+    x = inputs[0]
+
+    if class_name in ['InputLayer', 'Dropout']:
+        return x
+    if class_name == 'Reshape':
+        return x.reshape((len(x),) + tuple(spec['target_shape']))
+    if class_name == 'Conv2D':
+        return _activation(_conv2d(x, spec, weights), spec['activation'])
+    if class_name == 'GatedConv':
+        n_filters = spec['n_filters']
+        output = _conv2d(x, spec, weights)
+        output = output[..., :n_filters] * _sigmoid(output[..., n_filters:])
+        if spec['use_output_bias']:
+            output += weights[-1]
+        return output
+    if class_name == 'BatchNormalization':
+        gamma, beta, mean, variance = weights
+        scale = gamma / np.sqrt(variance + spec['epsilon'])
+        return x * scale + (beta - mean * scale)
+    if class_name == 'Activation':
+        return _activation(x, spec['activation'])
+    if class_name == 'Add':
+        return sum(inputs)
+    if class_name == 'MaxPooling2D':
+        return _max_pool2d(x, spec['pool_size'])
+    if class_name == 'Lambda':
+        return _LAMBDAS[spec['function']](*inputs)
+    if class_name in ['Dense', 'TimeDistributedDense']:
+        output = np.dot(x, weights[0])
+        if spec['use_bias']:
+            output += weights[1]
+        return _activation(output, spec['activation'])
+    if class_name == 'TimeDistributedCapsuleLayer':
+        n_examples, n_steps = x.shape[:2]
+        output = capsule_routing(x.reshape((-1,) + x.shape[2:]),
+                                 spec, weights)
+        return output.reshape((n_examples, n_steps) + output.shape[1:])
+
+    raise ValueError('Unsupported layer type: %s' % class_name)
+
+
+def capsule_routing(x, spec, weights):
+    """Apply the transformation and routing of a capsule layer.
+
+    This is the NumPy equivalent of :meth:`capsules.CapsuleLayer.call`.
+
+    Args:
+        x (np.ndarray): Input capsules with shape
+            ``(n_examples, n_input_capsules, dim_input_capsule)``.
+        spec (dict): Specification of the capsule layer.
+        weights (list): Weights of the capsule layer.
+
+    Returns:
+        np.ndarray: Output capsules with shape
+        ``(n_examples, n_capsules, dim_capsule)``.
+    """
+    W = weights[0]
+
+    # Compute prediction vectors: (n_examples, n_capsules,
+    # n_input_capsules, dim_capsule)
+    inputs_hat = np.einsum('bik,jidk->bjid', x, W)
+    biases = iter(weights[1:])
+    if spec['use_bias']:
+        inputs_hat += next(biases)[:, None, None]
+    if spec['use_prediction_bias']:
+        inputs_hat += next(biases)
+
+    b = np.zeros(inputs_hat.shape[:3], dtype=inputs_hat.dtype)
+    for i in range(spec['routings']):
+        c = _softmax(b, axis=1)
+        outputs = squash(np.einsum('bji,bjid->bjd', c, inputs_hat))
+        if i < spec['routings'] - 1:
+            b += np.einsum('bjd,bjid->bji', outputs, inputs_hat)
+
+    return outputs
+
+
+def squash(x, axis=-1):
+    """Apply the squashing nonlinearity (see :func:`capsules.squash`).
+
+    Args:
+        x (np.ndarray): Input array to transform.
+        axis (int): Axis along which squashing is applied.
+
+    Returns:
+        np.ndarray: The resulting output.
+    """
+    s_squared_norm = np.sum(np.square(x), axis, keepdims=True)
+    scale = s_squared_norm / (1 + s_squared_norm) \
+        / np.sqrt(s_squared_norm + EPSILON)
+    return scale * x
+
+
+def _length(x):
+    """Compute the Euclidean lengths of capsules."""
+    return np.sqrt(np.sum(np.square(x), -1))
+
+
+def _merge(caps, att):
+    """Merge frame-level predictions (see :func:`capsnet._merge`)."""
+    att = np.clip(att, EPSILON, 1.)
+    return np.sum(caps * att, axis=1) / np.sum(att, axis=1)
+
+
+def _exp_merge(x):
+    """Merge frame-level predictions (see :func:`capsnet.exp_merge`)."""
+    return np.sum(x * np.exp(x), axis=1) / np.sum(np.exp(x), axis=1)
+
+
+_LAMBDAS = {'squash': squash,
+            'length': _length,
+            '_merge': _merge,
+            'exp_merge': _exp_merge,
+            }
+"""dict: NumPy implementations of the functions used by Lambda layers."""
+
+
+def _conv2d(x, spec, weights):
+    """Apply a 2D convolution using a sum of tensor products.
+
+    Args:
+        x (np.ndarray): Input array with shape ``(N, H, W, C)``.
+        spec (dict): Specification of the convolution layer.
+        weights (list): Kernel and (optionally) bias of the layer.
+
+    Returns:
+        np.ndarray: The output array with shape ``(N, H', W', F)``.
+    """
+    kernel = weights[0]
+    k_h, k_w = kernel.shape[:2]
+    s_h, s_w = spec['strides']
+
+    # Pad input in the same way as TensorFlow
+    if spec['padding'] == 'same':
+        pads = []
+        for size, k, s in zip(x.shape[1:3], (k_h, k_w), (s_h, s_w)):
+            n_out = -(-size // s)
+            total = max((n_out - 1) * s + k - size, 0)
+            pads.append((total // 2, total - total // 2))
+        x = np.pad(x, [(0, 0)] + pads + [(0, 0)], mode='constant')
+
+    n_h = (x.shape[1] - k_h) // s_h + 1
+    n_w = (x.shape[2] - k_w) // s_w + 1
+
+    output = 0
+    for i in range(k_h):
+        for j in range(k_w):
+            patch = x[:, i:i + s_h * (n_h - 1) + 1:s_h,
+                      j:j + s_w * (n_w - 1) + 1:s_w]
+            output = output + np.dot(patch, kernel[i, j])
+
+    if spec['use_bias']:
+        output += weights[1]
+    return output
+
+
+def _max_pool2d(x, pool_size):
+    """Apply 2D max-pooling with non-overlapping windows."""
+    p_h, p_w = pool_size
+    n, h, w, c = x.shape
+    h, w = h // p_h, w // p_w
+    x = x[:, :h * p_h, :w * p_w]
+    return x.reshape((n, h, p_h, w, p_w, c)).max(axis=(2, 4))
+
+
+def _fake_quantize(x, scale):
+    """Round an array to the nearest values representable in int8."""
+    return np.clip(np.round(x / scale), -127, 127) * scale
+
+
+def _activation(x, name):
+    """Apply the named activation function."""
+    if name == 'relu':
+        return np.maximum(x, 0)
+    if name == 'sigmoid':
+        return _sigmoid(x)
+    if name == 'linear':
+        return x
+    raise ValueError('Unsupported activation: %s' % name)
+
+
+def _sigmoid(x):
+    """Compute the logistic sigmoid function."""
+    return 1 / (1 + np.exp(-x))
+
+
+def _softmax(x, axis=-1):
+    """Compute the softmax function along the given axis."""
+    e = np.exp(x - np.max(x, axis=axis, keepdims=True))
+    return e / np.sum(e, axis=axis, keepdims=True)
@@ -0,0 +1,320 @@
+import csv
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from keras import backend as K
+from keras.callbacks import CSVLogger
+from keras.callbacks import EarlyStopping
+from keras.optimizers import Adam
+
+import capsnet
+import checkpointing
+import config as cfg
+import data_generator
+import training
+
+
+def train(tr_x, tr_y, val_x, val_y, n_workers, sync_period=1,
+          n_threads=0, sed_metrics_fn=None):
+    """Train a neural network using several worker processes.
+
+    Each worker process trains its own replica of the model on a
+    separate shard of the training set, which it samples from using a
+    :class:`data_generator.BalancedGenerator` seeded by its rank. Every
+    `sync_period` steps, the weights of the replicas are averaged and
+    sent back to every worker. Each worker keeps its own Adam moment
+    estimates, which are not averaged. With a period of one, each step
+    therefore applies the mean of the Adam updates that the workers
+    compute from their own gradients and moments. This is not the same
+    as a single Adam step on the averaged gradient, because each update
+    is normalized by the moments of one worker.
+
+    An epoch consists of the same number of training examples as in
+    :func:`training.train`, so each worker takes ``1 / n_workers`` as
+    many steps. The averaged model is validated and checkpointed by the
+    calling process at the end of each epoch using the same callbacks
+    as :func:`training.train`, and the logs include the time elapsed
+    since training began, so that the time-to-accuracy of the two can
+    be compared (see :func:`time_to_target`).
+
+    The workers only use the CPU, and the training set is shared with
+    them through memory-mapped files rather than being copied.
+
+    Args:
+        tr_x (np.ndarray): Array of training examples.
+        tr_y (np.ndarray): Target values of the training examples.
+        val_x (np.ndarray): Array of validation examples.
+        val_y (np.ndarray): Target values of the validation examples.
+        n_workers (int): Number of worker processes.
+        sync_period (int): Number of steps between weight averaging.
+        n_threads (int): Number of TensorFlow threads per worker. A
+            value of 0 divides the CPU cores evenly between workers.
+        sed_metrics_fn: Optional function that computes SED metrics for
+            the validation set (see :class:`training.ValidationLogger`).
+
+    Returns:
+        list: The logs of each epoch.
+    """
+    if n_threads == 0:
+        n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+
+    # The calling process holds the averaged model
+    model = _create_model(tr_x.shape[1:], tr_y.shape[1])
+    batch_size = training._validation_batch_size(model, val_x)
+    callbacks = _create_callbacks(val_x, val_y, batch_size, sed_metrics_fn)
+    for callback in callbacks:
+        callback.set_model(model)
+
+    # Split the training set into shards of similar class distribution
+    rng = np.random.RandomState(cfg.initial_seed)
+    shards = [[] for _ in range(n_workers)]
+    for label in range(tr_y.shape[1]):
+        indexes = np.where(tr_y.argmax(axis=1) == label)[0]
+        for rank, shard in enumerate(np.array_split(rng.permutation(indexes),
+                                                    n_workers)):
+            shards[rank].extend(shard)
+    shards = [np.sort(shard) for shard in shards]
+
+    n_epochs = cfg.n_epochs if cfg.n_epochs >= 0 else 10000
+    steps_per_epoch = len(tr_x) // (cfg.batch_size * n_workers)
+    lr = cfg.learning_rate['initial']
+    history = []
+
+    with tempfile.TemporaryDirectory(dir=cfg.work_path) as tmp_dir:
+        # Share the training set with the workers via memory mapping
+        x_path = os.path.join(tmp_dir, 'x.npy')
+        y_path = os.path.join(tmp_dir, 'y.npy')
+        np.save(x_path, tr_x)
+        np.save(y_path, tr_y)
+
+        context = multiprocessing.get_context('spawn')
+        connections = []
+        processes = []
+        for rank in range(n_workers):
+            conn, worker_conn = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(rank, worker_conn, x_path, y_path,
+                      shards[rank], n_threads),
+                daemon=True,
+            )
+            process.start()
+            connections.append(conn)
+            processes.append(process)
+
+        try:
+            model.stop_training = False
+            for callback in callbacks:
+                callback.on_train_begin()
+            train_onset = time.time()
+
+            for epoch in range(n_epochs):
+                if cfg.learning_rate['decay'] < 1.:
+                    lr = training.lr_schedule(epoch, lr)
+
+                epoch_onset = time.time()
+                compute_time = 0.
+                results = []
+                for step in range(0, steps_per_epoch, sync_period):
+                    n_steps = min(sync_period, steps_per_epoch - step)
+                    weights = model.get_weights()
+                    for conn in connections:
+                        conn.send((weights, lr, n_steps))
+                    replies = [conn.recv() for conn in connections]
+
+                    model.set_weights([np.mean(values, axis=0) for values
+                                       in zip(*[r[0] for r in replies])])
+                    for reply in replies:
+                        results.extend(reply[1])
+                    compute_time += max(r[2] for r in replies)
+
+                train_time = time.time() - epoch_onset
+                logs = {'loss': np.mean([loss for loss, _ in results]),
+                        'acc': np.mean([acc for _, acc in results]),
+                        'lr': lr,
+                        'time_compute': compute_time,
+                        'time_sync': train_time - compute_time,
+                        'samples_per_sec': (steps_per_epoch * n_workers
+                                            * cfg.batch_size / train_time),
+                        'steps_per_sec': steps_per_epoch / train_time,
+                        }
+
+                # Update the elapsed time before each callback, as is
+                # done by :class:`instrumentation.TrainingMonitor`
+                for callback in callbacks:
+                    logs['time_elapsed'] = time.time() - train_onset
+                    callback.on_epoch_end(epoch, logs)
+
+                history.append(logs)
+                print('Epoch %d/%d - loss: %.4f - val_f1_score: %.4f - %ds'
+                      % (epoch + 1, n_epochs, logs['loss'],
+                         logs['val_f1_score'], time.time() - epoch_onset))
+
+                if model.stop_training:
+                    break
+
+            for callback in callbacks:
+                callback.on_train_end()
+        finally:
+            for conn in connections:
+                conn.send(None)
+            for process in processes:
+                process.join()
+
+    return history
+
+
+def time_to_target(path, monitor='val_f1_score', target=0.5, mode='max'):
+    """Return when a training run first reached a target score.
+
+    Args:
+        path (str): Path of the CSV history file of the run. It must
+            contain a ``time_elapsed`` column, which is logged by
+            :func:`train` and by :func:`training.train`.
+        monitor (str): Name of the validation metric.
+        target (float): Score to reach.
+        mode (str): Either ``'max'`` or ``'min'``, indicating whether
+            higher or lower values of `monitor` are better.
+
+    Returns:
+        tuple: The epoch number and time elapsed in seconds when the
+        target was first reached, or ``(None, None)`` if it was not,
+        followed by the best score of the run and the mean number of
+        training steps per second (``None`` if not logged).
+    """
+    with open(path, 'r') as f:
+        rows = list(csv.DictReader(f))
+
+    scores = [float(row[monitor]) for row in rows]
+    best = max(scores) if mode == 'max' else min(scores)
+
+    steps_per_sec = None
+    if rows and 'steps_per_sec' in rows[0]:
+        steps_per_sec = np.mean([float(row['steps_per_sec'])
+                                 for row in rows])
+
+    for row, score in zip(rows, scores):
+        if (score >= target) if mode == 'max' else (score <= target):
+            return (int(row['epoch']) + 1, float(row['time_elapsed']),
+                    best, steps_per_sec)
+
+    return None, None, best, steps_per_sec
+
+
+def _create_model(input_shape, n_classes):
+    """Create and compile a model in the same way as
+    :func:`training.train`.
+
+    If random crops are used for training, the number of frames is left
+    unspecified, so that the model accepts both crops and full clips.
+
+    Args:
+        input_shape (tuple): Shape of the input tensor.
+        n_classes (int): Number of classes for classification.
+
+    Returns:
+        The compiled Keras model.
+    """
+    if training.crop_length() is not None:
+        input_shape = (None,) + tuple(input_shape[1:])
+
+    model = capsnet.gccaps(input_shape=input_shape, n_classes=n_classes,
+                           checkpoint=cfg.gradient_checkpointing,
+                           **cfg.capsule_head)
+    model.compile(loss='binary_crossentropy',
+                  optimizer=Adam(lr=cfg.learning_rate['initial']),
+                  metrics=['accuracy'],
+                  )
+    return model
+
+
+def _create_callbacks(val_x, val_y, batch_size=32, sed_metrics_fn=None):
+    """Create the callbacks that are run on the averaged model.
+
+    These are the callbacks of :func:`training._create_callbacks` that
+    do not depend on the training function of the model. Resuming and
+    TensorBoard logs are not supported in this mode.
+
+    Args:
+        val_x (np.ndarray): Array of validation examples.
+        val_y (np.ndarray): Target values of the validation examples.
+        batch_size (int): Number of examples in a prediction batch for
+            the validation callback.
+        sed_metrics_fn: Optional function that computes SED metrics for
+            the validation set.
+
+    Returns:
+        list: List of Keras callbacks.
+    """
+    callbacks = [training.ValidationLogger(val_x, val_y,
+                                           batch_size=batch_size,
+                                           sed_metrics_fn=sed_metrics_fn,
+                                           )]
+
+    path = os.path.join(cfg.model_path,
+                        'gccaps.{epoch:02d}-{val_acc:.4f}.hdf5')
+    callbacks.append(checkpointing.CheckpointManager(
+        filepath=path,
+        monitor=cfg.checkpoint_monitor,
+        mode=cfg.checkpoint_mode,
+        n_best=cfg.n_checkpoints,
+    ))
+
+    callbacks.append(CSVLogger(cfg.history_path))
+
+    if cfg.n_epochs == -1:
+        callbacks.append(EarlyStopping(monitor='val_loss',
+                                       min_delta=0,
+                                       patience=5,
+                                       ))
+
+    return callbacks
+
+
+def _worker(rank, conn, x_path, y_path, subset, n_threads):
+    """Train a replica of the model on request of :func:`train`.
+
+    Each request is a tuple of the weights to start from, the learning
+    rate, and the number of steps to take. The worker replies with the
+    updated weights, the loss and accuracy of each step, and the time
+    spent computing. A request of ``None`` stops the worker.
+
+    Args:
+        rank (int): Index of the worker, used to seed it.
+        conn (multiprocessing.Connection): Connection to the caller.
+        x_path (str): Path of the training examples (``.npy`` file).
+        y_path (str): Path of the target values (``.npy`` file).
+        subset (np.ndarray): Indexes of the examples in this shard.
+        n_threads (int): Number of TensorFlow threads to use.
+    """
+    cfg.visible_devices = ''
+    cfg.intra_op_threads = n_threads
+    cfg.inter_op_threads = 1
+
+    x = np.load(x_path, mmap_mode='r')
+    y = np.load(y_path)
+
+    np.random.seed(cfg.initial_seed + rank)
+    model = _create_model(x.shape[1:], y.shape[1])
+    generator = data_generator.balanced_generator(
+        x, y, cfg.batch_size, subset, crop_length=training.crop_length())
+
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+
+        weights, lr, n_steps = request
+        model.set_weights(weights)
+        K.set_value(model.optimizer.lr, lr)
+
+        onset = time.time()
+        results = [tuple(model.train_on_batch(*next(generator)))
+                   for _ in range(n_steps)]
+        conn.send((model.get_weights(), results, time.time() - onset))
+
+    conn.close()
@@ -0,0 +1,112 @@
+import json
+
+import numpy as np
+
+import numpy_inference
+
+
+CHANNEL_AXES = {'Conv2D': (3,),
+                'GatedConv': (3,),
+                'Dense': (1,),
+                'TimeDistributedDense': (1,),
+                'TimeDistributedCapsuleLayer': (0, 2),
+                }
+"""dict: Axes of the kernel that index output channels for each layer.
+
+Only the kernels of these layer types are quantized. Each output channel
+is quantized using its own scale.
+"""
+
+
+def quantize_model(model_path, x, output_path, percentile=99.99):
+    """Quantize a model exported for the NumPy inference engine.
+
+    The kernel of each convolutional, dense and capsule layer is
+    quantized to 8-bit integers using symmetric per-channel scales.
+    Biases and other small weights remain in 32-bit floating point.
+
+    The model is also calibrated using the given input examples: the
+    inputs of the quantized layers are recorded, and a scale is derived
+    for each layer so that the inputs may be quantized to 8-bit integers
+    too. Whether the activations are quantized is decided when the model
+    is loaded (see :func:`numpy_inference.load_model`).
+
+    The quantized weights reduce the size of the model file. They are
+    dequantized when the model is loaded, so inference is not faster.
+
+    Args:
+        model_path (str): Path of the model file created by
+            :func:`numpy_inference.export_model`.
+        x (np.ndarray): Array of input examples used for calibration.
+        output_path (str): Path of the output ``.npz`` file.
+        percentile (float): Percentile of the absolute input values of
+            a layer that is mapped to the largest integer. Values above
+            this percentile are clipped.
+    """
+    model = numpy_inference.load_model(model_path)
+    with np.load(model_path) as f:
+        arrays = {key: f[key] for key in f.files}
+
+    graph = json.loads(str(arrays['graph']))
+    graph['activation_scales'] = calibrate(model, x, percentile)
+
+    for layer in graph['layers']:
+        axes = CHANNEL_AXES.get(layer['class_name'])
+        if axes is None:
+            continue
+
+        key = '%s/0' % layer['name']
+        arrays[key], arrays[key + '/scale'] = quantize_weights(arrays[key],
+                                                               axes)
+
+    arrays['graph'] = np.array(json.dumps(graph))
+    np.savez(output_path, **arrays)
+
+
+def quantize_weights(weights, channel_axes=(-1,)):
+    """Quantize weights to 8-bit integers using symmetric scales.
+
+    Args:
+        weights (np.ndarray): Weights to quantize.
+        channel_axes (tuple): Axes indexing the channels that are each
+            quantized using their own scale.
+
+    Returns:
+        tuple: The quantized weights and the scales. The original
+        weights are approximately ``quantized * scales``.
+    """
+    channel_axes = [axis % weights.ndim for axis in channel_axes]
+    reduce_axes = tuple(axis for axis in range(weights.ndim)
+                        if axis not in channel_axes)
+
+    max_abs = np.max(np.abs(weights), axis=reduce_axes, keepdims=True)
+    scales = np.where(max_abs > 0, max_abs / 127, 1).astype(np.float32)
+    quantized = np.clip(np.round(weights / scales), -127, 127)
+    return quantized.astype(np.int8), scales
+
+
+def calibrate(model, x, percentile=99.99, batch_size=32):
+    """Compute the scales used to quantize the inputs of layers.
+
+    Args:
+        model (numpy_inference.NumpyModel): Model to calibrate.
+        x (np.ndarray): Array of input examples used for calibration.
+        percentile (float): Percentile of the absolute input values of
+            a layer that is mapped to the largest integer.
+        batch_size (int): Number of examples in a mini-batch.
+
+    Returns:
+        dict: Mapping from layer names to input scales.
+    """
+    names = {layer['name'] for layer in model.layers
+             if layer['class_name'] in CHANNEL_AXES}
+    ranges = {}
+
+    def _observe(name, inputs):
+        if name in names:
+            value = np.percentile(np.abs(inputs[0]), percentile)
+            ranges[name] = max(ranges.get(name, 0), float(value))
+
+    model.predict(x, batch_size=batch_size, observer=_observe)
+
+    return {name: (value / 127 or 1.) for name, value in ranges.items()}
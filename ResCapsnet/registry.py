@@ -0,0 +1,112 @@
+from collections import OrderedDict
+import os.path
+import time
+
+import capsnet
+
+
+class ModelRegistry(object):
+    """A cache of warm GCCaps models with weights loaded from files.
+
+    Deserializing a Keras model file rebuilds and recompiles the entire
+    graph, which is slow compared to loading the weights alone. Instead,
+    the registry builds the graph for an architecture using `builder`
+    and loads the weights of a model file into it.
+
+    Up to `capacity` models are kept in memory. If a model file that is
+    not cached is requested when the registry is full, the least
+    recently used model is evicted. If the evicted model has the same
+    architecture, its graph is reused for the requested model file so
+    that no new graph is built.
+
+    Args:
+        capacity (int): Maximum number of warm models.
+        builder: Function that creates a model given the architecture
+            parameters passed to :meth:`get`.
+
+    Attributes:
+        capacity (int): Maximum number of warm models.
+        builder: Function that creates a model given the architecture
+            parameters passed to :meth:`get`.
+        stats (dict): Load-time metrics. These are the number of cache
+            hits, misses, evictions and graph builds, and the total time
+            spent building graphs and loading weights in seconds.
+
+    Note:
+        Models returned by the registry are shared. Callers that use
+        several models at once, such as an ensemble, must ensure that
+        `capacity` is at least the number of models (see
+        :meth:`reserve`), as otherwise the graph of one model may be
+        reused for another.
+    """
+
+    def __init__(self, capacity=5, builder=capsnet.gccaps):
+        self.capacity = capacity
+        self.builder = builder
+        self.stats = {'hits': 0,
+                      'misses': 0,
+                      'evictions': 0,
+                      'builds': 0,
+                      'build_time': 0.,
+                      'load_time': 0.,
+                      }
+
+        self._models = OrderedDict()
+
+    def get(self, path, **architecture):
+        """Return a model with the weights of the specified file.
+
+        Args:
+            path (str): Path of the model (or weights) file.
+            architecture: Keyword arguments passed to the builder.
+
+        Returns:
+            An instance of a Keras model.
+        """
+        key = tuple(sorted(architecture.items()))
+        mtime = os.path.getmtime(path)
+
+        # Return the cached model if its weights are up to date
+        entry = self._models.pop(path, None)
+        if entry is not None and entry[0] == key and entry[2] == mtime:
+            self.stats['hits'] += 1
+            self._models[path] = entry
+            return entry[1]
+
+        self.stats['misses'] += 1
+
+        # Reuse the graph of an existing model if possible
+        model = None
+        if entry is not None and entry[0] == key:
+            model = entry[1]
+        elif len(self._models) >= self.capacity:
+            _, (evicted_key, evicted_model, _) = self._models.popitem(
+                last=False)
+            self.stats['evictions'] += 1
+            if evicted_key == key:
+                model = evicted_model
+
+        if model is None:
+            onset = time.time()
+            model = self.builder(**architecture)
+            self.stats['builds'] += 1
+            self.stats['build_time'] += time.time() - onset
+
+        onset = time.time()
+        model.load_weights(path)
+        self.stats['load_time'] += time.time() - onset
+
+        self._models[path] = (key, model, mtime)
+        return model
+
+    def reserve(self, n_models):
+        """Ensure that at least `n_models` models can be kept warm.
+
+        Args:
+            n_models (int): Number of models that must be kept warm.
+        """
+        self.capacity = max(self.capacity, n_models)
+
+    def clear(self):
+        """Evict all models from the registry."""
+        self._models.clear()
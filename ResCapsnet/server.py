@@ -0,0 +1,257 @@
+from collections import Counter
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+import json
+import queue
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+
+class MicroBatcher(object):
+    """Queue that groups individual examples into mini-batches.
+
+    Examples are submitted one at a time, typically by concurrent
+    request handlers, and a worker thread groups them into mini-batches.
+    A mini-batch is processed as soon as it contains `max_batch_size`
+    examples, or once `max_wait` seconds have elapsed since its first
+    example was dequeued, whichever happens first. This trades a bounded
+    amount of latency for the throughput of batched forward passes.
+
+    Args:
+        predict_fn: Function that computes predictions for an array of
+            examples. It must return a tuple of arrays whose first
+            dimension is the batch dimension.
+        max_batch_size (int): Maximum number of examples in a batch.
+        max_wait (float): Maximum time to wait for a batch to fill up,
+            in seconds.
+        n_latencies (int): Number of recent latencies to keep for
+            computing percentiles.
+
+    Attributes:
+        predict_fn: Function that computes predictions.
+        max_batch_size (int): Maximum number of examples in a batch.
+        max_wait (float): Maximum time to wait for a batch to fill up.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait=0.01,
+                 n_latencies=10000):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._batch_sizes = Counter()
+        self._latencies = deque(maxlen=n_latencies)
+        self._n_examples = 0
+        self._lock = threading.Lock()
+
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, x):
+        """Queue an example for prediction.
+
+        Args:
+            x (np.ndarray): A single input example.
+
+        Returns:
+            Future: A future whose result is a tuple containing the
+            predictions for the example.
+        """
+        future = Future()
+        self._queue.put((x, future, time.time()))
+        return future
+
+    def metrics(self):
+        """Return the current queue depth, batch sizes and latencies.
+
+        Returns:
+            dict: The number of queued examples, the number of examples
+            processed, a histogram of batch sizes, and the median and
+            99th percentile latencies of recent examples in seconds.
+        """
+        with self._lock:
+            latencies = list(self._latencies) or [np.nan]
+            histogram = dict(self._batch_sizes)
+            n_examples = self._n_examples
+
+        return {'queue_depth': self._queue.qsize(),
+                'n_examples': n_examples,
+                'batch_sizes': {str(k): v for k, v
+                                in sorted(histogram.items())},
+                'latency_p50': float(np.median(latencies)),
+                'latency_p99': float(np.percentile(latencies, 99)),
+                }
+
+    def close(self):
+        """Stop the worker thread once the queued examples are processed.
+
+        Examples must not be submitted after the batcher is closed.
+        """
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        """Form mini-batches and compute their predictions."""
+        closed = False
+        while not closed:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                # Process the current batch before stopping
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+
+            x, futures, onsets = zip(*batch)
+            try:
+                preds = self.predict_fn(np.stack(x))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for i, future in enumerate(futures):
+                future.set_result(tuple(pred[i] for pred in preds))
+
+            now = time.time()
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._latencies.extend(now - onset for onset in onsets)
+                self._n_examples += len(batch)
+
+
+class InferenceServer(ThreadingMixIn, HTTPServer):
+    """HTTP server that serves predictions using a micro-batcher.
+
+    The server handles each connection in a separate thread. The
+    following endpoints are supported:
+
+    * ``POST /predict``: The request body is a JSON object containing
+      either a ``logmel`` 2D array of feature vectors, or an ``audio``
+      array of samples and its ``sample_rate``. The response is the
+      JSON object returned by `postprocess_fn`.
+    * ``GET /metrics``: The response is the JSON object returned by
+      :meth:`MicroBatcher.metrics`.
+
+    Args:
+        address (tuple): Host and port to listen on.
+        batcher (MicroBatcher): Queue used to compute predictions.
+        preprocess_fn: Function that converts the decoded request body
+            into an input example for the model.
+        postprocess_fn: Function that converts the predictions for an
+            example into a JSON-serializable object.
+
+    Attributes:
+        batcher (MicroBatcher): Queue used to compute predictions.
+        preprocess_fn: Function that converts request bodies.
+        postprocess_fn: Function that converts predictions.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, batcher, preprocess_fn, postprocess_fn):
+        super().__init__(address, _RequestHandler)
+
+        self.batcher = batcher
+        self.preprocess_fn = preprocess_fn
+        self.postprocess_fn = postprocess_fn
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Handler for requests sent to an :class:`InferenceServer`."""
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send(200, self.server.batcher.metrics())
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send(404, {'error': 'Not found'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length).decode())
+            x = self.server.preprocess_fn(payload)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        try:
+            preds = self.server.batcher.submit(x).result()
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+            return
+
+        self._send(200, self.server.postprocess_fn(preds))
+
+    def log_message(self, format, *args):
+        # Suppress per-request logging
+        pass
+
+    def _send(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def generate_load(url, payloads, n_requests=1000, concurrency=32):
+    """Send concurrent prediction requests to an inference server.
+
+    Args:
+        url (str): URL of the ``/predict`` endpoint.
+        payloads (list): JSON-serializable request bodies to cycle
+            through.
+        n_requests (int): Total number of requests to send.
+        concurrency (int): Number of requests in flight at once.
+
+    Returns:
+        dict: The number of requests per second, and the median and
+        99th percentile request latencies in seconds.
+    """
+    bodies = [json.dumps(payload).encode() for payload in payloads]
+
+    def _send(i):
+        request = urllib.request.Request(
+            url, data=bodies[i % len(bodies)],
+            headers={'Content-Type': 'application/json'})
+        onset = time.time()
+        with urllib.request.urlopen(request) as response:
+            response.read()
+        return time.time() - onset
+
+    onset = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(_send, range(n_requests)))
+    duration = time.time() - onset
+
+    return {'throughput': n_requests / duration,
+            'latency_p50': np.median(latencies),
+            'latency_p99': np.percentile(latencies, 99),
+            }
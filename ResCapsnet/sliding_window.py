@@ -0,0 +1,118 @@
+import numpy as np
+
+
+def predict(x, predict_fn, window_length, hop_length, batch_size=32,
+            aggregate=np.max, active=None):
+    """Generate predictions for a recording of arbitrary length.
+
+    The feature vectors of the recording are split into overlapping
+    windows of a fixed length, which are then fed to the model in
+    mini-batches. Windows are views of the input array and are only
+    copied a mini-batch at a time, so memory usage is bounded by the
+    batch size rather than the length of the recording. The end of the
+    recording is padded with zeros (i.e. the mean of the standardized
+    features) so that it is covered by a full window.
+
+    The frame-level predictions of overlapping windows are averaged, and
+    the clip-level predictions of the windows are combined using the
+    `aggregate` function.
+
+    If `active` is given, windows that contain no active frames are not
+    fed to the model, and their predictions are taken to be zero. This
+    saves computation for recordings that are mostly silence or steady
+    background noise (see :class:`activity.ActivityDetector`).
+
+    Args:
+        x (np.ndarray): 2D array of (standardized) feature vectors.
+        predict_fn: Function that computes the audio tagging and SED
+            predictions for an array of windows, as returned by
+            :func:`capsnet.gccaps_predict`.
+        window_length (int): Number of feature vectors in a window.
+        hop_length (int): Number of feature vectors between windows.
+            This must be a multiple of the ratio between the number of
+            feature vectors and the number of frame-level predictions.
+        batch_size (int): Number of windows in a mini-batch.
+        aggregate: Function used to combine clip-level predictions. It
+            must accept an `axis` keyword argument.
+        active (np.ndarray): Boolean array indicating which frames are
+            active. If ``None``, all windows are fed to the model.
+
+    Returns:
+        tuple: Tuple containing:
+
+        * **at_pred** (*np.ndarray*): Audio tagging predictions for the
+          entire recording.
+        * **sed_pred** (*np.ndarray*): 2D array of SED predictions in
+          which the final dimension is the time axis.
+        * **ratio** (*int*): Number of feature vectors per frame-level
+          prediction.
+    """
+    n_frames = len(x)
+    n_windows = 1 + int(np.ceil(max(n_frames - window_length, 0)
+                                / hop_length))
+
+    # Pad the input so that the final window is complete
+    padded_length = window_length + (n_windows - 1) * hop_length
+    padding = np.zeros((padded_length - n_frames,) + x.shape[1:], x.dtype)
+    x = np.ascontiguousarray(np.concatenate([x, padding]))
+
+    # Create a view of the input in which each row is a window
+    windows = np.lib.stride_tricks.as_strided(
+        x, shape=(n_windows, window_length) + x.shape[1:],
+        strides=(x.strides[0] * hop_length,) + x.strides,
+        writeable=False,
+    )
+
+    # Determine which windows are fed to the model. The predictions of
+    # the other windows are zero.
+    if active is None:
+        indexes = np.arange(n_windows)
+    else:
+        active = np.concatenate([active, np.zeros(padded_length - n_frames,
+                                                  dtype=bool)])
+        active = np.lib.stride_tricks.as_strided(
+            active, shape=(n_windows, window_length),
+            strides=(active.strides[0] * hop_length, active.strides[0]),
+            writeable=False,
+        )
+        indexes = np.flatnonzero(active.any(axis=1))
+
+    at_pred = sed_sum = None
+    for i in range(0, max(len(indexes), 1), batch_size):
+        batch_indexes = indexes[i:i + batch_size]
+        if len(batch_indexes) > 0:
+            batch_at_pred, batch_sed_pred = predict_fn(windows[batch_indexes])
+        else:
+            # No windows are active, so predict one window only to
+            # determine the shapes of the outputs.
+            batch_indexes = [0]
+            batch_at_pred, batch_sed_pred = [
+                np.zeros_like(pred) for pred in predict_fn(windows[:1])]
+
+        if sed_sum is None:
+            n_steps = batch_sed_pred.shape[-1]
+            ratio = window_length // n_steps
+            if hop_length % ratio:
+                raise ValueError('Hop length must be a multiple of %d'
+                                 % ratio)
+
+            step_hop = hop_length // ratio
+            at_pred = np.zeros((n_windows,) + batch_at_pred.shape[1:])
+            sed_sum = np.zeros((batch_sed_pred.shape[1],
+                                n_steps + (n_windows - 1) * step_hop))
+            sed_count = np.zeros(sed_sum.shape[1])
+            for j in range(n_windows):
+                sed_count[j * step_hop:j * step_hop + n_steps] += 1
+
+        # Accumulate the frame-level predictions of each window
+        at_pred[batch_indexes] = batch_at_pred
+        for j, pred in zip(batch_indexes, batch_sed_pred):
+            onset = j * step_hop
+            sed_sum[:, onset:onset + n_steps] += pred
+
+    # Discard the predictions that only correspond to padding
+    n_valid = int(np.ceil(n_frames / ratio))
+    sed_pred = sed_sum[:, :n_valid] / sed_count[:n_valid]
+    at_pred = aggregate(at_pred, axis=0)
+
+    return at_pred, sed_pred, ratio
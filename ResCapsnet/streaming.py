@@ -0,0 +1,392 @@
+import time
+
+import librosa
+import numpy as np
+import scipy.signal
+
+import inference
+import utils
+
+
+class StreamingLogmel(object):
+    """Incremental feature extractor for logmel representations.
+
+    This is the streaming counterpart of
+    :class:`features.LogmelExtractor`. Audio samples are consumed in
+    chunks of any size, and a logmel feature vector is produced as soon
+    as the samples of a frame are available. Frames are centered and the
+    start of the signal is reflection-padded, as in ``librosa.stft``.
+
+    As the loudest frame of the stream is not known in advance, the
+    reference value of the log nonlinearity is the running maximum
+    rather than the maximum over the whole signal.
+
+    Args:
+        sample_rate (number): Sampling rate of the audio samples.
+        n_window (int): Number of bins in each spectrogram frame.
+        hop_length (int): Number of samples between frames.
+        n_mels (int): Number of Mel bands.
+
+    Attributes:
+        n_window (int): Number of bins in each spectrogram frame.
+        hop_length (int): Number of samples between frames.
+        mel_fb (np.ndarray): Mel filterbank matrix.
+        window (np.ndarray): Window function applied to each frame.
+    """
+
+    def __init__(self,
+                 sample_rate=16000,
+                 n_window=1024,
+                 hop_length=512,
+                 n_mels=64,
+                 ):
+        self.n_window = n_window
+        self.hop_length = hop_length
+
+        self.mel_fb = librosa.filters.mel(sr=sample_rate,
+                                          n_fft=n_window,
+                                          n_mels=n_mels,
+                                          )
+        self.window = scipy.signal.get_window('hann', n_window, fftbins=True)
+
+        self._buffer = np.zeros(0)
+        self._started = False
+        self._ref = 0.
+
+    def process(self, samples):
+        """Consume audio samples and return any new feature vectors.
+
+        Args:
+            samples (np.ndarray): Audio samples at the target rate.
+
+        Returns:
+            np.ndarray: 2D array of new logmel feature vectors.
+        """
+        self._buffer = np.concatenate([self._buffer, samples])
+
+        # Reflection-pad the start of the signal once enough samples
+        # have been received to do so.
+        pad = self.n_window // 2
+        if not self._started:
+            if len(self._buffer) <= pad:
+                return np.empty((0, self.mel_fb.shape[0]))
+            self._buffer = np.concatenate([self._buffer[pad:0:-1],
+                                           self._buffer])
+            self._started = True
+
+        n_frames = (len(self._buffer) - self.n_window) // self.hop_length + 1
+        if n_frames <= 0:
+            return np.empty((0, self.mel_fb.shape[0]))
+
+        frames = np.lib.stride_tricks.as_strided(
+            self._buffer,
+            shape=(n_frames, self.n_window),
+            strides=(self._buffer.strides[0] * self.hop_length,
+                     self._buffer.strides[0]),
+            writeable=False,
+        )
+        spectrum = np.abs(np.fft.rfft(frames * self.window, axis=1))
+        S = np.dot(spectrum, self.mel_fb.T)
+
+        # Discard samples that are no longer needed
+        self._buffer = self._buffer[n_frames * self.hop_length:]
+
+        # Apply log nonlinearity relative to the running maximum
+        self._ref = max(self._ref, S.max())
+        amin = 1e-5
+        return 20 * np.log10(np.maximum(amin, S)) \
+            - 20 * np.log10(max(amin, self._ref))
+
+
+class StreamingDetector(object):
+    """Sound event detector for a stream of audio samples.
+
+    Feature vectors are computed incrementally and kept in a rolling
+    window with the same length as the input of the model. Every
+    `hop_length` feature vectors, the window is scored, and the
+    frame-level predictions of overlapping windows are averaged.
+
+    The predictions are binarized using the same thresholding, dilation
+    and erosion as :func:`inference.binarize_predictions_3d`. Since this
+    requires future predictions, the binarized value of a time step is
+    only decided once the step is old enough, and onsets and offsets are
+    emitted at that point. The delay is chosen so that no event is
+    emitted later than `latency` seconds after it occurs, not including
+    processing time.
+
+    If an `activity` detector is given, windows that contain no active
+    frames are not scored, and their predictions are taken to be zero.
+
+    Args:
+        predict_fn: Function that computes the audio tagging and SED
+            predictions for an array of windows, as returned by
+            :func:`capsnet.gccaps_predict`.
+        frontend (StreamingLogmel): Incremental feature extractor.
+        scaler (StandardScaler): Scaler used for standardization.
+        window_length (int): Number of feature vectors in a window.
+        hop_length (int): Number of feature vectors between windows.
+        ratio (int): Number of feature vectors per time step of the
+            frame-level predictions. `hop_length` must be a multiple
+            of this value.
+        resolution (float): Number of seconds per time step.
+        latency (float): Maximum delay of events in seconds.
+        threshold (float or list): Threshold used for binarization.
+        n_dilation (int): Dilation parameter used for binarization.
+        n_erosion (int): Erosion parameter used for binarization.
+        activity (ActivityDetector): Detector used to skip windows that
+            contain no activity. If ``None``, all windows are scored.
+
+    Attributes:
+        events (list): Events that have been completed, where an event
+            is a ``(label, onset, offset)`` tuple.
+        n_windows (int): Number of windows that have been processed.
+        n_skipped (int): Number of windows that were not scored.
+    """
+
+    def __init__(self, predict_fn, frontend, scaler, window_length,
+                 hop_length, ratio, resolution, latency, threshold=0.5,
+                 n_dilation=1, n_erosion=1, activity=None):
+        if hop_length % ratio:
+            raise ValueError('Hop length must be a multiple of %d' % ratio)
+
+        self.predict_fn = predict_fn
+        self.frontend = frontend
+        self.scaler = scaler
+        self.window_length = window_length
+        self.hop_length = hop_length
+        self.ratio = ratio
+        self.resolution = resolution
+        self.threshold = threshold
+        self.n_dilation = n_dilation
+        self.n_erosion = n_erosion
+        self.activity = activity
+
+        # Steps are decided this long after the stream reaches them,
+        # which must leave enough time for the window to be scored.
+        self.delay = int(latency / resolution) - hop_length // ratio
+        if self.delay < 0:
+            raise ValueError('Latency must be at least the hop duration')
+
+        self.events = []
+        self.n_windows = 0
+        self.n_skipped = 0
+
+        # The window is initially padded with the mean feature vector
+        self._window = np.zeros((window_length, len(frontend.mel_fb)))
+        self._active = np.zeros(window_length, dtype=bool)
+        self._n_frames = 0
+        self._n_pending = 0
+
+        # Accumulated predictions for steps [_base, _base + n)
+        self._base = 0
+        self._sums = None
+        self._counts = None
+
+        self._n_decided = 0
+        self._onsets = {}
+
+    def process(self, samples):
+        """Consume audio samples and return any emitted events.
+
+        Args:
+            samples (np.ndarray): Audio samples at the target rate.
+
+        Returns:
+            list: Emitted onsets and offsets, each represented as a
+            ``(kind, label, time)`` tuple, where `kind` is either
+            ``'onset'`` or ``'offset'``.
+        """
+        x = self.frontend.process(samples)
+        if len(x) == 0:
+            return []
+
+        if self.activity is not None:
+            active = self.activity.process(x)
+        else:
+            active = np.ones(len(x), dtype=bool)
+
+        x = utils.standardize(np.maximum(x, -90.), self.scaler)
+
+        emitted = []
+        for frame, frame_active in zip(x, active):
+            self._window = np.roll(self._window, -1, axis=0)
+            self._window[-1] = frame
+            self._active = np.roll(self._active, -1)
+            self._active[-1] = frame_active
+            self._n_frames += 1
+            self._n_pending += 1
+
+            if self._n_pending == self.hop_length:
+                self._score()
+                emitted += self._decide(self._n_frames // self.ratio
+                                        - self.delay)
+
+        return emitted
+
+    def flush(self):
+        """Decide all remaining steps and close any active events.
+
+        Returns:
+            list: Emitted onsets and offsets (see :meth:`process`).
+        """
+        if self._n_pending > 0:
+            self._score()
+
+        n_steps = int(np.ceil(self._n_frames / self.ratio))
+        emitted = self._decide(n_steps)
+
+        # Close events that are still active at the end of the stream
+        for label, onset in sorted(self._onsets.items()):
+            offset = (n_steps - 1) * self.resolution
+            self.events.append((utils.LABELS[label], onset, offset))
+            emitted.append(('offset', utils.LABELS[label], offset))
+        self._onsets = {}
+
+        return emitted
+
+    def _score(self):
+        """Score the current window and accumulate its predictions."""
+        self._n_pending = 0
+        self.n_windows += 1
+
+        if self._active.any():
+            _, sed_pred = self.predict_fn(self._window[None])
+            sed_pred = sed_pred[0]
+        else:
+            sed_pred = np.zeros((len(utils.LABELS),
+                                 self.window_length // self.ratio))
+            self.n_skipped += 1
+        n_classes, n_steps = sed_pred.shape
+
+        if self._sums is None:
+            self._sums = np.zeros((n_classes, 0))
+            self._counts = np.zeros(0)
+
+        # Determine which steps are covered by the window, ignoring
+        # steps that correspond to the initial padding and steps whose
+        # predictions have been discarded (see :meth:`_decide`). The
+        # latter have already been decided.
+        start = (self._n_frames - self.window_length) // self.ratio
+        if start < self._base:
+            sed_pred = sed_pred[:, self._base - start:]
+            start = self._base
+
+        # Extend the accumulators to cover the window
+        end = start + sed_pred.shape[1] - self._base
+        if end > len(self._counts):
+            n_new = end - len(self._counts)
+            self._sums = np.pad(self._sums, [(0, 0), (0, n_new)],
+                                mode='constant')
+            self._counts = np.pad(self._counts, (0, n_new), mode='constant')
+
+        self._sums[:, start - self._base:end] += sed_pred
+        self._counts[start - self._base:end] += 1
+
+    def _decide(self, n_steps):
+        """Binarize predictions and emit events up to a given step.
+
+        Args:
+            n_steps (int): Number of steps from the start of the stream
+                that should be decided.
+
+        Returns:
+            list: Emitted onsets and offsets (see :meth:`process`).
+        """
+        if self._sums is None:
+            return []
+
+        n_steps = min(n_steps, self._base + len(self._counts))
+        if n_steps <= self._n_decided:
+            return []
+
+        # Binarize all retained predictions, as the dilation and erosion
+        # of the undecided steps depend on their neighbours.
+        y_pred = self._sums / np.maximum(self._counts, 1)
+        y_pred_b = inference.binarize_predictions_3d(
+            y_pred[None], threshold=self.threshold,
+            n_dilation=self.n_dilation, n_erosion=self.n_erosion)[0]
+
+        emitted = []
+        for step in range(self._n_decided, n_steps):
+            for label, value in enumerate(y_pred_b[:, step - self._base]):
+                if value and label not in self._onsets:
+                    self._onsets[label] = step * self.resolution
+                    emitted.append(('onset', utils.LABELS[label],
+                                    self._onsets[label]))
+                elif not value and label in self._onsets:
+                    onset = self._onsets.pop(label)
+                    offset = (step - 1) * self.resolution
+                    self.events.append((utils.LABELS[label], onset, offset))
+                    emitted.append(('offset', utils.LABELS[label], offset))
+
+        self._n_decided = n_steps
+
+        # Discard predictions that are no longer needed as context
+        n_context = self.n_dilation + self.n_erosion + 2
+        n_discard = max(n_steps - n_context - self._base, 0)
+        self._sums = self._sums[:, n_discard:]
+        self._counts = self._counts[n_discard:]
+        self._base += n_discard
+
+        return emitted
+
+
+def replay(path, detector, sample_rate, chunk_duration=0.1):
+    """Replay an audio file through a streaming detector.
+
+    The audio file is fed to the detector in chunks as if it were being
+    captured in real time, but without waiting. The time at which each
+    chunk finishes processing is simulated: it is the time at which the
+    chunk is captured, or the time at which the previous chunk finishes
+    processing if that is later, plus the processing time of the chunk.
+    The latency of an emitted onset or offset is the time at which its
+    chunk finishes processing minus the time at which it occurred.
+
+    Args:
+        path (str): Path of the audio file.
+        detector (StreamingDetector): Detector to evaluate.
+        sample_rate (number): Sampling rate expected by the detector.
+        chunk_duration (float): Duration of each chunk in seconds.
+
+    Returns:
+        tuple: Tuple containing:
+
+        * **emitted** (*list*): Emitted onsets and offsets, each with
+          its latency appended, e.g. ``(kind, label, time, latency)``.
+        * **stats** (*dict*): The real-time factor (processing time
+          divided by audio duration), the latency statistics, the 99th
+          percentile processing time of a chunk, and the fraction of
+          windows that were not scored.
+    """
+    y, _ = librosa.load(path, sr=sample_rate)
+    chunk_size = max(int(chunk_duration * sample_rate), 1)
+
+    emitted = []
+    processing_times = []
+    done = 0.
+    for i in range(0, len(y), chunk_size):
+        chunk = y[i:i + chunk_size]
+
+        onset = time.time()
+        events = detector.process(chunk)
+        if i + chunk_size >= len(y):
+            events += detector.flush()
+        processing_times.append(time.time() - onset)
+
+        # Simulate the time at which processing of the chunk finishes
+        captured = (i + len(chunk)) / sample_rate
+        done = max(done, captured) + processing_times[-1]
+
+        emitted += [event + (done - event[2],) for event in events]
+
+    latencies = [event[-1] for event in emitted] or [np.nan]
+    stats = {'rtf': sum(processing_times) / (len(y) / sample_rate),
+             'latency_mean': np.mean(latencies),
+             'latency_p50': np.median(latencies),
+             'latency_p99': np.percentile(latencies, 99),
+             'latency_max': np.max(latencies),
+             'chunk_time_p99': np.percentile(processing_times, 99),
+             'skipped': detector.n_skipped / max(detector.n_windows, 1),
+             }
+
+    return emitted, stats
@@ -0,0 +1,296 @@
+import csv
+import itertools
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+
+import numpy as np
+
+import config as cfg
+
+
+def expand(spec):
+    """Return the configuration overrides of each run of a sweep.
+
+    The specification is a dict with the following keys:
+
+      * ``name``: Name of the sweep, used to name the runs.
+      * ``parameters``: Mapping from names of configuration values (see
+        :func:`config.override`) to the values to try. For a grid
+        search, each entry is a list of values. For a random search, an
+        entry may also be a dict with ``min`` and ``max`` keys and an
+        optional ``log`` key, which specifies a continuous range.
+      * ``method``: Either ``'grid'`` (default) or ``'random'``.
+      * ``n_runs``: Number of runs of a random search.
+      * ``seed``: Seed of a random search.
+
+    Args:
+        spec (dict): Specification of the sweep.
+
+    Returns:
+        list: A dict of overrides for each run, including a unique
+        ``training_id``.
+    """
+    names = sorted(spec['parameters'])
+    method = spec.get('method', 'grid')
+    if method == 'grid':
+        runs = [dict(zip(names, values)) for values in itertools.product(
+            *[spec['parameters'][name] for name in names])]
+    elif method == 'random':
+        rng = np.random.RandomState(spec.get('seed', cfg.initial_seed))
+        runs = [{name: _sample(spec['parameters'][name], rng)
+                 for name in names}
+                for _ in range(spec['n_runs'])]
+    else:
+        raise ValueError("'method' must be either 'grid' or 'random'")
+
+    for i, overrides in enumerate(runs):
+        overrides['training_id'] = '%s-%02d' % (spec['name'], i + 1)
+    return runs
+
+
+def write_feature_store(path, arrays, sources=(), settings=None):
+    """Write arrays to a directory of ``.npy`` files for memory mapping.
+
+    The paths of the source files and the settings that the arrays were
+    derived with are recorded in the manifest of the store. The arrays
+    are only written if the store does not exist, if it was derived from
+    different source files or settings, or if it is older than any of
+    the source files.
+
+    Args:
+        path (str): Path of the store directory.
+        arrays (dict): Mapping from names to arrays. This may also be a
+            function that returns the mapping, so that the arrays are
+            only computed if they need to be written.
+        sources (list): Paths of the files that the arrays depend on.
+        settings (dict): JSON-serializable description of how the
+            arrays are derived, e.g. the datasets and whether data
+            augmentation is enabled.
+
+    Returns:
+        bool: Whether the arrays were written.
+    """
+    manifest_path = os.path.join(path, 'manifest.json')
+    sources = [os.path.abspath(source) for source in sources]
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        if isinstance(manifest, dict) \
+                and manifest.get('sources') == sources \
+                and manifest.get('settings') == settings \
+                and all(os.path.getmtime(source)
+                        < os.path.getmtime(manifest_path)
+                        for source in sources):
+            return False
+
+        # Mark the store as incomplete until it is rewritten
+        os.remove(manifest_path)
+
+    if callable(arrays):
+        arrays = arrays()
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), array)
+
+    # The manifest is written last to mark the store as complete
+    with open(manifest_path, 'w') as f:
+        json.dump({'arrays': sorted(arrays),
+                   'sources': sources,
+                   'settings': settings,
+                   }, f, indent=2)
+    return True
+
+
+def load_feature_store(path):
+    """Load the arrays of a store written by :func:`write_feature_store`.
+
+    The arrays are memory-mapped, so processes that load the same store
+    share the pages of the files rather than each having a copy.
+
+    Args:
+        path (str): Path of the store directory.
+
+    Returns:
+        dict: Mapping from names to read-only memory-mapped arrays.
+    """
+    with open(os.path.join(path, 'manifest.json'), 'r') as f:
+        names = json.load(f)['arrays']
+
+    return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+            for name in names}
+
+
+def run(runs, store_path, output_path, n_parallel=2, n_threads=0):
+    """Train a model for each run of a sweep in parallel processes.
+
+    At most `n_parallel` runs are trained at a time, each in a new
+    process with its own configuration (see :func:`config.override`)
+    and a bounded number of TensorFlow threads. The output of each run
+    is written to ``output.txt`` in its log directory, and a summary of
+    its results is written to `output_path`.
+
+    Args:
+        runs (list): The overrides of each run (see :func:`expand`).
+        store_path (str): Path of the feature store containing the
+            arrays ``tr_x``, ``tr_y``, ``val_x`` and ``val_y``.
+        output_path (str): Path of the directory for the summaries.
+        n_parallel (int): Maximum number of concurrent runs.
+        n_threads (int): Number of TensorFlow threads per run. A value
+            of 0 divides the CPU cores evenly between concurrent runs.
+
+    Returns:
+        list: The summary of each run (see :func:`_summarize`).
+    """
+    if n_threads == 0:
+        n_threads = max(1, (os.cpu_count() or 1) // n_parallel)
+
+    os.makedirs(output_path, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+    pending = list(runs)
+    active = {}
+    exit_codes = {}
+    while pending or active:
+        while pending and len(active) < n_parallel:
+            overrides = pending.pop(0)
+            process = context.Process(
+                target=_train,
+                args=(overrides, store_path, output_path, n_threads),
+            )
+            process.start()
+            active[process.sentinel] = (process, overrides)
+            print('Started %s' % overrides['training_id'])
+
+        for sentinel in multiprocessing.connection.wait(list(active)):
+            process, overrides = active.pop(sentinel)
+            process.join()
+            exit_codes[overrides['training_id']] = process.exitcode
+            print('Finished %s (exit code %d)'
+                  % (overrides['training_id'], process.exitcode))
+
+    summaries = []
+    for overrides in runs:
+        path = os.path.join(output_path, overrides['training_id'] + '.json')
+        if exit_codes[overrides['training_id']] == 0:
+            with open(path, 'r') as f:
+                summaries.append(json.load(f))
+        else:
+            summaries.append({'training_id': overrides['training_id'],
+                              'overrides': overrides,
+                              'status': 'failed',
+                              })
+
+    return summaries
+
+
+def write_table(summaries, path):
+    """Write the summaries of the runs of a sweep to a CSV file.
+
+    Args:
+        summaries (list): The summaries returned by :func:`run`.
+        path (str): Path of the output file.
+
+    Returns:
+        list: The rows of the table, including the header.
+    """
+    names = sorted({name for summary in summaries
+                    for name in summary['overrides']} - {'training_id'})
+    results = ['status', 'best_epoch', 'best_score', 'time_elapsed',
+               'samples_per_sec']
+    rows = [['training_id'] + names + results]
+    for summary in summaries:
+        rows.append([summary['training_id']]
+                    + [summary['overrides'].get(name, '') for name in names]
+                    + [summary.get(name, '') for name in results])
+
+    with open(path, 'w') as f:
+        csv.writer(f).writerows(rows)
+
+    return rows
+
+
+def _sample(values, rng):
+    """Sample a parameter value for a random search.
+
+    Args:
+        values (list or dict): Either a list of values to choose from,
+            or a dict specifying a range (see :func:`expand`).
+        rng (np.random.RandomState): Random number generator.
+
+    Returns:
+        The sampled value.
+    """
+    if isinstance(values, list):
+        return values[rng.randint(len(values))]
+
+    low, high = values['min'], values['max']
+    if values.get('log', False):
+        return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    return float(rng.uniform(low, high))
+
+
+def _train(overrides, store_path, output_path, n_threads):
+    """Train a model for one run of a sweep.
+
+    This is the target of the processes started by :func:`run`.
+
+    Args:
+        overrides (dict): Configuration overrides of the run.
+        store_path (str): Path of the feature store.
+        output_path (str): Path of the directory for the summary.
+        n_threads (int): Number of TensorFlow threads to use.
+    """
+    cfg.override(**dict({'intra_op_threads': n_threads,
+                         'inter_op_threads': 1,
+                         }, **overrides))
+
+    import training
+    import utils
+
+    os.makedirs(cfg.model_path, exist_ok=True)
+    os.makedirs(cfg.log_path, exist_ok=True)
+    sys.stdout = open(os.path.join(cfg.log_path, 'output.txt'), 'w',
+                      buffering=1)
+
+    store = load_feature_store(store_path)
+
+    np.random.seed(cfg.initial_seed)
+    utils.log_parameters(cfg.training, os.path.join(cfg.model_path,
+                                                    'parameters.json'))
+    training.train(store['tr_x'], store['tr_y'],
+                   store['val_x'], store['val_y'])
+
+    summary = _summarize(cfg.history_path)
+    summary['training_id'] = cfg.training_id
+    summary['overrides'] = overrides
+    with open(os.path.join(output_path, cfg.training_id + '.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+def _summarize(history_path):
+    """Summarize the training history of a run.
+
+    Args:
+        history_path (str): Path of the CSV history file.
+
+    Returns:
+        dict: The best value of ``cfg.checkpoint_monitor`` and its
+        epoch, the total training time, and the mean throughput.
+    """
+    with open(history_path, 'r') as f:
+        rows = list(csv.DictReader(f))
+
+    scores = [float(row[cfg.checkpoint_monitor]) for row in rows]
+    best = int(np.argmax(scores) if cfg.checkpoint_mode == 'max'
+               else np.argmin(scores))
+    return {'status': 'completed',
+            'best_epoch': best + 1,
+            'best_score': scores[best],
+            'time_elapsed': float(rows[-1]['time_elapsed']),
+            'samples_per_sec': float(np.mean([float(row['samples_per_sec'])
+                                              for row in rows])),
+            }
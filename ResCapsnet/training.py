@@ -1,35 +1,67 @@
 import os
+import time
 
+import numpy as np
 from sklearn import metrics
 
+from keras import backend as K
 from keras.callbacks import Callback
 from keras.callbacks import CSVLogger
-from keras.callbacks import EarlyStopping
 from keras.callbacks import LearningRateScheduler
-from keras.callbacks import ModelCheckpoint
 from keras.callbacks import TensorBoard
 from keras.optimizers import Adam
 import keras.utils
 
+import batch_tuning
 import capsnet
+import checkpointing
 import config as cfg
 import data_generator
 import evaluation
 import inference
+import instrumentation
 
 
-def train(tr_x, tr_y, val_x, val_y):
+_POOLING_FACTOR = 8
+"""int: Factor by which the network downsamples the time axis."""
+
+
+def train(tr_x, tr_y, val_x, val_y, sed_metrics_fn=None, resume=False):
     """Train a neural network using the given training set.
 
+    The state of the training run is saved at the end of every epoch
+    (see :class:`checkpointing.TrainingStateSaver`). If `resume` is
+    true, this state is restored and training continues from the last
+    completed epoch. The sequence of mini-batches is then the same as
+    that of an uninterrupted run, but the dropout masks are not, as the
+    random state of TensorFlow cannot be saved.
+
+    The time spent loading data, computing, running callbacks and
+    checkpointing is recorded for each step and epoch (see
+    :class:`instrumentation.TrainingMonitor`).
+
+    If ``cfg.crop_duration`` is set, the network is trained on random
+    crops of the training examples (see :func:`crop_length`), but it is
+    still validated using full clips.
+
     Args:
         tr_x (np.ndarray): Array of training examples.
         tr_y (np.ndarray): Target values of the training examples.
         val_x (np.ndarray): Array of validation examples.
         val_y (np.ndarray): Target values of the validation examples.
+        sed_metrics_fn: Optional function that computes SED metrics for
+            the validation set (see :class:`ValidationLogger`).
+        resume (bool): Whether to resume an interrupted training run.
     """
-    # Create model and print summary
-    model = capsnet.gccaps(input_shape=tr_x.shape[1:],
-                           n_classes=tr_y.shape[1])
+    # Create model and print summary. When training on random crops,
+    # the number of frames is left unspecified so that the validation
+    # set can be evaluated using full clips.
+    crop = crop_length()
+    input_shape = tr_x.shape[1:] if crop is None else (None,) + tr_x.shape[2:]
+    model = capsnet.gccaps(input_shape=input_shape,
+                           n_classes=tr_y.shape[1],
+                           checkpoint=cfg.gradient_checkpointing,
+                           **cfg.capsule_head)
     _print_model_summary(model)
 
     # Use Adam SGD optimizer
@@ -39,100 +71,195 @@ def train(tr_x, tr_y, val_x, val_y):
                   metrics=['accuracy'],
                   )
 
+    # Use class-balancing generator for training data
+    batch_size = cfg.batch_size
+    generator = data_generator.balanced_generator(tr_x, tr_y, batch_size,
+                                                  crop_length=crop)
+
     # Create the appropriate callbacks to use during training
-    callbacks = _create_callbacks()
+    callbacks = _create_callbacks(val_x, val_y, generator,
+                                  _validation_batch_size(model, val_x),
+                                  sed_metrics_fn, resume)
+
+    # Restore the state of an interrupted run if applicable
+    initial_epoch = 0
+    if resume:
+        checkpoint_manager = next(
+            callback for callback in callbacks
+            if isinstance(callback, checkpointing.CheckpointManager))
+        early_stopping = next(
+            (callback for callback in callbacks
+             if isinstance(callback, checkpointing.ResumableEarlyStopping)),
+            None)
+        initial_epoch = checkpointing.load_training_state(
+            cfg.training_state_path, model, generator, checkpoint_manager,
+            early_stopping)
+        _truncate_history(cfg.history_path, initial_epoch)
+        print('Resuming training from epoch %d' % (initial_epoch + 1))
 
     # Set a large value for `n_epochs` if early stopping is used
     n_epochs = cfg.n_epochs
     if n_epochs < 0:
         n_epochs = 10000
 
-    # Train model using class-balancing generator
-    batch_size = cfg.batch_size
-    generator = data_generator.balanced_generator(tr_x, tr_y, batch_size)
+    # Measure the time spent in each part of a training step
+    iterator = instrumentation.TimedIterator(generator)
+    monitor = instrumentation.TrainingMonitor(
+        callbacks, iterator, batch_size,
+        steps_path=cfg.step_timings_path,
+        summary_path=cfg.timing_summary_path,
+        checkpoint_callbacks=[
+            callback for callback in callbacks
+            if isinstance(callback, (checkpointing.CheckpointManager,
+                                     checkpointing.TrainingStateSaver))],
+    )
+
+    # The generator runs on the training thread (workers=0) so that its
+    # saved state matches the mini-batches that have been consumed.
     steps_per_epoch = len(tr_x) // batch_size
-    return model.fit_generator(generator=generator,
+    return model.fit_generator(generator=iterator,
                                steps_per_epoch=steps_per_epoch,
                                epochs=n_epochs,
-                               callbacks=callbacks,
-                               validation_data=(val_x, val_y),
+                               callbacks=[monitor],
+                               workers=0,
                                use_multiprocessing=False,
+                               initial_epoch=initial_epoch,
                                )
 
 
-class EERLogger(Callback):
-    """A callback for computing the equal error rate (EER).
-
-    At the end of each epoch, the EER is computed and logged for the
-    predictions of the validation dataset.
-    """
-    def on_epoch_end(self, epoch, logs=None):
-        """Compute the EER of the validation set predictions."""
-        x, y_true = self.validation_data[:2]
-        y_pred = self.model.predict(x)
-        rate = evaluation.compute_eer(y_true.flatten(), y_pred.flatten())
-
-        # Log the computed value
-        logs = logs or {}
-        logs['val_eer'] = rate
+class ValidationLogger(Callback):
+    """A callback for computing all validation metrics in one pass.
 
+    At the end of each epoch, predictions are generated for the
+    validation set using a single forward pass, which computes the
+    audio tagging and SED outputs together. The following values are
+    then computed from these predictions and logged:
 
-class MAPLogger(Callback):
-    """A callback for computing the mean average precision at k (MAP@k).
+      * ``val_loss``: Binary cross-entropy loss.
+      * ``val_acc``: Binary accuracy.
+      * ``val_f1_score``: Micro-averaged F1 score.
+      * ``val_eer``: Equal error rate.
+      * ``val_map``: Mean average precision at k.
+      * Any SED metrics returned by `sed_metrics_fn`.
+      * ``val_time``: Time taken to compute the above in seconds.
 
-    At the end of each epoch, the MAP is computed and logged for the
-    predictions of the validation dataset. It is assumed that the ground
-    truths are single-label.
+    Keras computes the validation loss and accuracy itself if validation
+    data is passed to ``fit_generator``, so it should be omitted there.
+    This callback should also precede any callbacks that read the logs.
 
     Args:
-        k (int): The maximum number of predicted elements.
+        x (np.ndarray): Array of validation examples.
+        y (np.ndarray): Target values of the validation examples.
+        batch_size (int): Number of examples in a prediction batch.
+        threshold (float): Threshold used to binarize predictions.
+        k (int): The maximum number of predicted elements for MAP@k.
+        sed_metrics_fn: Function that computes a dict of SED metrics
+            given the SED predictions, whose final dimension is the
+            time axis. If ``None``, SED metrics are not computed.
 
     Attributes:
-        k (int): The maximum number of predicted elements.
+        x (np.ndarray): Array of validation examples.
+        y (np.ndarray): Target values of the validation examples.
+        batch_size (int): Number of examples in a prediction batch.
+        threshold (float): Threshold used to binarize predictions.
+        k (int): The maximum number of predicted elements for MAP@k.
+        sed_metrics_fn: Function that computes SED metrics.
     """
-    def __init__(self, k=3):
-        super(MAPLogger, self).__init__()
+    def __init__(self, x, y, batch_size=32, threshold=0.5, k=3,
+                 sed_metrics_fn=None):
+        super(ValidationLogger, self).__init__()
 
+        self.x = x
+        self.y = y
+        self.batch_size = batch_size
+        self.threshold = threshold
         self.k = k
+        self.sed_metrics_fn = sed_metrics_fn
 
     def on_epoch_end(self, epoch, logs=None):
-        """Compute the MAP of the validation set predictions."""
-        x, y_true = self.validation_data[:2]
-        y_pred = self.model.predict(x)
-        map_k = evaluation.compute_map(y_true, y_pred, self.k)
+        """Compute the metrics of the validation set predictions."""
+        onset = time.time()
 
-        # Log the computed value
-        logs = logs or {}
-        logs['val_map'] = map_k
+        y_true = self.y
+        y_pred, sed_pred = capsnet.gccaps_predict(self.x, self.model,
+                                                  self.batch_size)
 
+        # Compute the loss and accuracy in the same way as Keras
+        p = np.clip(y_pred, K.epsilon(), 1 - K.epsilon())
+        loss = -np.mean(y_true * np.log(p) + (1 - y_true) * np.log(1 - p))
+        accuracy = np.mean(np.equal(y_true, np.round(y_pred)))
+
+        y_pred_b = inference.binarize_predictions_2d(y_pred, self.threshold)
+
+        logs = logs if logs is not None else {}
+        logs['val_loss'] = loss
+        logs['val_acc'] = accuracy
+        logs['val_f1_score'] = metrics.f1_score(y_true, y_pred_b,
+                                                average='micro')
+        logs['val_eer'] = evaluation.compute_eer(y_true.flatten(),
+                                                 y_pred.flatten())
+        logs['val_map'] = evaluation.compute_map(y_true, y_pred, self.k)
+        if self.sed_metrics_fn is not None:
+            logs.update(self.sed_metrics_fn(sed_pred))
+
+        logs['val_time'] = time.time() - onset
 
-class F1ScoreLogger(Callback):
-    """A callback for computing the F1 score.
 
-    At the end of each epoch, the F1 score is computed and logged for
-    the predictions of the validation dataset.
+def lr_schedule(epoch, lr):
+    """Return the learning rate for an epoch given the previous one.
+
+    The learning rate is multiplied by ``cfg.learning_rate['decay']``
+    every ``cfg.learning_rate['decay_rate']`` epochs.
 
     Args:
-        threshold (float): Threshold used to binarize predictions.
+        epoch (int): Index of the epoch, starting from zero.
+        lr (float): Learning rate of the previous epoch.
 
-    Attributes:
-        threshold (float): Threshold used to binarize predictions.
+    Returns:
+        float: The learning rate for the epoch.
     """
-    def __init__(self, threshold=0.5):
-        super(F1ScoreLogger, self).__init__()
+    decay = epoch % cfg.learning_rate['decay_rate'] == 0
+    return lr * cfg.learning_rate['decay'] if decay else lr
 
-        self.threshold = threshold
 
-    def on_epoch_end(self, epoch, logs=None):
-        """Compute the F1 score of the validation set predictions."""
-        x, y_true = self.validation_data[:2]
-        y_pred = self.model.predict(x)
-        y_pred_b = inference.binarize_predictions_2d(y_pred, self.threshold)
-        f1_score = metrics.f1_score(y_true, y_pred_b, average='micro')
+def crop_length():
+    """Return the number of frames of the random training crops.
 
-        # Log the computed value
-        logs = logs or {}
-        logs['val_f1_score'] = f1_score
+    The number of frames corresponding to ``cfg.crop_duration`` is
+    rounded down to a multiple of the pooling factor of the network, so
+    that no frames are discarded by the pooling layers.
+
+    Returns:
+        int: The number of frames, or ``None`` if ``cfg.crop_duration``
+        is ``None`` or not shorter than ``cfg.clip_duration``, in which
+        case full clips are used.
+    """
+    if cfg.crop_duration is None or cfg.crop_duration >= cfg.clip_duration:
+        return None
+
+    n_samples = int(cfg.crop_duration * cfg.sample_rate)
+    n_frames = (n_samples - cfg.n_window) // cfg.hop_length + 1
+    return max(n_frames // _POOLING_FACTOR, 1) * _POOLING_FACTOR
+
+
+def _truncate_history(path, n_epochs):
+    """Remove entries of a history file beyond a given number of epochs.
+
+    These entries belong to epochs that were not completed, or whose
+    training state was not saved, before training was interrupted.
+
+    Args:
+        path (str): Path of the CSV history file.
+        n_epochs (int): Number of entries to keep.
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'r') as f:
+        lines = f.readlines()
+
+    with open(path, 'w') as f:
+        f.writelines(lines[:n_epochs + 1])
 
 
 def _print_model_summary(model):
@@ -146,49 +273,94 @@ def _print_model_summary(model):
         keras.utils.print_summary(model, print_fn=lambda s: f.write(s + '\n'))
 
 
-def _create_callbacks():
+def _validation_batch_size(model, x):
+    """Return the batch size used to predict the validation set.
+
+    Args:
+        model: The Keras model being trained.
+        x (np.ndarray): Array of validation examples.
+
+    Returns:
+        int: ``cfg.prediction_batch_size``, or the batch size found by
+        :func:`batch_tuning.tune_batch_size` if this is -1.
+    """
+    if cfg.prediction_batch_size > 0:
+        return cfg.prediction_batch_size
+
+    return batch_tuning.lookup(cfg.batch_size_cache_path, model, x.shape[1:])
+
+
+def _create_callbacks(val_x, val_y, generator, batch_size=32,
+                      sed_metrics_fn=None, resume=False):
     """Create a list of training callbacks.
 
-    Up to four callbacks are included in the list:
-      * A callback for saving models.
+    Up to seven callbacks are included in the list:
+      * A callback for computing validation metrics.
+      * A callback for saving the weights of the best models.
+      * An optional callback for early stopping.
+      * A callback for saving the state needed to resume training.
+      * A callback for logging metrics to a CSV file.
       * A callback for using TensorBoard.
       * An optional callback for learning rate decay.
-      * An optional callback for early stopping.
+
+    Args:
+        val_x (np.ndarray): Array of validation examples.
+        val_y (np.ndarray): Target values of the validation examples.
+        generator (BalancedGenerator): Training data generator.
+        batch_size (int): Number of examples in a prediction batch for
+            the validation callback.
+        sed_metrics_fn: Optional function that computes SED metrics for
+            the validation set (see :class:`ValidationLogger`).
+        resume (bool): Whether an interrupted training run is being
+            resumed, in which case the history file is appended to.
 
     Returns:
         list: List of Keras callbacks.
     """
-    # Create callbacks for computing various metrics and logging them
-    callbacks = [F1ScoreLogger(), EERLogger(), CSVLogger(cfg.history_path)]
-
-    # Create callback to save model after every epoch
+    # Create callback for computing validation metrics. This must come
+    # first, as the other callbacks read the values that it logs.
+    callbacks = [ValidationLogger(val_x, val_y,
+                                  batch_size=batch_size,
+                                  sed_metrics_fn=sed_metrics_fn,
+                                  )]
+
+    # Create callback to save the weights of the best models
     model_path = cfg.model_path
     path = os.path.join(model_path, 'gccaps.{epoch:02d}-{val_acc:.4f}.hdf5')
-    callbacks.append(ModelCheckpoint(filepath=path,
-                                     monitor='val_acc',
-                                     verbose=0,
-                                     save_best_only=False,
-                                     save_weights_only=False,
-                                     mode='auto',
-                                     period=1,
-                                     ))
+    checkpoint_manager = checkpointing.CheckpointManager(
+        filepath=path,
+        monitor=cfg.checkpoint_monitor,
+        mode=cfg.checkpoint_mode,
+        n_best=cfg.n_checkpoints,
+    )
+    callbacks.append(checkpoint_manager)
+
+    early_stopping = None
+    if cfg.n_epochs == -1:
+        # Create callback to use an early stopping condition. This comes
+        # before the state saver so that the saved state is up to date.
+        early_stopping = checkpointing.ResumableEarlyStopping(
+            monitor='val_loss',
+            min_delta=0,
+            patience=5,
+        )
+        callbacks.append(early_stopping)
+
+    # Create callback to save the state needed to resume training. This
+    # comes after the checkpoint manager, whose thread it shares.
+    callbacks.append(checkpointing.TrainingStateSaver(
+        cfg.training_state_path, generator, checkpoint_manager,
+        early_stopping))
+
+    # Create callback for logging metrics. This comes after the above
+    # so that their timings are included (see :func:`train`).
+    callbacks.append(CSVLogger(cfg.history_path, append=resume))
 
     # Create callback for TensorBoard logs
     callbacks.append(TensorBoard(cfg.log_path, batch_size=cfg.batch_size))
 
-    lr_decay = cfg.learning_rate['decay']
-    if lr_decay < 1.:
+    if cfg.learning_rate['decay'] < 1.:
         # Create callback to decay learning rate
-        def _lr_schedule(epoch, lr):
-            decay = epoch % cfg.learning_rate['decay_rate'] == 0
-            return lr * lr_decay if decay else lr
-        callbacks.append(LearningRateScheduler(schedule=_lr_schedule))
-
-    if cfg.n_epochs == -1:
-        # Create callback to use an early stopping condition
-        callbacks.append(EarlyStopping(monitor='val_loss',
-                                       min_delta=0,
-                                       patience=5,
-                                       ))
+        callbacks.append(LearningRateScheduler(schedule=lr_schedule))
 
     return callbacks
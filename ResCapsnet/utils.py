@@ -191,7 +191,7 @@ def write_predictions(names, preds, output_path, write_csv=True):
         write_predictions_to_csv(names, preds, output_path[:-1] + 'csv')
 
 
-def write_predictions_to_csv(names, preds, output_path):
+def write_predictions_to_csv(names, preds, output_path, chunk_size=None):
     """Write classification predictions to a CSV file.
 
     Format of each entry is::
@@ -200,17 +200,46 @@ def write_predictions_to_csv(names, preds, output_path):
 
     Args:
         names (list): Names of the predicted examples.
-        preds (np.ndarray): 2D or 3D array of predictions.
+        preds (np.ndarray): 2D or 3D array of predictions. This may also
+            be an array-like object such as an HDF5 dataset.
         output_path (str): Output file path.
+        chunk_size (int): Number of examples to read from `preds` at a
+            time. If ``None``, all examples are read at once.
     """
-    if len(preds.shape) < 3:
-        preds = np.expand_dims(preds, axis=-1)
+    chunk_size = chunk_size or max(len(names), 1)
 
     with open(output_path, 'w') as f:
         writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
-        for i, name in enumerate(names):
-            for pred in preds[i].T:
-                writer.writerow([name] + pred.tolist())
+        for start in range(0, len(names), chunk_size):
+            chunk = np.asarray(preds[start:start + chunk_size])
+            if chunk.ndim < 3:
+                chunk = np.expand_dims(chunk, axis=-1)
+
+            for name, pred in zip(names[start:start + chunk_size], chunk):
+                for row in pred.T:
+                    writer.writerow([name] + row.tolist())
+
+
+def write_event_lists(names, event_lists, output_path):
+    """Write event lists to a CSV file.
+
+    The format of each entry is the same as that of the metadata files
+    (see :func:`read_metadata`)::
+
+        file_name<tab>onset<tab>offset<tab>label
+
+    Args:
+        names (list): File names of the audio clips.
+        event_lists (list): Event list of each audio clip, where an
+            event is a ``(label, onset, offset)`` tuple.
+        output_path (str): Output file path.
+    """
+    with open(output_path, 'w') as f:
+        writer = csv.writer(f, delimiter='\t')
+        for name, events in zip(names, event_lists):
+            for label, onset, offset in events:
+                writer.writerow([name, '%.3f' % onset, '%.3f' % offset,
+                                 label])
 
 
 def read_training_history(path, ordering=None):